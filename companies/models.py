@@ -21,6 +21,12 @@ class CompanyUser(AbstractUser):
         # New Slug good to go 
         return new_slug 
     
+    def get_pc_namespace(self):
+        # Shared namespace for ALL of our handbooks (PINECONE_NAMESPACE_LAYOUT = 'company')
+        #
+        # company_slug is set once on creation so this doesn't move when the company is renamed
+        return f'company-{self.company_slug}'
+
     def save(self, *args, **kwargs):
         if not self.company_slug: 
             self.company_slug = self.gen_company_slug()
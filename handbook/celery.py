@@ -1,4 +1,5 @@
 from celery import Celery 
+from celery.signals import worker_process_init
 from django.conf import settings
 import os 
 
@@ -17,4 +18,16 @@ celery_app.conf.timezone = "America/New_York"
 celery_app.conf.enable_utc = False 
 
 # Discovering @shared_task
-celery_app.autodiscover_tasks()
\ No newline at end of file
+celery_app.autodiscover_tasks()
+
+@worker_process_init.connect
+def warm_up_services(**kwargs):
+    # Runs in every worker process AFTER the fork so no connection pool is shared between processes
+    if not getattr(settings, 'CELERY_WARM_UP_SERVICES', True):
+        return
+    from handbook_app.services.pinecone_services import warm_up
+    try:
+        warm_up()
+    except Exception as e:
+        # Missing keys/network shouldn't keep the worker from booting, the first task would retry the setup
+        print(f'Service warm-up failed: {e}')
@@ -35,9 +35,103 @@ ALLOWED_HOSTS = []
 # Pinecone Keys
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 PINECONE_INDEX = os.getenv('PINECONE_INDEX')
+# Namespace layout 
+#   - 'handbook': one namespace per handbook (N queries per question)
+#   - 'company': one namespace per company with handbook_id metadata (1 query per question)
+# Use `py manage.py consolidate_namespaces` to move existing handbooks before switching to 'company'
+PINECONE_NAMESPACE_LAYOUT = os.getenv('PINECONE_NAMESPACE_LAYOUT', 'handbook')
+# Vector store backend 
+#   - 'pinecone': our Pinecone index (production)
+#   - 'local': float32 memory-mapped files under LOCAL_VECTOR_ROOT (air-gapped tests + benchmarks)
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'pinecone')
+LOCAL_VECTOR_ROOT = os.getenv('LOCAL_VECTOR_ROOT', os.path.join(BASE_DIR, 'vector_store'))
+# Per-handbook namespace queries run concurrently, bounded by this many threads per question
+PINECONE_QUERY_CONCURRENCY = int(os.getenv('PINECONE_QUERY_CONCURRENCY', 8))
+# Seconds we wait on ALL namespaces before answering with whatever came back (also the timeout of each Pinecone query)
+PINECONE_QUERY_TIMEOUT = float(os.getenv('PINECONE_QUERY_TIMEOUT', 5))
 
 # OpenAI LLM 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# None --> api.openai.com (point this at a local stand-in for benchmarks)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+
+# PDF Extraction 
+# Large PDFs are split into page ranges across a process pool, small ones stay serial 
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 200))
+PDF_MIN_PAGES_PER_RANGE = 16
+
+# Ingestion pipeline (pinecone_services.ingest) 
+# Chunks per embedding request / vectors per upsert request (Pinecone recommends <= 100 per upsert)
+INGEST_EMBED_BATCH = int(os.getenv('INGEST_EMBED_BATCH', 100))
+INGEST_UPSERT_BATCH = int(os.getenv('INGEST_UPSERT_BATCH', 100))
+# Batches in flight per stage + how many embedded upsert batches may wait between the two stages
+INGEST_EMBED_CONCURRENCY = int(os.getenv('INGEST_EMBED_CONCURRENCY', 2))
+INGEST_UPSERT_CONCURRENCY = int(os.getenv('INGEST_UPSERT_CONCURRENCY', 4))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 8))
+# Retries per failed batch (delay doubles every attempt)
+INGEST_MAX_RETRIES = int(os.getenv('INGEST_MAX_RETRIES', 3))
+INGEST_RETRY_DELAY = float(os.getenv('INGEST_RETRY_DELAY', 0.5))
+
+# Bulk ingestion (bulk_ingest command + BulkIngestHandbooks API) 
+# Handbooks embedding + upserting at once and chunks per embedding request
+BULK_INGEST_CONCURRENCY = int(os.getenv('BULK_INGEST_CONCURRENCY', 4))
+BULK_INGEST_EMBED_BATCH = int(os.getenv('BULK_INGEST_EMBED_BATCH', 500))
+
+# Embedding Cache 
+# Roughly 6KB per row with text-embedding-3-small (1536 float32)
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'True') == 'True'
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+
+# Semantic answer cache (AskQuestion) 
+# Reuse an answer when a new question is this similar (cosine) to one we answered for the same handbook versions
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'True') == 'True'
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 2000))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 60 * 60 * 6))   # Seconds
+
+# Query embedding cache (question text --> embedding) 
+# In-process LRU, QUERY_EMBEDDING_CACHE_SHARED also stores them in our Django cache (CACHES) for every worker
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv('QUERY_EMBEDDING_CACHE_ENABLED', 'True') == 'True'
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('QUERY_EMBEDDING_CACHE_MAX_ENTRIES', 10000))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv('QUERY_EMBEDDING_CACHE_TTL', 60 * 60 * 24))   # Seconds
+QUERY_EMBEDDING_CACHE_SHARED = os.getenv('QUERY_EMBEDDING_CACHE_SHARED', 'False') == 'True'
+
+# Question coalescing (single-flight) 
+# Identical questions asked at the same time share ONE answer, QUESTION_COALESCE_SHARED does it across processes (CACHES, sync
+# AskQuestion only: AskQuestionAsync coalesces inside its process)
+QUESTION_COALESCE_ENABLED = os.getenv('QUESTION_COALESCE_ENABLED', 'True') == 'True'
+QUESTION_COALESCE_SHARED = os.getenv('QUESTION_COALESCE_SHARED', 'False') == 'True'
+QUESTION_COALESCE_WAIT = int(os.getenv('QUESTION_COALESCE_WAIT', 30))   # Seconds a follower waits before answering it itself
+QUESTION_COALESCE_RESULT_TTL = int(os.getenv('QUESTION_COALESCE_RESULT_TTL', 5))   # Seconds
+
+# Stage timing (Server-Timing headers + Prometheus text on /api/metrics/) 
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 2048))   # Latest samples per stage used for p50/p95/p99
+# When set, scrapers must send "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# LLM context 
+# Max tokens of handbook text in our prompt (overlapping chunks are merged first, see context_builder)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000))
+
+# FAQ generation 
+# Handbooks generated at once + how many gpt-4o calls per second we allow (shared token bucket)
+FAQ_CONCURRENCY = int(os.getenv('FAQ_CONCURRENCY', 8))
+FAQ_LLM_RATE = float(os.getenv('FAQ_LLM_RATE', 4))
+# Precomputed FAQ answers: AskQuestion returns one when a question is at least this similar (cosine) to the FAQ
+FAQ_ANSWERS_ENABLED = os.getenv('FAQ_ANSWERS_ENABLED', 'True') == 'True'
+FAQ_MATCH_THRESHOLD = float(os.getenv('FAQ_MATCH_THRESHOLD', 0.92))
+# Celery: one task per handbook (see tasks.gen_faq) --> Celery's rate limit is per worker (e.g. '30/m')
+FAQ_TASK_RATE_LIMIT = os.getenv('FAQ_TASK_RATE_LIMIT', '30/m')
+FAQ_TASK_MAX_RETRIES = int(os.getenv('FAQ_TASK_MAX_RETRIES', 5))
+# How long a handbook stays claimed by a run (overlapping beat runs skip claimed handbooks)
+FAQ_CLAIM_TTL = int(os.getenv('FAQ_CLAIM_TTL', 60 * 60))   # Seconds
+# Beat runs are incremental (Watermark) + never overlap (lock held until the run's summary, or FAQ_LOCK_TTL)
+FAQ_DISPATCH_BATCH = int(os.getenv('FAQ_DISPATCH_BATCH', 500))   # Handbooks handed out per run
+FAQ_LOCK_TTL = int(os.getenv('FAQ_LOCK_TTL', 60 * 60 * 2))   # Seconds
+# Only pick up handbooks that changed at least this long ago (transactions still committing could land behind our watermark)
+FAQ_WATERMARK_LAG = int(os.getenv('FAQ_WATERMARK_LAG', 60))   # Seconds
 
 # Application definition
 
@@ -59,6 +153,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First so its total covers every other middleware + the view
+    'handbook_app.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -146,6 +242,8 @@ AUTH_USER_MODEL = 'companies.CompanyUser'
 # Media 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# Our bulk ingestion API only reads directories / manifests from inside this folder
+BULK_INGEST_ROOT = os.getenv('BULK_INGEST_ROOT', os.path.join(BASE_DIR, 'bulk_uploads'))
 
 # Restframework settings
 REST_FRAMEWORK = {
@@ -174,6 +272,34 @@ DJOSER = {
     }
 } 
 
+# Cache 
+# LocMemCache (default) works out of the box but every process has its own copy --> our answer/embedding caches only
+# hold inside ONE process (our FAQ dispatch lock + handbook claims live in the DB, see services/locks.py).
+# Running web + several Celery workers? Opt into a shared one (see README "Running Locally"):
+#   - CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache CACHE_LOCATION=handbook_cache (then: py manage.py createcachetable)
+#   - CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://localhost:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'handbook_cache'),
+    }
+}
+
+# Celery results (our FAQ chord needs a result backend to know when every handbook is done)
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', f'db+sqlite:///{BASE_DIR / "celery_results.sqlite3"}')
+
+# PDF ingestion runs on its own queue --> consumed by a --pool=solo worker (see README "Running Locally")
+# Prefork children are daemon processes which can't start the process pool our PDF extraction uses (PDF_EXTRACT_WORKERS),
+# a solo worker runs the task in its main process so large PDFs are parsed in parallel
+CELERY_INGESTION_QUEUE = os.getenv('CELERY_INGESTION_QUEUE', 'ingestion')
+CELERY_TASK_ROUTES = {
+    'handbook_app.tasks.ingest_handbook': {'queue': CELERY_INGESTION_QUEUE},
+    'handbook_app.tasks.bulk_ingest_handbooks': {'queue': CELERY_INGESTION_QUEUE},
+}
+
+# Build our OpenAI/Pinecone clients + splitter when a worker process starts instead of on its first task
+CELERY_WARM_UP_SERVICES = os.getenv('CELERY_WARM_UP_SERVICES', 'True') == 'True'
+
 # Celery Beat Scheduler 
 # Testing purposes
 from datetime import timedelta
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Handbook
+from .models import Handbook, IngestionJob
 from companies.models import CompanyUser
 
 # Register your models here.
 admin.site.register(Handbook)
+admin.site.register(IngestionJob)
 admin.site.register(CompanyUser)
@@ -0,0 +1,84 @@
+import time
+import tracemalloc
+from django.core.management import BaseCommand
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from handbook_app.services.pdf_services import iter_pages, iter_chunks, extract_pages
+
+# Filler sentence we repeat to build realistic looking handbook pages
+FILLER = "Employees accrue paid time off on a bi-weekly basis and may carry over up to forty hours. "
+
+
+def build_synthetic_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """
+        Builds a synthetic handbook with fitz so we don't need a real PDF on disk
+            - Every page gets a heading + lines of filler text
+    """
+    import fitz
+
+    pdf = fitz.open()
+    for n in range(pages):
+        page = pdf.new_page()
+        body = "\n".join(f"{n}.{line} {FILLER}" for line in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 756), f"Section {n}\n{body}", fontsize=7)
+    data = pdf.tobytes()
+    pdf.close()
+    return data
+
+
+def legacy_chunks(data: bytes, splitter):
+    # The original approach: text += page.get_text() then split one giant string
+    text = ""
+    for page_text in iter_pages(data):
+        text += page_text
+    return splitter.split_text(text)
+
+
+def streaming_chunks(data: bytes, splitter):
+    return iter_chunks(iter_pages(data), splitter)
+
+
+class Command(BaseCommand):
+    help = "Benchmark PDF text extraction on a synthetic PDF (peak memory or parallel throughput)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--pages', type=int, default=1000, help='Number of pages in our synthetic PDF')
+        parser.add_argument('-m', '--mode', choices=['memory', 'throughput'], default='memory', help='What to measure')
+        parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts for throughput mode')
+
+    def measure(self, label, make_chunks, data, splitter):
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = 0
+        # Consume the chunks one by one like ingest() does (we never hold onto them)
+        for _ in make_chunks(data, splitter):
+            count += 1
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f'{label:<10} chunks={count:<6} peak={peak / 1024 / 1024:8.2f} MiB time={elapsed:6.2f}s')
+
+    def throughput(self, data, workers_list):
+        # Writing to disk once so every run (and every worker) reads from the same file
+        import tempfile
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+            tmp.write(data)
+            tmp.flush()
+            for workers in workers_list:
+                start = time.perf_counter()
+                # min_pages=0 so we always go through the pool when workers > 1
+                count = sum(1 for _ in extract_pages(tmp.name, workers=workers, min_pages=0))
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'workers={workers:<3} pages={count:<6} time={elapsed:6.2f}s throughput={count / elapsed:8.1f} pages/s')
+
+    def handle(self, *args, **kwargs):
+        pages = kwargs['pages']
+        self.stdout.write(f'Building a synthetic {pages} page PDF...')
+        data = build_synthetic_pdf(pages)
+
+        if kwargs['mode'] == 'throughput':
+            self.throughput(data, kwargs['workers'])
+            return
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+        self.measure('legacy', legacy_chunks, data, splitter)
+        self.measure('streaming', streaming_chunks, data, splitter)
@@ -0,0 +1,69 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management import BaseCommand
+from handbook_app.services.fanout import query_namespaces
+
+
+class SlowIndex:
+    """
+        Stand-in for our Pinecone index 
+            - query() sleeps for a simulated network round trip then returns random matches 
+            - Same shape as Pinecone's response: {'matches': [{'id', 'score', 'metadata'}]}
+    """
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+
+    def query(self, vector, top_k, namespace, **kwargs):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        return {'matches': [
+            {'id': f'{namespace}-{n}', 'score': random.random(), 'metadata': {'text': f'{namespace} chunk {n}'}}
+            for n in range(top_k)
+        ]}
+
+
+def serial_query(index, vector, namespaces, top_k):
+    # The original question() loop: one namespace after another then sort everything
+    mass_results = []
+    for namespace in namespaces:
+        mass_results.extend(index.query(vector=vector, top_k=top_k, namespace=namespace)['matches'])
+    mass_results.sort(key=lambda m: m['score'], reverse=True)
+    return mass_results[:top_k]
+
+
+class Command(BaseCommand):
+    help = "Benchmark serial vs concurrent namespace fan-out against a simulated-latency index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--namespaces', type=int, nargs='+', default=[1, 5, 10, 20, 40], help='Namespace counts to test')
+        parser.add_argument('-l', '--latency', type=float, default=0.05, help='Mean simulated query latency (seconds)')
+        parser.add_argument('-j', '--jitter', type=float, default=0.01, help='Std deviation of the simulated latency')
+        parser.add_argument('-c', '--concurrency', type=int, default=8, help='Threads in our query pool')
+        parser.add_argument('-r', '--repeat', type=int, default=5, help='Questions per namespace count')
+        parser.add_argument('-k', '--top_k', type=int, default=3)
+
+    def time_it(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples)
+
+    def handle(self, *args, **kwargs):
+        index = SlowIndex(kwargs['latency'], kwargs['jitter'])
+        vector = [0.0] * 1536
+        top_k = kwargs['top_k']
+
+        with ThreadPoolExecutor(max_workers=kwargs['concurrency']) as pool:
+            self.stdout.write(f'{"namespaces":>10} {"serial (ms)":>12} {"concurrent (ms)":>16} {"speedup":>8}')
+            for count in kwargs['namespaces']:
+                namespaces = [f'company-bench-doc-{n}' for n in range(count)]
+                serial = self.time_it(lambda: serial_query(index, vector, namespaces, top_k), kwargs['repeat'])
+                concurrent = self.time_it(
+                    lambda: query_namespaces(index, vector, namespaces, top_k, timeout=60, pool=pool),
+                    kwargs['repeat']
+                )
+                self.stdout.write(f'{count:>10} {serial * 1000:>12.1f} {concurrent * 1000:>16.1f} {serial / concurrent:>7.1f}x')
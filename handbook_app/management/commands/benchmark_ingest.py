@@ -0,0 +1,84 @@
+import random
+import tempfile
+import time
+from itertools import product
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+from handbook_app.management.commands.benchmark_suite import fake_services
+
+# Filler sentence we repeat to build chunk sized text (~800 characters like our splitter)
+FILLER = "Employees accrue paid time off on a bi-weekly basis and may carry over up to forty hours. "
+
+
+class FlakyUpserts:
+    """
+        Wraps our (fake) vector backend so a share of the upsert requests fail
+            - Exercises ingest()'s per batch retries, every retry costs real time in the results
+    """
+    def __init__(self, backend, fail_rate: float):
+        self.backend = backend
+        self.fail_rate = fail_rate
+        self.failures = 0
+
+    def upsert(self, vectors, namespace):
+        if random.random() < self.fail_rate:
+            self.failures += 1
+            raise ConnectionError('Simulated upsert failure')
+        return self.backend.upsert(vectors, namespace)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+class Command(BaseCommand):
+    help = "Benchmark ingest() throughput for embed/upsert batch sizes + concurrency against fake OpenAI/vector services"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--chunks', type=int, default=2000, help='Chunks ingested per configuration')
+        parser.add_argument('--embed_batch', type=int, nargs='+', default=[100], help='Chunks per embedding request')
+        parser.add_argument('--upsert_batch', type=int, nargs='+', default=[100], help='Vectors per upsert request')
+        parser.add_argument('--embed_concurrency', type=int, nargs='+', default=[1, 2, 4], help='Embedding requests in flight')
+        parser.add_argument('--upsert_concurrency', type=int, nargs='+', default=[1, 4, 8], help='Upsert requests in flight')
+        parser.add_argument('--queue_size', type=int, default=8, help='Embedded upsert batches waiting between the stages')
+        parser.add_argument('--embed_latency', type=float, default=0.1, help='Seconds per embedding request')
+        parser.add_argument('--embed_item_latency', type=float, default=0.0005, help='Extra seconds per embedded chunk')
+        parser.add_argument('--vector_latency', type=float, default=0.05, help='Seconds per vector store call')
+        parser.add_argument('--fail_rate', type=float, default=0.0, help='Share of upserts that fail (retried by ingest)')
+
+    def handle(self, *args, **kwargs):
+        chunks = [f'{n} {FILLER * 9}' for n in range(kwargs['chunks'])]
+        overrides = {
+            'VECTOR_BACKEND': 'local',
+            'LOCAL_VECTOR_ROOT': tempfile.mkdtemp(prefix='bench-vectors-'),
+            'EMBEDDING_CACHE_ENABLED': False,
+            'INGEST_QUEUE_SIZE': kwargs['queue_size'],
+            # Retries shouldn't dominate a benchmark
+            'INGEST_RETRY_DELAY': 0.05,
+        }
+
+        with override_settings(**overrides), fake_services(kwargs['embed_latency'], kwargs['embed_item_latency'], 0, kwargs['vector_latency']):
+            from handbook_app.services import pinecone_services
+            backend = pinecone_services._backend = FlakyUpserts(pinecone_services._backend, kwargs['fail_rate'])
+
+            self.stdout.write(
+                f'{"embed_batch":>11} {"upsert_batch":>12} {"embed_conc":>10} {"upsert_conc":>11} '
+                f'{"seconds":>8} {"chunks/s":>9} {"failures":>8}'
+            )
+            configs = product(kwargs['embed_batch'], kwargs['upsert_batch'], kwargs['embed_concurrency'], kwargs['upsert_concurrency'])
+            for run, (embed_batch, upsert_batch, embed_concurrency, upsert_concurrency) in enumerate(configs):
+                backend.failures = 0
+                start = time.perf_counter()
+                stats = pinecone_services.ingest(
+                    chunks,
+                    # Fresh namespace per configuration so nothing is overwritten in place
+                    f'bench-ingest-{run}',
+                    batch_size=embed_batch,
+                    upsert_batch_size=upsert_batch,
+                    embed_concurrency=embed_concurrency,
+                    upsert_concurrency=upsert_concurrency,
+                )
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{embed_batch:>11} {upsert_batch:>12} {embed_concurrency:>10} {upsert_concurrency:>11} '
+                    f'{elapsed:>8.2f} {stats["upserted"] / elapsed:>9.1f} {backend.failures:>8}'
+                )
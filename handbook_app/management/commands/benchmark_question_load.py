@@ -0,0 +1,149 @@
+import asyncio
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand
+
+DIMENSION = 1536
+
+
+def start_openai_stand_in(embed_latency: float, llm_latency: float) -> int:
+    """
+        Tiny aiohttp server pretending to be the OpenAI API (runs on its own thread + event loop)
+            - POST /v1/embeddings --> random vectors after embed_latency
+            - POST /v1/chat/completions --> a canned answer after llm_latency
+
+        Returns the port it's listening on
+    """
+    from aiohttp import web
+
+    rng = np.random.default_rng(0)
+
+    async def embeddings(request):
+        body = await request.json()
+        data = body['input']
+        # A string or one list of tokens is ONE input, otherwise it's a batch
+        count = 1 if isinstance(data, str) or (data and isinstance(data[0], int)) else len(data)
+        await asyncio.sleep(embed_latency)
+        return web.json_response({
+            'object': 'list',
+            'model': body['model'],
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': rng.standard_normal(DIMENSION).tolist()}
+                for i in range(count)
+            ],
+            'usage': {'prompt_tokens': count, 'total_tokens': count},
+        })
+
+    async def chat(request):
+        body = await request.json()
+        await asyncio.sleep(llm_latency)
+        return web.json_response({
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': 'Employees receive 15 PTO days per year.'},
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        })
+
+    ready = threading.Event()
+    port = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_post('/v1/embeddings', embeddings)
+        app.router.add_post('/v1/chat/completions', chat)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        port['value'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return port['value']
+
+
+def summarize(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f'{label:<6} requests={len(latencies):<5} throughput={len(latencies) / elapsed:8.1f} req/s p50={statistics.median(latencies) * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms'
+
+
+class Command(BaseCommand):
+    help = "Load benchmark: sync question() in a thread pool vs async aquestion() on one event loop (local OpenAI stand-in + local vectors)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--requests', type=int, default=200, help='Total questions per path')
+        parser.add_argument('-c', '--concurrency', type=int, default=50, help='Questions in flight at once')
+        parser.add_argument('-t', '--threads', type=int, default=8, help='Threads for the sync path (our sync worker pool)')
+        parser.add_argument('--namespaces', type=int, default=5, help='Handbook namespaces to query per question')
+        parser.add_argument('--embed_latency', type=float, default=0.05)
+        parser.add_argument('--llm_latency', type=float, default=0.5)
+
+    def seed_vectors(self, backend, namespaces):
+        rng = np.random.default_rng(1)
+        for namespace in namespaces:
+            backend.upsert([
+                {'id': f'{namespace}-{n}', 'values': rng.standard_normal(DIMENSION).tolist(), 'metadata': {'text': f'{namespace} chunk {n}'}}
+                for n in range(200)
+            ], namespace)
+
+    def handle(self, *args, **kwargs):
+        port = start_openai_stand_in(kwargs['embed_latency'], kwargs['llm_latency'])
+
+        # Point our service layer at the stand-ins BEFORE its first use (clients + backend are built lazily)
+        settings.OPENAI_BASE_URL = f'http://127.0.0.1:{port}/v1'
+        settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or 'benchmark'
+        settings.VECTOR_BACKEND = 'local'
+        settings.LOCAL_VECTOR_ROOT = tempfile.mkdtemp(prefix='bench-vectors-')
+        settings.PINECONE_QUERY_TIMEOUT = 60
+
+        from handbook_app.services.pinecone_services import question, get_backend
+        from handbook_app.services.async_services import aquestion
+
+        namespaces = [f'company-bench-doc-{n}' for n in range(kwargs['namespaces'])]
+        self.seed_vectors(get_backend(), namespaces)
+        total = kwargs['requests']
+        questions = [f'How many PTO days do I get? #{n}' for n in range(total)]
+
+        # Sync path: a fixed pool of threads (like sync workers), every question blocks its thread
+        def timed_question(q):
+            start = time.perf_counter()
+            question(q, namespaces)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(kwargs['threads'], kwargs['concurrency'])) as pool:
+            sync_latencies = list(pool.map(timed_question, questions))
+        self.stdout.write(summarize('sync', sync_latencies, time.perf_counter() - start))
+
+        # Async path: one event loop, `concurrency` questions in flight
+        async def run_async():
+            limit = asyncio.Semaphore(kwargs['concurrency'])
+
+            async def timed_aquestion(q):
+                async with limit:
+                    start = time.perf_counter()
+                    await aquestion(q, namespaces)
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(timed_aquestion(q) for q in questions))
+            return latencies, time.perf_counter() - start
+
+        async_latencies, elapsed = asyncio.run(run_async())
+        self.stdout.write(summarize('async', async_latencies, elapsed))
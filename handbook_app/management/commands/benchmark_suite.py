@@ -0,0 +1,275 @@
+import hashlib
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from handbook_app.management.commands.benchmark_extraction import build_synthetic_pdf
+
+DIMENSION = 1536
+
+# Questions we cycle through (numbered so every one of them is a new question, no cache could answer it)
+QUESTIONS = [
+    'How many PTO days do I get?',
+    'Can I carry over unused vacation?',
+    'What is the remote work policy?',
+    'Who do I report harassment to?',
+    'When do I get paid?',
+]
+
+
+def fake_vector(text: str) -> list:
+    # Same text --> same unit vector, so a run is repeatable and a question could actually match its chunks
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(DIMENSION)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeEmbeddings:
+    """
+        Stand-in for our LangChain OpenAIEmbeddings (pinecone_services.get_embeddings)
+            - One simulated round trip per call + a per text cost, so batch size still matters
+    """
+    def __init__(self, latency: float, per_item: float):
+        self.latency = latency
+        self.per_item = per_item
+
+    def embed_documents(self, texts: list) -> list:
+        time.sleep(self.latency + self.per_item * len(texts))
+        return [fake_vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+class FakeOpenAI:
+    """
+        Stand-in for our pooled OpenAI client (clients.get_openai_client)
+            - embeddings.create(model, input) --> deterministic vectors
+            - chat.completions.create(...) --> a canned answer after llm_latency
+    """
+    def __init__(self, embed_latency: float, llm_latency: float):
+        self.embed_latency = embed_latency
+        self.llm_latency = llm_latency
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+
+    def _embed(self, model, input, **kwargs):
+        time.sleep(self.embed_latency)
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=fake_vector(text)) for i, text in enumerate(texts)])
+
+    def _chat(self, model, messages, **kwargs):
+        time.sleep(self.llm_latency)
+        message = SimpleNamespace(role='assistant', content='Employees receive 15 PTO days per year.')
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, finish_reason='stop', message=message)])
+
+
+class SlowBackend:
+    """
+        Wraps our LocalBackend with a simulated network round trip per call (Pinecone is never local)
+            - Everything else (ids, filters, scores) is the real local index
+    """
+    def __init__(self, backend, latency: float):
+        self.backend = backend
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+@contextmanager
+def fake_services(embed_latency: float, embed_item_latency: float, llm_latency: float, vector_latency: float):
+    # Swap the module level services pinecone_services + clients hand out, put the real ones back afterwards
+    from handbook_app.services import clients, pinecone_services
+    from handbook_app.services.vector_backends import LocalBackend
+
+    original = (pinecone_services._backend, pinecone_services._embeddings, clients._openai_client)
+    pinecone_services._backend = SlowBackend(LocalBackend(tempfile.mkdtemp(prefix='bench-vectors-')), vector_latency)
+    pinecone_services._embeddings = FakeEmbeddings(embed_latency, embed_item_latency)
+    clients._openai_client = FakeOpenAI(embed_latency, llm_latency)
+    try:
+        yield
+    finally:
+        pinecone_services._backend, pinecone_services._embeddings, clients._openai_client = original
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def stage_totals() -> dict:
+    # Seconds spent per timed() stage since the last registry.clear() (see services/metrics.py)
+    from handbook_app.services.metrics import registry
+    return {stage: round(stats['sum'], 4) for (kind, stage), stats in sorted(registry.snapshot().items()) if kind == 'stage'}
+
+
+class Command(BaseCommand):
+    help = "Offline benchmark: ingest synthetic handbooks + ask questions against fake OpenAI/vector services, results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10, 50, 200], help='Pages per synthetic handbook')
+        parser.add_argument('-q', '--questions', type=int, default=100, help='Questions asked once every handbook is ingested')
+        parser.add_argument('--embed_latency', type=float, default=0.02, help='Seconds per embedding request')
+        parser.add_argument('--embed_item_latency', type=float, default=0.0005, help='Extra seconds per embedded chunk')
+        parser.add_argument('--llm_latency', type=float, default=0.2, help='Seconds per chat completion')
+        parser.add_argument('--vector_latency', type=float, default=0.01, help='Seconds per vector store call')
+        parser.add_argument('--with_caches', action='store_true', help='Keep our embedding/answer/FAQ caches on (off by default)')
+        parser.add_argument('-o', '--output', type=str, help='Write the results as JSON to this file')
+        parser.add_argument('--compare', type=str, help='Earlier JSON results to print the difference against')
+
+    def ingest_handbook(self, company, pages: int) -> dict:
+        from handbook_app.models import Handbook, IngestionJob
+        from handbook_app.services.ingestion_services import run_ingestion
+        from handbook_app.services.metrics import registry
+
+        handbook = Handbook(company=company, namespace=f'bench-{pages}-pages')
+        handbook.pdf_file.save(f'bench-{pages}.pdf', ContentFile(build_synthetic_pdf(pages)), save=False)
+        handbook.save()
+        job = IngestionJob.objects.create(handbook=handbook)
+
+        registry.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            status = run_ingestion(job.id)
+            elapsed = time.perf_counter() - start
+        job.refresh_from_db()
+        if status != IngestionJob.SUCCEEDED:
+            raise RuntimeError(f'Ingesting {pages} pages failed: {job.error}')
+
+        return {
+            'pages': job.pages_parsed,
+            'chunks': job.chunks_total,
+            'seconds': round(elapsed, 4),
+            'pages_per_s': round(job.pages_parsed / elapsed, 2),
+            'chunks_per_s': round(job.chunks_total / elapsed, 2),
+            'queries': len(queries),
+            'stages': stage_totals(),
+        }
+
+    def ask_questions(self, company, count: int) -> dict:
+        from handbook_app.models import Handbook
+        from handbook_app.services.metrics import registry
+        from handbook_app.services.pinecone_services import question
+
+        latencies = []
+        query_counts = []
+        registry.clear()
+        for n in range(count):
+            # The same lookups AskQuestion does per request
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                namespaces, metadata_filter = Handbook.get_query_targets(company)
+                question(f'{QUESTIONS[n % len(QUESTIONS)]} #{n}', namespaces, metadata_filter=metadata_filter, company_id=company.id)
+                latencies.append(time.perf_counter() - start)
+            query_counts.append(len(queries))
+
+        return {
+            'questions': count,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'queries_per_question': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0.0,
+            'stages': stage_totals(),
+        }
+
+    def run(self, kwargs) -> dict:
+        from companies.models import CompanyUser
+
+        company = CompanyUser.objects.create(username='bench', company_name='Benchmark Inc')
+        with fake_services(kwargs['embed_latency'], kwargs['embed_item_latency'], kwargs['llm_latency'], kwargs['vector_latency']):
+            ingest = [self.ingest_handbook(company, pages) for pages in kwargs['sizes']]
+            questions = self.ask_questions(company, kwargs['questions'])
+        return {'ingest': ingest, 'questions': questions}
+
+    def report(self, results: dict):
+        self.stdout.write(f'{"pages":>6} {"chunks":>7} {"seconds":>8} {"pages/s":>9} {"chunks/s":>9} {"queries":>8}')
+        for row in results['ingest']:
+            self.stdout.write(
+                f'{row["pages"]:>6} {row["chunks"]:>7} {row["seconds"]:>8.2f} {row["pages_per_s"]:>9.1f} '
+                f'{row["chunks_per_s"]:>9.1f} {row["queries"]:>8}'
+            )
+        q = results['questions']
+        self.stdout.write(
+            f'questions={q["questions"]} p50={q["p50_ms"]:.1f}ms p95={q["p95_ms"]:.1f}ms p99={q["p99_ms"]:.1f}ms '
+            f'queries/question={q["queries_per_question"]}'
+        )
+
+    def compare(self, results: dict, path: str):
+        # Ratios > 1 mean this run is slower / does more work than the earlier one
+        with open(path) as f:
+            before = json.load(f)
+        self.stdout.write(f'Compared to {path} ({before.get("created", "?")}):')
+        previous = {row['pages']: row for row in before.get('ingest', [])}
+        for row in results['ingest']:
+            old = previous.get(row['pages'])
+            if old:
+                self.stdout.write(
+                    f'  {row["pages"]:>6} pages: time x{row["seconds"] / old["seconds"]:.2f}, '
+                    f'queries {old["queries"]} --> {row["queries"]}'
+                )
+        old_q, q = before.get('questions'), results['questions']
+        if old_q and old_q.get('p50_ms'):
+            self.stdout.write(
+                f'  questions: p50 x{q["p50_ms"] / old_q["p50_ms"]:.2f}, p99 x{q["p99_ms"] / old_q["p99_ms"]:.2f}, '
+                f'queries/question {old_q["queries_per_question"]} --> {q["queries_per_question"]}'
+            )
+
+    def handle(self, *args, **kwargs):
+        caches = kwargs['with_caches']
+        overrides = {
+            # local index so nothing ever builds a Pinecone client (we swap the backend out anyway)
+            'VECTOR_BACKEND': 'local',
+            'LOCAL_VECTOR_ROOT': tempfile.mkdtemp(prefix='bench-vectors-'),
+            'MEDIA_ROOT': tempfile.mkdtemp(prefix='bench-media-'),
+            'OPENAI_API_KEY': 'benchmark',
+            'PINECONE_QUERY_TIMEOUT': 60,
+            'METRICS_ENABLED': True,
+        }
+        if not caches:
+            # Every question + chunk goes through the full pipeline
+            overrides.update({
+                'EMBEDDING_CACHE_ENABLED': False,
+                'QUERY_EMBEDDING_CACHE_ENABLED': False,
+                'ANSWER_CACHE_ENABLED': False,
+                'FAQ_ANSWERS_ENABLED': False,
+            })
+
+        with override_settings(**overrides):
+            # Throwaway database (migrated from scratch) so our synthetic handbooks never land in the real one
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run(kwargs)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'options': {
+                key: kwargs[key] for key in
+                ('sizes', 'questions', 'embed_latency', 'embed_item_latency', 'llm_latency', 'vector_latency', 'with_caches')
+            },
+            **results,
+        }
+        self.report(results)
+        if kwargs.get('compare'):
+            self.compare(results, kwargs['compare'])
+        if kwargs.get('output'):
+            with open(kwargs['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {kwargs["output"]}'))
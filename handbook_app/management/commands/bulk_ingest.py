@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from companies.models import CompanyUser
+from handbook_app.services.bulk_ingestion import discover_pdfs, bulk_ingest
+
+
+class Command(BaseCommand):
+    help = "Ingest a directory (or manifest) of handbook PDFs for one company. Re-run it to resume an interrupted import"
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=str, help='company_slug of the company the handbooks belong to')
+        parser.add_argument('source', type=str, help='Directory of PDFs or a .json/.csv manifest')
+        parser.add_argument('-w', '--workers', type=int, default=settings.PDF_EXTRACT_WORKERS, help='PDF extraction processes')
+        parser.add_argument('-c', '--concurrency', type=int, default=settings.BULK_INGEST_CONCURRENCY, help='Handbooks embedding + upserting at once')
+        parser.add_argument('-b', '--batch_size', type=int, default=settings.BULK_INGEST_EMBED_BATCH, help='Chunks per embedding request')
+        parser.add_argument('-l', '--limit', type=int, help='Only the first N PDFs')
+        parser.add_argument('-r', '--root', type=str, help='Folder every PDF has to be inside (defaults to the source folder / manifest folder)')
+
+    def handle(self, *args, **kwargs):
+        try:
+            company = CompanyUser.objects.get(company_slug=kwargs['company'])
+        except CompanyUser.DoesNotExist:
+            raise CommandError(f'No company with the slug {kwargs["company"]}')
+
+        entries = discover_pdfs(kwargs['source'], kwargs.get('root'))
+        if kwargs.get('limit'):
+            entries = entries[:kwargs['limit']]
+        if not entries:
+            raise CommandError(f'No PDFs found in {kwargs["source"]}')
+
+        summary = bulk_ingest(
+            company, 
+            entries, 
+            workers=kwargs['workers'], 
+            concurrency=kwargs['concurrency'], 
+            batch_size=kwargs['batch_size'], 
+            log=self.stdout.write
+        )
+        for name, error in summary['errors'].items():
+            self.stderr.write(f'{name}: {error}')
+        seconds = summary['seconds'] or 1
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary["succeeded"]}/{summary["handbooks"]} handbooks ingested, {summary["skipped"]} already done, '
+            f'{summary["failed"]} failed in {summary["seconds"]:.1f}s '
+            f'({summary["pages"] / seconds:.1f} pages/s, {summary["chunks"] / seconds:.1f} chunks/s)'
+        ))
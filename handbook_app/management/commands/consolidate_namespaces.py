@@ -0,0 +1,67 @@
+from django.core.management import BaseCommand
+from django.db.models import Value
+from django.db.models.functions import Concat
+from handbook_app.models import Handbook
+from handbook_app.services.pinecone_services import get_backend, list_ids, batched, delete_vector
+
+
+def consolidate_handbook(handbook, batch_size: int, keep_source: bool = False) -> int:
+    """
+        Moves ONE handbook from its own namespace into the shared company namespace 
+            - List the IDs in the old namespace, fetch them in batches (values + metadata) 
+            - Upsert them into the company namespace with our handbook prefix + handbook_id metadata 
+            - Drop the old namespace once everything was copied 
+
+        Upserts are idempotent so re-running after an interruption is safe
+    """
+    source = handbook.get_handbook_namespace()
+    target = handbook.company.get_pc_namespace()
+    # Explicit layout because we're usually running this BEFORE switching PINECONE_NAMESPACE_LAYOUT
+    prefix = handbook.get_vector_prefix(layout='company')
+    metadata = handbook.get_vector_metadata(layout='company')
+
+    moved = 0
+    for ids in batched(sorted(list_ids(source)), batch_size):
+        fetched = get_backend().fetch(ids, source)
+        get_backend().upsert(
+            vectors=[
+                {
+                    # Already prefixed IDs (partially migrated run) keep their ID
+                    'id': vector_id if vector_id.startswith(prefix) else f'{prefix}{vector_id}',
+                    'values': vector['values'],
+                    'metadata': {**vector['metadata'], **metadata}
+                }
+                for vector_id, vector in fetched.items()
+            ],
+            namespace=target
+        )
+        moved += len(fetched)
+
+    # Our chunk manifest has to point at the prefixed IDs from now on
+    handbook.chunks.exclude(vector_id__startswith=prefix).update(vector_id=Concat(Value(prefix), 'vector_id'))
+
+    if moved and not keep_source:
+        delete_vector(source)
+    return moved
+
+
+class Command(BaseCommand):
+    help = "Move per-handbook namespaces into one namespace per company (PINECONE_NAMESPACE_LAYOUT = 'company')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-c', '--company', type=str, help='Only migrate this company (company_slug)')
+        parser.add_argument('-b', '--batch_size', type=int, default=100, help='Vectors fetched + upserted per request')
+        parser.add_argument('--keep_source', action='store_true', help="Don't delete the per-handbook namespaces afterwards")
+
+    def handle(self, *args, **kwargs):
+        handbooks = Handbook.objects.select_related('company').order_by('company_id', 'id')
+        if kwargs.get('company'):
+            handbooks = handbooks.filter(company__company_slug=kwargs['company'])
+
+        total = 0
+        for handbook in handbooks:
+            moved = consolidate_handbook(handbook, kwargs['batch_size'], kwargs['keep_source'])
+            total += moved
+            self.stdout.write(f'{handbook.get_handbook_namespace()} --> {handbook.company.get_pc_namespace()}: {moved} vectors')
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {total} vectors. Set PINECONE_NAMESPACE_LAYOUT=company to start using them.'))
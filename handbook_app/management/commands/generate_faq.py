@@ -1,80 +1,89 @@
-from django.core.management import BaseCommand
-from openai import OpenAI 
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.core.management import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
 from handbook_app.models import Handbook, FAQ
-from handbook_app.services.pinecone_services import get_index
+from handbook_app.services.clients import get_openai_client
+from handbook_app.services.faq_services import build_handbook_faqs, handbooks_without_faq
+from handbook_app.services.rate_limit import TokenBucket
 
-# Helper function to feed OpenAI our prompt
-def generate_faq(ai_client, handbook):
-    """
-        In order to build our context we would need to query all the vectors related to our handbook 
-            - Query via namespace 
+# FAQ rows we collect before writing them with one bulk_create
+FLUSH_ROWS = 500
 
-        Grab the metadata text then transform into string format to feed into prompt 
-    """
-    # Dirty implementation because index.fetch() requires id which we don't know
-    #
-    # The idea here is to fetch vectors relalted to a specific namespace
-    # https://community.pinecone.io/t/is-there-a-way-to-query-all-the-vectors-and-or-metadata-from-a-namespace/797/7
-    dummy_question_vector = [0.0] * 1536
-    res = get_index().query(
-        vector = dummy_question_vector,
-        top_k=10000,
-        include_metadata=True,
-        namespace=handbook.get_pc_namespace()
-    )
 
-    context = "\n\n".join(m['metadata']['text'] for m in res['matches'])
-    prompt = f"""
-        You are an employee at {handbook.company.company_name}.
-        Based on the following handbook content, generate 5 realistic questions 
-        employees might ask (do not answer them):
+def generate_for_handbook(handbook, bucket):
+    # Runs on a pool thread --> Django gives every thread its own DB connection so we close ours when we're done
+    try:
+        # Questions + their precomputed answers and embeddings (unsaved FAQ rows)
+        return build_handbook_faqs(get_openai_client(), handbook, bucket)
+    finally:
+        connection.close()
 
-        {context}
 
-        Separate each question with the "|" character. 
-        Do not include the "|" character inside any question. 
-        Do not add comments, extra whitespaces, or malformed syntax.
-    """
+def positive_rate(value: str) -> float:
+    # 0 (or less) would mean our token bucket never refills
+    rate = float(value)
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f'must be greater than 0 (got {value})')
+    return rate
 
-    # Using OpenAI LLM to generate a response 
-    ai_response = ai_client.chat.completions.create(
-        model='gpt-4o',
-        messages=[{
-            'role': 'user',
-            'content': prompt
-        }],
-        temperature = 0
-    )
-
-    handbook_faq = ai_response.choices[0].message.content.split('|')
-    for q in handbook_faq:
-        faq = FAQ.objects.create(handbook=handbook, question=q.strip())
-
-    
 
 class Command(BaseCommand):
     help = "Generate FQA at midnight"
 
     def add_arguments(self, parser):
         parser.add_argument('-i', '--handbook_id', type=int, help='Handbook ID to generate 5 FQA')
-
+        parser.add_argument('-c', '--concurrency', type=int, default=settings.FAQ_CONCURRENCY, help='Handbooks generated at once')
+        parser.add_argument('-l', '--limit', type=int, help='Only generate for the first N handbooks without FAQ')
+        parser.add_argument('-r', '--rate', type=positive_rate, default=settings.FAQ_LLM_RATE, help='Max gpt-4o calls per second (> 0)')
 
     def handle(self, *args, **kwargs):
-        ai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
         handbook_id = kwargs.get('handbook_id', None)
         if handbook_id:
             # Generating based on a specific handbook
-            specific_handbook = Handbook.objects.get(id=handbook_id)
-            generate_faq(ai_client, specific_handbook)
+            handbooks = Handbook.objects.filter(id=handbook_id).select_related('company')
         else:
-            # NOT OPTIMAL (works but NOT optimal we just want to check for nullity)
-            # # Generating based on handbooks that do not have FAQ 
-            # all_handbooks = Handbook.objects.all()
-            # for handbook in all_handbooks:
-            #     if not handbook.faq_set.count > 0:
-            #         # Handbook doesn't have FAQ let's add
-            #         pass 
-            handbooks_without_faq = Handbook.objects.filter(faq_set__isnull = True)
-            for handbook in handbooks_without_faq:
-                generate_faq(ai_client, handbook)
\ No newline at end of file
+            # Generating based on handbooks that do not have FAQ (one query with a join, no per-handbook count)
+            handbooks = handbooks_without_faq()
+        if kwargs.get('limit'):
+            handbooks = handbooks[:kwargs['limit']]
+        handbooks = list(handbooks)
+
+        try:
+            bucket = TokenBucket(rate=kwargs['rate'])
+        except ValueError as e:
+            # FAQ_LLM_RATE from the environment skips our argument parser
+            raise CommandError(str(e))
+        pending_rows = []
+        created = 0
+        failures = {}
+        start = time.perf_counter()
+
+        # Our threads spend their time waiting on Pinecone + OpenAI so a thread pool overlaps those waits
+        with ThreadPoolExecutor(max_workers=max(1, kwargs['concurrency'])) as pool:
+            futures = {pool.submit(generate_for_handbook, handbook, bucket): handbook for handbook in handbooks}
+            for future in as_completed(futures):
+                handbook = futures[future]
+                try:
+                    pending_rows.extend(future.result())
+                except Exception as e:
+                    # One bad handbook shouldn't stop the rest of the batch
+                    failures[handbook.id] = str(e)
+                    continue
+                if len(pending_rows) >= FLUSH_ROWS:
+                    created += len(FAQ.objects.bulk_create(pending_rows))
+                    pending_rows = []
+
+        if pending_rows:
+            created += len(FAQ.objects.bulk_create(pending_rows))
+
+        elapsed = time.perf_counter() - start
+        succeeded = len(handbooks) - len(failures)
+        for failed_id, error in failures.items():
+            self.stderr.write(f'Handbook {failed_id}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{succeeded}/{len(handbooks)} handbooks, {created} FAQ created, {len(failures)} failed '
+            f'in {elapsed:.1f}s ({len(handbooks) / elapsed if elapsed else 0:.2f} handbooks/s)'
+        ))
@@ -0,0 +1,58 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from handbook_app.services.metrics import registry, request_timings, server_timing_header
+
+"""
+    Server-Timing + request latency 
+        - Every stage timed while serving a request (services/metrics.timed) ends up in the Server-Timing header 
+          so the browser dev tools / curl -v show where a slow question went (embed, vector query, LLM ...) 
+        - Total request time is recorded per view (url name) for our metrics endpoint 
+
+    Works for both sync (WSGI) and async (ASGI) views
+"""
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, timings: dict, start: float):
+        seconds = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        registry.record('request', view, seconds, error=response.status_code >= 500)
+        timings['total'] = seconds
+        response['Server-Timing'] = server_timing_header(timings)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timings = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self._finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timings = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self._finish(request, response, timings, start)
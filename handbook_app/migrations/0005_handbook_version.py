@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0004_embedding_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handbook',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0005_handbook_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HandbookChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector_id', models.CharField(max_length=100)),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('page_start', models.PositiveIntegerField(blank=True, null=True)),
+                ('page_end', models.PositiveIntegerField(blank=True, null=True)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('token_count', models.PositiveIntegerField(default=0)),
+                ('handbook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='handbook_app.handbook')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['handbook', 'chunk_index'], name='handbook_chunk_order')],
+                'constraints': [models.UniqueConstraint(fields=('handbook', 'vector_id'), name='unique_handbook_chunk')],
+            },
+        ),
+    ]
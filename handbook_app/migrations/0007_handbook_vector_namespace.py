@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_vector_namespace(apps, schema_editor):
+    # Existing handbooks were ingested under their name based namespace so that's where their vectors stay
+    #
+    # Same formula as Handbook.generate_pc_namespace (historical models don't have our methods)
+    Handbook = apps.get_model('handbook_app', 'Handbook')
+    for handbook in Handbook.objects.select_related('company').filter(vector_namespace__isnull=True):
+        handbook.vector_namespace = f'company-{slugify(handbook.company.company_name)}-doc-{slugify(handbook.namespace)}'
+        handbook.save(update_fields=['vector_namespace'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0006_handbook_chunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handbook',
+            name='vector_namespace',
+            field=models.CharField(editable=False, max_length=155, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_vector_namespace, migrations.RunPython.noop),
+    ]
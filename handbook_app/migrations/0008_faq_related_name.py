@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0007_handbook_vector_namespace'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='faq',
+            name='handbook',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faqs', to='handbook_app.handbook'),
+        ),
+    ]
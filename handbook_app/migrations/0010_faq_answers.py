@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0009_faq_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faq',
+            name='answer',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='faq',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
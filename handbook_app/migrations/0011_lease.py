@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handbook_app', '0010_faq_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('token', models.CharField(max_length=64)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,42 +1,242 @@
 from django.db import models
+from django.conf import settings
 from .validators import validate_file_extension
 from companies.models import CompanyUser
 from django.utils.text import slugify
 
 # Create your models here.
 class Handbook(models.Model):
+    # Human readable label, renaming it never touches our vectors
     namespace = models.CharField(max_length=155, unique=True)
+    # Physical namespace our vectors live in --> set once on creation (handbook-{pk}) and never changed
+    #
+    # Handbooks created before this field keep the namespace they were ingested under (see migration 0007)
+    vector_namespace = models.CharField(max_length=155, unique=True, null=True, editable=False)
     pdf_file = models.FileField(upload_to='handbook_files/', validators=[validate_file_extension])  # Ensure our file type is PDF only
     # We'll be using created to help with our CRON task
     created = models.DateTimeField(auto_now_add=True)
+    # Bumped every time the file or name changes --> lets caches tell a stale answer apart
+    version = models.PositiveIntegerField(default=1)
+    # Last time the handbook (or its vectors) changed --> our FAQ beat job only looks past its watermark
+    updated = models.DateTimeField(auto_now=True)
 
     # FK to represent a One-Many (Company-Handbook) relationship 
     company = models.ForeignKey(CompanyUser, on_delete=models.CASCADE, related_name='handbooks')
 
+    class Meta:
+        indexes = [
+            # (updated, id) is the cursor our watermark walks through
+            models.Index(fields=['updated', 'id'], name='handbook_updated_cursor'),
+        ]
+
     def __str__(self):
         return self.namespace
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Our pk only exists after the first INSERT so the physical namespace is filled in right after
+        if not self.vector_namespace:
+            self.vector_namespace = f'handbook-{self.pk}'
+            Handbook.objects.filter(pk=self.pk).update(vector_namespace=self.vector_namespace)
     
     # Created Static function for our model + view to use 
     @staticmethod
     def generate_pc_namespace(company_name:str, handbook_name:str):
         return f'company-{slugify(company_name)}-doc-{slugify(handbook_name)}'
     
-    def get_pc_namespace(self):
+    def get_handbook_namespace(self):
+        # Our immutable physical namespace (renames are label only)
+        if self.vector_namespace:
+            return self.vector_namespace
+        # Not saved yet --> the name based namespace we used before vector_namespace existed
+        #
         # Let's suglify our fields to avoid weird characters appearing in Pinecone 
         company_name = slugify(self.company.company_name)
         handbook_name = slugify(self.namespace)
         # Return the Pinecone (pc) Namespace for query and ingestion 
         ns = Handbook.generate_pc_namespace(company_name, handbook_name)
         return ns 
+
+    def get_pc_namespace(self):
+        """
+            Where this handbook's vectors live depends on our PINECONE_NAMESPACE_LAYOUT 
+                - 'handbook': one namespace per handbook (original layout), see vector_namespace
+                - 'company': every handbook of a company shares one namespace, told apart by handbook_id metadata
+        """
+        if settings.PINECONE_NAMESPACE_LAYOUT == 'company':
+            return self.company.get_pc_namespace()
+        return self.get_handbook_namespace()
+
+    def get_vector_prefix(self, layout: str = None):
+        # Vector IDs are prefixed in a shared namespace so we could list/delete ONE handbook's vectors
+        layout = layout or settings.PINECONE_NAMESPACE_LAYOUT
+        return f'{self.id}#' if layout == 'company' else ''
+
+    def get_vector_metadata(self, layout: str = None):
+        # Extra metadata stored on every vector so a shared namespace could be filtered per handbook
+        layout = layout or settings.PINECONE_NAMESPACE_LAYOUT
+        return {'handbook_id': self.id} if layout == 'company' else {}
+
+    @staticmethod
+    def get_query_targets(company, handbook_ids=None):
+        """
+            Returns (namespaces, metadata_filter) for question() 
+                - 'handbook' layout: one namespace per handbook (optionally only the requested ones)
+                - 'company' layout: ONE namespace, filtered by handbook_id when a subset was requested
+        """
+        handbooks = company.handbooks.all()
+        if handbook_ids:
+            handbooks = handbooks.filter(id__in=handbook_ids)
+
+        if settings.PINECONE_NAMESPACE_LAYOUT == 'company':
+            metadata_filter = {'handbook_id': {'$in': [h.id for h in handbooks]}} if handbook_ids else None
+            return [company.get_pc_namespace()], metadata_filter
+        return [handbook.get_pc_namespace() for handbook in handbooks.select_related('company')], None
     
 class FAQ(models.Model):
     """
         Model to synteheically generate FAQ via Openai LLM 
             - We don't use User data (privacy)
+            - Each question is stored with its answer + embedding so employees asking it get an instant answer
     """
-    handbook = models.ForeignKey(Handbook, on_delete=models.CASCADE,related_name='handbook')
+    # handbook.faqs (was related_name='handbook' which made handbook.faq_set lookups fail)
+    handbook = models.ForeignKey(Handbook, on_delete=models.CASCADE, related_name='faqs')
     question = models.CharField(max_length=255)
+    # Precomputed while generating so AskQuestion could serve it without the LLM (see faq_services.match_faq)
+    answer = models.TextField(blank=True)
+    # Question embedding as raw float32 bytes (same model as our questions, text-embedding-3-small)
+    embedding = models.BinaryField(null=True, blank=True)
     generated_on = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'{self.handbook.get_pc_namespace()}: {self.question[:65]}...'
+
+
+class IngestionJob(models.Model):
+    """
+        Tracks a handbook PDF as it moves through our background ingestion pipeline
+            - Parse (fitz) --> Split (LangChain) --> Embed (OpenAI) --> Upsert (Pinecone)
+
+        Celery updates this record as it works so our status endpoint can report progress per stage
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    PARSE = 'parse'
+    SPLIT = 'split'
+    EMBED = 'embed'
+    UPSERT = 'upsert'
+    DONE = 'done'
+    STAGE_CHOICES = [
+        (PARSE, 'Parse'),
+        (SPLIT, 'Split'),
+        (EMBED, 'Embed'),
+        (UPSERT, 'Upsert'),
+        (DONE, 'Done'),
+    ]
+
+    handbook = models.ForeignKey(Handbook, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=PARSE)
+
+    # Progress counters for each stage 
+    pages_total = models.PositiveIntegerField(default=0)
+    pages_parsed = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_embedded = models.PositiveIntegerField(default=0)
+    # How many of our embedded chunks came out of the CachedEmbedding table instead of OpenAI
+    chunks_cached = models.PositiveIntegerField(default=0)
+    chunks_upserted = models.PositiveIntegerField(default=0)
+
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.handbook.namespace}: {self.status} ({self.stage})'
+
+
+class CachedEmbedding(models.Model):
+    """
+        Content addressed cache for our chunk embeddings 
+            - key = sha256(model + chunk text) so the same chunk in a revised handbook never hits OpenAI twice 
+            - vector is stored as raw float32 bytes (1536 dims --> 6KB per row)
+
+        last_used lets us evict the least recently used rows once we go over EMBEDDING_CACHE_MAX_ENTRIES
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    vector = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.model}: {self.key[:12]}'
+
+
+class HandbookChunk(models.Model):
+    """
+        Manifest of every chunk we ingested for a handbook (one row per vector)
+            - Written by pinecone_services.ingest() batch by batch
+            - Lets us enumerate a handbook's vectors with an indexed DB read + fetch() by id 
+              instead of querying Pinecone with a dummy vector (capped at 10k, random order)
+
+        text_hash is the full sha256 of the chunk text (our vector id only keeps the first 32 characters)
+    """
+    handbook = models.ForeignKey(Handbook, on_delete=models.CASCADE, related_name='chunks')
+    vector_id = models.CharField(max_length=100)
+    # Position of the chunk in the PDF (0-based)
+    chunk_index = models.PositiveIntegerField()
+    page_start = models.PositiveIntegerField(null=True, blank=True)
+    page_end = models.PositiveIntegerField(null=True, blank=True)
+    text_hash = models.CharField(max_length=64)
+    token_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['handbook', 'vector_id'], name='unique_handbook_chunk'),
+        ]
+        indexes = [
+            models.Index(fields=['handbook', 'chunk_index'], name='handbook_chunk_order'),
+        ]
+
+    def __str__(self):
+        return f'{self.handbook.namespace} #{self.chunk_index}: {self.vector_id}'
+
+
+class Watermark(models.Model):
+    """
+        High-water mark for our incremental background jobs (one row per job) 
+            - last_updated + last_id: the last Handbook (updated, id) a run already handed out 
+            - The next run only looks at handbooks past that point, so its cost follows the new work instead of the table size
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_updated = models.DateTimeField(null=True, blank=True)
+    last_id = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.last_updated} #{self.last_id}'
+
+
+class Lease(models.Model):
+    """
+        Named lock shared by every process (web, Celery workers and their prefork children) --> services/locks.py 
+            - One row per held lock, the unique name means exactly one insert wins 
+            - expires: a lease whose owner died is taken over by the next acquire_lock() after that
+    """
+    name = models.CharField(max_length=255, unique=True)
+    token = models.CharField(max_length=64)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.name} (until {self.expires})'
@@ -0,0 +1,14 @@
+from rest_framework.renderers import BaseRenderer
+from .services.streaming_services import sse_event
+
+class EventStreamRenderer(BaseRenderer):
+    """
+        Lets DRF accept `Accept: text/event-stream` (or ?format=sse) on our question endpoint 
+            - The actual stream is a StreamingHttpResponse so this only renders regular Responses (errors)
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event('error', data).encode(self.charset)
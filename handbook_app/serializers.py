@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Handbook
+from .models import Handbook, IngestionJob
 
 class GETHandbookSerializer(serializers.ModelSerializer):
     company_name = serializers.SerializerMethodField()
@@ -86,3 +86,36 @@ class NestedHandbookSerializer(serializers.ModelSerializer):
                 'lookup_field': 'id'
             }
         }
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    stages = serializers.SerializerMethodField()
+
+    def get_stages(self, job):
+        # Per-stage progress so our frontend could render a progress bar for each step
+        return {
+            'parse': {'done': job.pages_parsed, 'total': job.pages_total},
+            'split': {'chunks': job.chunks_total},
+            'embed': {
+                'done': job.chunks_embedded,
+                'total': job.chunks_total,
+                # Chunks we didn't have to send to OpenAI thanks to our embedding cache
+                'cached': job.chunks_cached,
+                'cache_hit_ratio': round(job.chunks_cached / job.chunks_embedded, 4) if job.chunks_embedded else 0.0
+            },
+            'upsert': {'done': job.chunks_upserted, 'total': job.chunks_total},
+        }
+
+    class Meta:
+        model = IngestionJob
+        fields = (
+            'id',
+            'handbook',
+            'status',
+            'stage',
+            'stages',
+            'error',
+            'created',
+            'updated',
+            'finished'
+        )
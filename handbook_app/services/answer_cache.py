@@ -0,0 +1,122 @@
+import hashlib
+import time
+from collections import OrderedDict
+from itertools import count
+from threading import Lock
+import numpy as np
+from django.conf import settings
+
+"""
+    Semantic answer cache for AskQuestion
+        - Employees keep asking the same handful of questions ("how many PTO days?")
+        - If a new question's embedding is close enough (cosine >= ANSWER_CACHE_THRESHOLD) to one we already answered
+          for the same company + handbook versions, we return that answer without querying Pinecone or the LLM
+
+    Scope = company + every (handbook id, version) + the requested subset, so an updated handbook never serves an old answer.
+    Views also call invalidate(company_id) on create/update/delete to free those entries right away.
+
+    The cache lives in process memory (one per worker) with LRU + TTL eviction
+"""
+
+
+def build_scope(company, handbook_ids=None) -> str:
+    # Any new, updated or deleted handbook changes this key
+    versions = company.handbooks.order_by('id').values_list('id', 'version')
+    subset = ','.join(sorted(str(handbook_id) for handbook_id in handbook_ids)) if handbook_ids else '*'
+    digest = hashlib.sha1(f'{list(versions)}|{subset}'.encode('utf-8')).hexdigest()
+    return f'{company.id}:{digest}'
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # entry id --> {'scope', 'company', 'vector', 'answer', 'created'} (order = least --> most recently used)
+        self._entries = OrderedDict()
+        self._ids = count()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now):
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry['created'] > self.ttl]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        self.evictions += len(expired)
+
+    def get(self, scope: str, vector):
+        """
+            Returns the cached answer of the most similar question in our scope (or None)
+                - Cosine similarity of every entry in the scope in one matrix-vector product
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self._expire(time.monotonic())
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry['scope'] == scope]
+            if candidates:
+                scores = np.stack([entry['vector'] for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry['answer']
+            self.misses += 1
+            return None
+
+    def set(self, scope: str, vector, answer: str):
+        with self._lock:
+            self._entries[next(self._ids)] = {
+                'scope': scope,
+                'company': scope.split(':', 1)[0],
+                'vector': self._normalize(vector),
+                'answer': answer,
+                'created': time.monotonic(),
+            }
+            # LRU: drop the least recently used entries over our limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, company_id):
+        # A handbook changed --> every cached answer for that company is stale
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry['company'] == str(company_id)]
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.ANSWER_CACHE_TTL,
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+)
+
+
+def invalidate(company_id):
+    answer_cache.invalidate(company_id)
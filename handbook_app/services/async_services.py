@@ -0,0 +1,77 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from handbook_app.services.clients import get_async_openai_client
+from handbook_app.services.fanout import aquery_namespaces
+from handbook_app.services.metrics import timed
+
+"""
+    Native async question pipeline (served by views.AskQuestionAsync under ASGI) 
+        - Async embedding --> async vector queries --> async chat completion 
+        - Pooled clients from clients.py so every request reuses the same connections 
+
+    While one question waits on OpenAI/Pinecone the event loop serves other questions instead of parking a thread
+"""
+
+async def aembed_question(q: str) -> list:
+    from handbook_app.services.pinecone_services import EMBEDDING_MODEL
+
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        from handbook_app.services.query_embedding_cache import query_embedding_cache
+        cached = await query_embedding_cache.aget(EMBEDDING_MODEL, q)
+        if cached is not None:
+            return cached
+
+    res = await get_async_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=q)
+    vector = res.data[0].embedding
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        await query_embedding_cache.aset(EMBEDDING_MODEL, q, vector)
+    return vector
+
+
+async def aprepare_question(q: str, ns: list, top_k: int = 3, metadata_filter: dict = None, cache_scope: str = None,
+                            company_id: int = None, handbook_ids: list = None):
+    # Async twin of pinecone_services.prepare_question() --> (question_embedded, matches, cached_answer)
+    from handbook_app.services.pinecone_services import get_backend
+
+    with timed('question.embed'):
+        question_embedded = await aembed_question(q)
+
+    if cache_scope and settings.ANSWER_CACHE_ENABLED:
+        from handbook_app.services.answer_cache import answer_cache
+        with timed('question.answer_cache'):
+            cached_answer = answer_cache.get(cache_scope, question_embedded)
+        if cached_answer is not None:
+            return question_embedded, [], cached_answer
+
+    if company_id and settings.FAQ_ANSWERS_ENABLED:
+        from handbook_app.services.faq_services import match_faq
+        # match_faq reads the DB (our ORM is sync) so it runs in a thread
+        with timed('question.faq_match'):
+            faq_answer = await sync_to_async(match_faq)(company_id, question_embedded, handbook_ids)
+        if faq_answer is not None:
+            return question_embedded, [], faq_answer
+
+    with timed('question.vector_query'):
+        matches = await aquery_namespaces(get_backend(), question_embedded, ns, top_k, include_metadata=True, filter=metadata_filter)
+    return question_embedded, matches, None
+
+
+async def aquestion(q: str, ns: list, top_k: int = 3, temp: int = 0, metadata_filter: dict = None, cache_scope: str = None,
+                    company_id: int = None, handbook_ids: list = None):
+    from handbook_app.services.pinecone_services import build_prompt, remember_answer
+
+    question_embedded, matches, cached_answer = await aprepare_question(q, ns, top_k, metadata_filter, cache_scope, company_id, handbook_ids)
+    if cached_answer is not None:
+        return cached_answer
+
+    with timed('question.prompt'):
+        prompt = build_prompt(q, matches)
+    with timed('question.llm'):
+        ai_response = await get_async_openai_client().chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role': 'user', 'content': prompt}],
+            temperature=temp
+        )
+    answer = ai_response.choices[0].message.content
+    remember_answer(cache_scope, question_embedded, answer)
+    return answer
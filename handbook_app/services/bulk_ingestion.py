@@ -0,0 +1,259 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from typing import NamedTuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from handbook_app.models import Handbook, IngestionJob
+
+"""
+    Bulk ingestion --> onboarding a company with hundreds of handbook PDFs in one go
+        - Handbook + IngestionJob rows are created with bulk_create (the PDFs are copied into our storage)
+        - PDFs are parsed + split in a process pool, one PDF per worker
+        - Extracted PDFs go to a thread pool that embeds (large batches) + upserts them through ingest()
+
+    Backpressure: only BULK_INGEST_CONCURRENCY handbooks are embedding at once and only workers * 2 PDFs are
+    extracted ahead of them, so a slow OpenAI/Pinecone never lets parsed PDFs pile up in memory
+
+    Resumable: a handbook whose latest job succeeded is skipped, anything else gets a new job (its interrupted ones are
+    marked failed) and ingest_extracted() skips the chunks our manifest says were already upserted
+"""
+
+
+class BulkEntry(NamedTuple):
+    path: str
+    # Handbook.namespace (our label) --> the file name without .pdf unless the manifest says otherwise
+    name: str
+    # Set by discover_pdfs() for a path we won't read --> prepare_handbooks() reports it instead of ingesting it
+    error: str = ''
+
+
+def check_path(path: Path, root: Path) -> str:
+    # Only real PDFs inside our root (no absolute paths, ../ or symlinks out of it)
+    path = path.resolve()
+    if os.path.commonpath([root, path]) != str(root):
+        return f'Outside of {root}: {path}'
+    if path.suffix.lower() != '.pdf':
+        return f'Not a PDF: {path}'
+    return ''
+
+
+def discover_pdfs(source: str, root: str = None) -> list:
+    """
+        Directory --> every *.pdf inside it (recursive, sorted so re-runs see the same order)
+        Manifest --> .json: ["a.pdf", {"path": "b.pdf", "name": "Benefits"}] or .csv/.txt: path[,name] per line
+
+        Relative manifest paths are relative to the manifest itself 
+            - Every path has to resolve inside root (BULK_INGEST_ROOT for our API, the source's own folder by default) 
+              + end with .pdf, anything else comes back with its error set
+    """
+    source = Path(source).resolve()
+    if source.is_dir():
+        root = Path(root or source).resolve()
+        return [
+            BulkEntry(str(path), path.stem, check_path(path, root))
+            for path in sorted(source.rglob('*'))
+            if path.is_file() and path.suffix.lower() == '.pdf'
+        ]
+
+    root = Path(root or source.parent).resolve()
+    if source.suffix.lower() == '.json':
+        with open(source) as f:
+            rows = [row if isinstance(row, dict) else {'path': row} for row in json.load(f)]
+    else:
+        with open(source, newline='') as f:
+            rows = [
+                {'path': row[0].strip(), 'name': row[1].strip() if len(row) > 1 else ''}
+                for row in csv.reader(f) if row and row[0].strip() and not row[0].startswith('#')
+            ]
+
+    entries = []
+    for row in rows:
+        path = source.parent / row['path']
+        entries.append(BulkEntry(str(path), row.get('name') or path.stem, check_path(path, root)))
+    return entries
+
+
+def prepare_handbooks(company, entries: list) -> dict:
+    """
+        Creates whatever Handbook rows don't exist yet + one new IngestionJob per handbook left to ingest
+            - Returns {'todo': [(entry, job)], 'skipped': [names], 'errors': {name: error}}
+            - Namespaces are unique across companies so a name taken by another company is an error
+    """
+    errors = {}
+    unique = {}
+    for entry in entries:
+        if entry.error:
+            errors[entry.name] = entry.error
+        elif entry.name in unique:
+            errors[entry.name] = f'Duplicate name (also used by {unique[entry.name].path})'
+        elif not os.path.isfile(entry.path):
+            errors[entry.name] = f'File not found: {entry.path}'
+        else:
+            unique[entry.name] = entry
+
+    existing = {handbook.namespace: handbook for handbook in Handbook.objects.filter(namespace__in=list(unique))}
+    for name, handbook in existing.items():
+        if handbook.company_id != company.id:
+            errors[name] = 'Name already used by another company'
+            del unique[name]
+
+    # New handbooks: copy the PDF into our storage then ONE insert for all of them
+    new_handbooks = []
+    for name, entry in list(unique.items()):
+        if name in existing:
+            continue
+        handbook = Handbook(company=company, namespace=name, pdf_file=os.path.basename(entry.path))
+        try:
+            # bulk_create skips our model validators --> same checks as an upload (PDF only, name length) before we copy anything
+            handbook.full_clean(exclude=['vector_namespace'], validate_unique=False)
+        except ValidationError as e:
+            errors[name] = '; '.join(e.messages)
+            del unique[name]
+            continue
+        with open(entry.path, 'rb') as f:
+            handbook.pdf_file.save(os.path.basename(entry.path), File(f), save=False)
+        new_handbooks.append(handbook)
+    created = Handbook.objects.bulk_create(new_handbooks)
+    if created and created[0].pk is None:
+        # Databases that can't return ids from a bulk insert
+        created = list(Handbook.objects.filter(company=company, namespace__in=[h.namespace for h in created]))
+    # bulk_create skips Handbook.save() so our physical namespace is filled in here
+    for handbook in created:
+        handbook.vector_namespace = f'handbook-{handbook.pk}'
+    Handbook.objects.bulk_update(created, ['vector_namespace'])
+    handbooks = {**{name: h for name, h in existing.items() if name in unique}, **{h.namespace: h for h in created}}
+
+    # Resuming --> a handbook whose LATEST job succeeded is left alone (an older success followed by a new PDF isn't done)
+    latest_job = IngestionJob.objects.filter(handbook=OuterRef('pk')).order_by('-created', '-id')
+    finished = set(
+        Handbook.objects.filter(id__in=[handbook.id for handbook in existing.values()])
+        .annotate(latest_status=Subquery(latest_job.values('status')[:1]))
+        .filter(latest_status=IngestionJob.SUCCEEDED)
+        .values_list('id', flat=True)
+    )
+    skipped = [name for name, handbook in handbooks.items() if handbook.id in finished]
+    pending = [(unique[name], handbook) for name, handbook in handbooks.items() if handbook.id not in finished]
+    # Jobs of an interrupted run never finish on their own --> fail them so our status endpoint doesn't report them forever
+    now = timezone.now()
+    IngestionJob.objects.filter(
+        handbook__in=[handbook for _, handbook in pending], status__in=[IngestionJob.QUEUED, IngestionJob.RUNNING]
+    ).update(status=IngestionJob.FAILED, error='Interrupted, replaced by a new bulk ingestion job', finished=now, updated=now)
+    jobs = IngestionJob.objects.bulk_create([IngestionJob(handbook=handbook) for _, handbook in pending])
+    if jobs and jobs[0].pk is None:
+        latest = {job.handbook_id: job for job in IngestionJob.objects.filter(handbook__in=[h for _, h in pending]).order_by('created')}
+        jobs = [latest[handbook.id] for _, handbook in pending]
+    return {'todo': [(entry, job) for (entry, _), job in zip(pending, jobs)], 'skipped': skipped, 'errors': errors}
+
+
+def _ingest_job(job: IngestionJob, page_count: int, chunks: list, batch_size: int) -> str:
+    # Runs on an ingest thread --> Django gives every thread its own DB connection so we close ours when we're done
+    from handbook_app.services.ingestion_services import ingest_extracted
+    try:
+        return ingest_extracted(job, page_count, chunks, batch_size)
+    finally:
+        connection.close()
+
+
+def _fail_job(job: IngestionJob, error: Exception):
+    from handbook_app.services.ingestion_services import finish_job
+    job.status = IngestionJob.FAILED
+    job.error = str(error)
+    finish_job(job)
+
+
+def bulk_ingest(company, entries: list, workers: int = None, concurrency: int = None, batch_size: int = None, log=print) -> dict:
+    """
+        Ingests every PDF in entries (see discover_pdfs) for our company
+            - workers: extraction processes (PDF_EXTRACT_WORKERS)
+            - concurrency: handbooks embedding + upserting at once (BULK_INGEST_CONCURRENCY)
+            - batch_size: chunks per embedding request / upsert (BULK_INGEST_EMBED_BATCH)
+
+        Returns {'handbooks', 'succeeded', 'failed', 'skipped', 'pages', 'chunks', 'seconds', 'errors': {name: error}}
+    """
+    from handbook_app.services.pdf_services import extract_chunks
+
+    workers = workers or settings.PDF_EXTRACT_WORKERS
+    concurrency = concurrency or settings.BULK_INGEST_CONCURRENCY
+    batch_size = batch_size or settings.BULK_INGEST_EMBED_BATCH
+    start = time.perf_counter()
+
+    prepared = prepare_handbooks(company, entries)
+    errors = dict(prepared['errors'])
+    results = {'succeeded': 0, 'failed': 0, 'pages': 0, 'chunks': 0}
+    log(f'{len(prepared["todo"])} handbooks to ingest, {len(prepared["skipped"])} already done, {len(errors)} rejected')
+
+    # Daemon processes (Celery prefork children) are not allowed to start their own pool --> one extraction thread
+    # (our ingestion queue's --pool=solo worker isn't one, see CELERY_TASK_ROUTES)
+    daemon = multiprocessing.current_process().daemon
+    if workers > 1 and not daemon:
+        extract_pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        if workers > 1:
+            log('Extracting PDFs on one thread: running in a daemon process, route ingestion to a --pool=solo worker')
+        extract_pool = ThreadPoolExecutor(max_workers=1)
+    ingest_slots = BoundedSemaphore(concurrency)
+    # Our callbacks run on the ingest threads
+    results_lock = Lock()
+
+    def on_ingested(entry, job, page_count, chunk_count):
+        def callback(future):
+            ingest_slots.release()
+            error = future.exception()
+            status = IngestionJob.FAILED if error else future.result()
+            with results_lock:
+                if status == IngestionJob.SUCCEEDED:
+                    results['succeeded'] += 1
+                    results['pages'] += page_count
+                    results['chunks'] += chunk_count
+                else:
+                    results['failed'] += 1
+                    # ingest_extracted() leaves its error on our job instance
+                    errors[entry.name] = str(error or job.error)
+            log(f'{entry.name}: {status} ({page_count} pages, {chunk_count} chunks)')
+        return callback
+
+    with extract_pool, ThreadPoolExecutor(max_workers=concurrency) as ingest_pool:
+        pending = iter(prepared['todo'])
+        in_flight = deque((entry, job, extract_pool.submit(extract_chunks, entry.path)) for entry, job in islice(pending, workers * 2))
+        while in_flight:
+            entry, job, extraction = in_flight.popleft()
+            try:
+                page_count, chunks = extraction.result()
+            except Exception as e:
+                _fail_job(job, e)
+                with results_lock:
+                    results['failed'] += 1
+                    errors[entry.name] = str(e)
+                log(f'{entry.name}: failed to parse ({e})')
+            else:
+                # Backpressure: wait for a free ingest slot before we pull the next PDF off the pool
+                ingest_slots.acquire()
+                future = ingest_pool.submit(_ingest_job, job, page_count, chunks, batch_size)
+                future.add_done_callback(on_ingested(entry, job, page_count, len(chunks)))
+            for entry, job in islice(pending, 1):
+                in_flight.append((entry, job, extract_pool.submit(extract_chunks, entry.path)))
+
+    if results['succeeded']:
+        # New handbooks change what our company's questions should be answered with
+        from handbook_app.services.answer_cache import invalidate
+        invalidate(company.id)
+
+    return {
+        'handbooks': len(entries),
+        'skipped': len(prepared['skipped']),
+        **results,
+        'seconds': round(time.perf_counter() - start, 2),
+        'errors': errors,
+    }
@@ -0,0 +1,75 @@
+import hashlib
+from handbook_app.models import HandbookChunk
+
+"""
+    Chunk manifest (HandbookChunk) --> our own record of which vectors belong to a handbook 
+        - ingest() records every chunk batch by batch (vector id, position, pages, hash, tokens) 
+        - handbook_vector_ids() + iter_handbook_vectors() enumerate a handbook in PDF order 
+          with an indexed DB read + batched fetch() by id (no dummy vector query)
+
+    Handbooks ingested before the manifest existed have no rows, for those we fall back to listing the IDs from the index
+"""
+
+
+def build_rows(handbook_id: int, vector_ids: list, chunks: list, start_index: int) -> list:
+    # chunks are pdf_services.Chunk (text + pages) or plain strings (no page info)
+    from handbook_app.services.context_builder import count_tokens
+
+    rows = []
+    for offset, (vector_id, chunk) in enumerate(zip(vector_ids, chunks)):
+        text = getattr(chunk, 'text', chunk)
+        rows.append(HandbookChunk(
+            handbook_id=handbook_id,
+            vector_id=vector_id,
+            chunk_index=start_index + offset,
+            page_start=getattr(chunk, 'page_start', None),
+            page_end=getattr(chunk, 'page_end', None),
+            text_hash=hashlib.sha256(text.encode('utf-8')).hexdigest(),
+            token_count=count_tokens(text),
+        ))
+    return rows
+
+
+def record_chunks(rows: list):
+    # Re-ingesting the same handbook updates the rows in place (a chunk's position/pages may have moved)
+    HandbookChunk.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['handbook', 'vector_id'],
+        update_fields=['chunk_index', 'page_start', 'page_end', 'text_hash', 'token_count'],
+    )
+
+
+def forget_chunks(handbook_id: int, vector_ids, batch_size: int = 500):
+    # Batched so we don't go over the database's limit of query parameters
+    from handbook_app.services.pinecone_services import batched
+
+    for batch in batched(vector_ids, batch_size):
+        HandbookChunk.objects.filter(handbook_id=handbook_id, vector_id__in=batch).delete()
+
+
+def handbook_vector_ids(handbook) -> list:
+    # Every vector id of our handbook in PDF order
+    ids = list(handbook.chunks.order_by('chunk_index').values_list('vector_id', flat=True))
+    if ids:
+        return ids
+    # No manifest yet (ingested before HandbookChunk existed)
+    from handbook_app.services.pinecone_services import list_ids
+    return sorted(list_ids(handbook.get_pc_namespace(), handbook.get_vector_prefix()))
+
+
+def iter_handbook_vectors(handbook, ids: list = None, batch_size: int = 100):
+    """
+        Yields {'id', 'values', 'metadata'} for our handbook's vectors in PDF order 
+            - fetch() in batches so we only hold one batch at a time 
+            - Stop iterating early and the remaining batches are never fetched
+    """
+    from handbook_app.services.pinecone_services import get_backend, batched
+
+    ns = handbook.get_pc_namespace()
+    ids = handbook_vector_ids(handbook) if ids is None else ids
+    for batch in batched(ids, batch_size):
+        fetched = get_backend().fetch(batch, ns)
+        for vector_id in batch:
+            if vector_id in fetched:
+                yield fetched[vector_id]
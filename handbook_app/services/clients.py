@@ -0,0 +1,37 @@
+import asyncio
+import weakref
+from threading import Lock
+from django.conf import settings
+
+"""
+    Process-wide pooled API clients 
+        - question() used to build a brand new OpenAI client (new connection pool + TLS handshake) on EVERY call 
+        - Now every worker process builds its clients once and reuses them 
+
+    Async clients hold connections bound to the event loop that opened them so we keep one per running loop 
+    (uvicorn runs one loop per worker, so in practice that's still one client per process)
+"""
+_lock = Lock()
+_openai_client = None
+_async_openai_clients = weakref.WeakKeyDictionary()
+
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                # Local import for lazy init 
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+    return _openai_client
+
+
+def get_async_openai_client():
+    loop = asyncio.get_running_loop()
+    client = _async_openai_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+        _async_openai_clients[loop] = client
+    return client
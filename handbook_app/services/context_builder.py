@@ -0,0 +1,130 @@
+from threading import Lock
+from django.conf import settings
+
+"""
+    Token-budgeted context for our LLM prompt
+        - Our splitter uses chunk_overlap=100 so two neighbouring chunks repeat up to 100 characters
+        - Joining the raw top-k chunks means we pay for that repeated text (input tokens + latency)
+
+    build_context():
+        1) Group matches by source (namespace + handbook_id)
+        2) Merge chunks of the same source whose end overlaps the start of another (or that contain one another)
+        3) Pack the best scoring blocks until CONTEXT_TOKEN_BUDGET is used up (the last block may be truncated)
+"""
+CHAT_MODEL = "gpt-4o"
+SEPARATOR = "\n\n"
+# An overlap shorter than this is most likely a coincidence (a shared word) not our splitter's overlap
+MIN_OVERLAP_CHARS = 20
+# chunk_overlap is counted in characters and the splitter only cuts on separators, so the real overlap is <= this
+MAX_OVERLAP_CHARS = 400
+
+_encoder = None
+_encoder_lock = Lock()
+
+
+def get_encoder():
+    """
+        tiktoken encoder for our chat model (built once per process)
+            - Returns None if tiktoken can't load its encoding (air-gapped box), count_tokens() then estimates
+    """
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.encoding_for_model(CHAT_MODEL)
+                except Exception:
+                    _encoder = False
+    return _encoder or None
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        # ~4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoder = get_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    return encoder.decode(encoder.encode(text)[:max_tokens])
+
+
+def overlap_length(first: str, second: str) -> int:
+    # Longest suffix of `first` that is also a prefix of `second` (0 if shorter than MIN_OVERLAP_CHARS)
+    longest = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def source_of(match) -> tuple:
+    return match.get('namespace'), match['metadata'].get('handbook_id')
+
+
+def merge_overlapping(blocks: list) -> list:
+    """
+        blocks: [{'text', 'score'}] from the SAME source
+            - A block inside another block is dropped
+            - A block whose start repeats another block's end is stitched onto it (overlap written once)
+        Keeps going until nothing else merges (k is tiny so O(k^2) passes are fine)
+    """
+    blocks = [dict(block) for block in blocks]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(blocks)):
+            for j in range(len(blocks)):
+                if i == j:
+                    continue
+                first, second = blocks[i], blocks[j]
+                if second['text'] in first['text']:
+                    text = first['text']
+                else:
+                    size = overlap_length(first['text'], second['text'])
+                    if not size:
+                        continue
+                    text = first['text'] + second['text'][size:]
+                first['text'] = text
+                first['score'] = max(first['score'], second['score'])
+                del blocks[j]
+                merged = True
+                break
+            if merged:
+                break
+    return blocks
+
+
+def build_context(matches: list, token_budget: int = None) -> str:
+    token_budget = token_budget if token_budget is not None else settings.CONTEXT_TOKEN_BUDGET
+
+    # 1) Group by source, keeping the order we first saw each source
+    sources = {}
+    for match in matches:
+        sources.setdefault(source_of(match), []).append({'text': match['metadata']['text'], 'score': match['score']})
+
+    # 2) Merge neighbours inside each source
+    blocks = [block for source_blocks in sources.values() for block in merge_overlapping(source_blocks)]
+    blocks.sort(key=lambda block: block['score'], reverse=True)
+
+    # 3) Pack the best blocks into our budget
+    packed = []
+    remaining = token_budget
+    separator_tokens = count_tokens(SEPARATOR)
+    for block in blocks:
+        cost = count_tokens(block['text']) + (separator_tokens if packed else 0)
+        if cost <= remaining:
+            packed.append(block['text'])
+            remaining -= cost
+            continue
+        # Not enough room for the whole block --> take what fits then stop
+        room = remaining - (separator_tokens if packed else 0)
+        if room > 0:
+            packed.append(truncate_tokens(block['text'], room))
+        break
+    return SEPARATOR.join(packed)
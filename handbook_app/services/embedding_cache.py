@@ -0,0 +1,96 @@
+import hashlib
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from handbook_app.models import CachedEmbedding
+
+"""
+    Embedding cache for our chunks 
+        - Every chunk is keyed by sha256(model + text) --> same text, same vector 
+        - ingest() asks the cache first and only sends the chunks we haven't seen to OpenAI 
+
+    A revised handbook usually only changes a few pages so most of the chunks are cache hits
+"""
+
+def cache_key(model: str, text: str) -> str:
+    # \0 keeps "model" + "text" from colliding with a different split of the same characters
+    return hashlib.sha256(f'{model}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def to_bytes(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_bytes(data) -> list:
+    # Pinecone wants plain python floats
+    return np.frombuffer(bytes(data), dtype=np.float32).tolist()
+
+
+def lookup_cached(texts: list, model: str):
+    """
+        First half of embed_documents_cached() --> what we already have 
+            - Returns (keys, cached, missing): cached = {key: vector}, missing = {key: text} (unique texts to embed)
+    """
+    keys = [cache_key(model, text) for text in texts]
+    cached = {
+        row.key: from_bytes(row.vector)
+        for row in CachedEmbedding.objects.filter(key__in=set(keys))
+    }
+
+    # Unique misses only 
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    return keys, cached, missing
+
+
+def store_cached(model: str, keys: list, cached: dict, missing: dict, new_vectors: list):
+    """
+        Second half --> saves the vectors we just embedded for missing (same order) 
+            - Returns (vectors, hits) for our texts in their original order
+    """
+    hits = sum(1 for key in keys if key not in missing)
+    if missing:
+        CachedEmbedding.objects.bulk_create(
+            [
+                CachedEmbedding(key=key, model=model, vector=to_bytes(vector))
+                for key, vector in zip(missing.keys(), new_vectors)
+            ],
+            # Two workers could embed the same chunk at the same time, first one wins
+            ignore_conflicts=True
+        )
+        cached.update(zip(missing.keys(), new_vectors))
+
+    if hits:
+        # Bumping last_used so the chunks we keep reusing don't get evicted
+        CachedEmbedding.objects.filter(key__in=[key for key in keys if key not in missing]).update(last_used=timezone.now())
+
+    return [cached[key] for key in keys], hits
+
+
+def embed_documents_cached(texts: list, embeddings, model: str):
+    """
+        Drop-in for embeddings.embed_documents(texts) 
+            - Returns (vectors, hits) where hits is how many texts came from the cache 
+            - Identical texts inside the same batch are only embedded once
+
+        ingest() calls the two halves itself so the OpenAI request could run on another thread (DB stays on ours)
+    """
+    keys, cached, missing = lookup_cached(texts, model)
+    new_vectors = embeddings.embed_documents(list(missing.values())) if missing else []
+    return store_cached(model, keys, cached, missing, new_vectors)
+
+
+def evict(max_entries: int = None) -> int:
+    """
+        Size based eviction --> drop the least recently used rows over our limit 
+            - Returns the number of rows removed
+    """
+    max_entries = max_entries if max_entries is not None else settings.EMBEDDING_CACHE_MAX_ENTRIES
+    excess = CachedEmbedding.objects.count() - max_entries
+    if excess <= 0:
+        return 0
+    stale_ids = list(CachedEmbedding.objects.order_by('last_used').values_list('id', flat=True)[:excess])
+    deleted, _ = CachedEmbedding.objects.filter(id__in=stale_ids).delete()
+    return deleted
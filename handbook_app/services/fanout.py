@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from django.conf import settings
+
+"""
+    Concurrent namespace fan-out for question() 
+        - Every handbook has its own namespace so a company with 20 handbooks means 20 vector queries 
+        - Instead of running them one after another we send them through a thread pool (PINECONE_QUERY_CONCURRENCY threads) 
+        - Results are merged with a bounded min-heap so we never sort the whole concatenated list 
+
+    Every fan-out gets its OWN short-lived pool: future.cancel() can't stop a query that already started, so with one shared 
+    pool a few slow namespaces would keep its threads busy and every later question would queue behind them. 
+    Our Pinecone queries also carry PINECONE_QUERY_TIMEOUT on the HTTP request itself so those threads don't linger.
+"""
+
+
+class TopK:
+    """
+        Streaming top-k merge 
+            - Min-heap holding our k best matches, the worst of them sits at heap[0] 
+            - push() is O(log k) and anything worse than our current worst is thrown away
+    """
+    def __init__(self, k: int):
+        self.k = k
+        self._heap = []
+        # Tie breaker so heapq never has to compare two match objects
+        self._seq = 0
+
+    def push(self, match):
+        entry = (match['score'], self._seq, match)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, matches):
+        for match in matches:
+            self.push(match)
+
+    def results(self) -> list:
+        # Best score first
+        return [match for _, _, match in sorted(self._heap, key=lambda e: (e[0], -e[1]), reverse=True)]
+
+
+def query_namespaces(index, vector: list, namespaces: list, top_k: int, timeout: float = None, pool=None, **query_kwargs) -> list:
+    """
+        Queries every namespace concurrently and returns the global top_k matches (best first) 
+            - timeout: seconds we're willing to wait for ALL the namespaces, slow ones are skipped 
+            - A namespace that errors out is skipped as well so one bad handbook doesn't fail the whole question
+    """
+    timeout = timeout if timeout is not None else settings.PINECONE_QUERY_TIMEOUT
+    top = TopK(top_k)
+    if not namespaces:
+        return []
+    # A pool passed in (benchmarks) belongs to the caller, ours is shut down without waiting on late namespaces
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPoolExecutor(max_workers=min(settings.PINECONE_QUERY_CONCURRENCY, len(namespaces)), thread_name_prefix='pinecone-query')
+
+    try:
+        futures = {
+            pool.submit(index.query, vector=vector, top_k=top_k, namespace=namespace, **query_kwargs): namespace
+            for namespace in namespaces
+        }
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                try:
+                    matches = future.result()['matches']
+                    # Tagging every match with where it came from (our streaming endpoint reports the sources)
+                    for match in matches:
+                        match['namespace'] = futures[future]
+                    top.extend(matches)
+                except Exception as e:
+                    print(f'Query failed for namespace {futures[future]}: {e}')
+        except FuturesTimeout:
+            late = [namespace for future, namespace in futures.items() if not future.done()]
+            for future in futures:
+                future.cancel()
+            print(f'Skipping {len(late)} namespace(s) that did not answer within {timeout}s: {late}')
+    finally:
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return top.results()
+
+
+async def aquery_namespaces(backend, vector: list, namespaces: list, top_k: int, timeout: float = None, **query_kwargs) -> list:
+    """
+        Async version of query_namespaces() for our async question path 
+            - Every namespace is a coroutine on the event loop, a semaphore bounds how many are in flight 
+            - Same timeout + skip-on-error behaviour and the same heap merge
+    """
+    timeout = timeout if timeout is not None else settings.PINECONE_QUERY_TIMEOUT
+    limit = asyncio.Semaphore(settings.PINECONE_QUERY_CONCURRENCY)
+    top = TopK(top_k)
+
+    async def query_one(namespace):
+        async with limit:
+            matches = (await backend.aquery(vector=vector, top_k=top_k, namespace=namespace, **query_kwargs))['matches']
+        for match in matches:
+            match['namespace'] = namespace
+        return matches
+
+    tasks = {asyncio.ensure_future(query_one(namespace)): namespace for namespace in namespaces}
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f'Skipping {len(pending)} namespace(s) that did not answer within {timeout}s: {[tasks[t] for t in pending]}')
+
+    for task in done:
+        if task.exception():
+            print(f'Query failed for namespace {tasks[task]}: {task.exception()}')
+            continue
+        top.extend(task.result())
+    return top.results()
@@ -0,0 +1,303 @@
+from datetime import timedelta
+from threading import Lock
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F, Max, Count, OuterRef, Subquery
+from django.utils import timezone
+from handbook_app.models import FAQ, Handbook, IngestionJob, Lease, Watermark
+
+"""
+    Synthetic FAQ generation 
+        - build_faq_context() reads the handbook from the start of the PDF (chunk manifest + fetch by ID) up to FAQ_CONTEXT_TOKENS 
+        - generate_questions() asks gpt-4o for 5 questions employees might ask 
+        - answer_questions() embeds them in one call + answers each through our live pipeline (this handbook only) 
+        - build_faqs() turns all of that into unsaved FAQ rows so callers could bulk_create them 
+        - match_faq() lets AskQuestion serve a stored answer when an employee asks one of our FAQ (no retrieval, no LLM) 
+
+    Used by the generate_faq command (thread pool) and our Celery fan-out (tasks.gen_faq, one task per handbook) 
+
+    The beat job is incremental: handbooks_to_process() only returns handbooks whose `updated` is past our Watermark, 
+    so a new OR changed handbook (new PDF, finished ingestion) gets fresh FAQ and nothing else is rescanned
+"""
+# How much handbook text goes into one FAQ prompt
+FAQ_CONTEXT_TOKENS = 12000
+FAQ_PER_HANDBOOK = 5
+FAQ_WATERMARK = 'faq'
+FAQ_LOCK = 'faq-dispatch'
+
+
+def build_faq_context(handbook) -> str:
+    from handbook_app.services.chunk_manifest import iter_handbook_vectors
+    from handbook_app.services.context_builder import count_tokens
+
+    # Our chunk manifest gives us the handbook's vector IDs in PDF order, we fetch() them in batches 
+    # and stop as soon as our prompt is full (the remaining batches are never fetched)
+    texts = []
+    tokens = 0
+    for vector in iter_handbook_vectors(handbook):
+        text = vector['metadata']['text']
+        tokens += count_tokens(text)
+        if tokens > FAQ_CONTEXT_TOKENS:
+            break
+        texts.append(text)
+    return "\n\n".join(texts)
+
+
+def parse_questions(content: str) -> list:
+    # The LLM separates questions with "|", drop blanks + anything that wouldn't fit FAQ.question
+    questions = [q.strip() for q in content.split('|')]
+    return [q[:255] for q in questions if q][:FAQ_PER_HANDBOOK]
+
+
+def generate_questions(ai_client, handbook, bucket=None) -> list:
+    """
+        Grab the handbook text then feed it into our prompt 
+            - bucket (rate_limit.TokenBucket) is shared by every thread so we stay under our OpenAI rate limit
+    """
+    context = build_faq_context(handbook)
+    prompt = f"""
+        You are an employee at {handbook.company.company_name}.
+        Based on the following handbook content, generate {FAQ_PER_HANDBOOK} realistic questions 
+        employees might ask (do not answer them):
+
+        {context}
+
+        Separate each question with the "|" character. 
+        Do not include the "|" character inside any question. 
+        Do not add comments, extra whitespaces, or malformed syntax.
+    """
+
+    if bucket:
+        bucket.acquire()
+    # Using OpenAI LLM to generate a response 
+    ai_response = ai_client.chat.completions.create(
+        model='gpt-4o',
+        messages=[{
+            'role': 'user',
+            'content': prompt
+        }],
+        temperature = 0
+    )
+    return parse_questions(ai_response.choices[0].message.content)
+
+
+def embed_texts(texts: list) -> list:
+    # One embeddings request for every question (same model as the questions AskQuestion embeds)
+    from handbook_app.services.clients import get_openai_client
+    from handbook_app.services.pinecone_services import EMBEDDING_MODEL
+
+    res = get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [item.embedding for item in sorted(res.data, key=lambda item: item.index)]
+
+
+def answer_questions(handbook, questions: list, bucket=None):
+    """
+        Precomputes our FAQ answers --> (answers, vectors) 
+            - Same retrieval + prompt + gpt-4o as AskQuestion but only over this handbook 
+            - We pass our batch embeddings in so every question is only embedded once
+    """
+    from handbook_app.services.pinecone_services import question
+
+    if not questions:
+        return [], []
+    namespaces, metadata_filter = Handbook.get_query_targets(handbook.company, [handbook.id])
+    vectors = embed_texts(questions)
+    answers = []
+    for q, vector in zip(questions, vectors):
+        if bucket:
+            bucket.acquire()
+        answers.append(question(q, namespaces, metadata_filter=metadata_filter, question_embedded=vector))
+    return answers, vectors
+
+
+def build_faqs(handbook_id: int, questions: list, answers: list = None, vectors: list = None) -> list:
+    # Unsaved rows --> FAQ.objects.bulk_create() writes them in one query
+    from handbook_app.services.embedding_cache import to_bytes
+
+    answers = answers or [''] * len(questions)
+    vectors = vectors or [None] * len(questions)
+    return [
+        FAQ(handbook_id=handbook_id, question=q, answer=answer, embedding=to_bytes(vector) if vector is not None else None)
+        for q, answer, vector in zip(questions, answers, vectors)
+    ]
+
+
+def build_handbook_faqs(ai_client, handbook, bucket=None) -> list:
+    # Questions --> answers + embeddings --> unsaved FAQ rows
+    questions = generate_questions(ai_client, handbook, bucket)
+    answers, vectors = answer_questions(handbook, questions, bucket)
+    return build_faqs(handbook.id, questions, answers, vectors)
+
+
+class FAQIndex:
+    """
+        In-process index of every answered FAQ of a company (one normalized matrix per company) 
+            - Rebuilt only when the company's FAQ change (new max id / count) so a lookup is one small aggregate query 
+              + one matrix-vector product 
+            - FAQ generated before their handbook's last change (new PDF, re-ingestion) are left out, those answers 
+              came from the old PDF --> AskQuestion goes through the live pipeline until the next FAQ run replaces them
+            - hits / misses are kept for monitoring
+    """
+    def __init__(self):
+        # company id --> {'stamp', 'matrix', 'answers', 'handbook_ids'}
+        self._companies = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, company_id: int) -> dict:
+        from handbook_app.services.embedding_cache import from_bytes
+
+        faqs = FAQ.objects.filter(handbook__company_id=company_id)
+        fresh = Q(generated_on__gte=F('handbook__updated'))
+        # `fresh` is part of our stamp so a handbook changing under its FAQ drops them from the index
+        stamp = faqs.aggregate(last=Max('id'), count=Count('id'), fresh=Count('id', filter=fresh))
+        entry = self._companies.get(company_id)
+        if entry and entry['stamp'] == stamp:
+            return entry
+
+        rows = list(faqs.filter(fresh, embedding__isnull=False).exclude(answer='').values_list('handbook_id', 'answer', 'embedding'))
+        # A company without answered FAQ yet gets an empty index (reshape(0, -1) can't infer the width)
+        matrix = np.array([from_bytes(embedding) for _, _, embedding in rows], dtype=np.float32)
+        if len(rows):
+            matrix = matrix.reshape(len(rows), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        entry = {
+            'stamp': stamp,
+            'matrix': matrix,
+            'answers': [answer for _, answer, _ in rows],
+            'handbook_ids': np.array([handbook_id for handbook_id, _, _ in rows]),
+        }
+        with self._lock:
+            self._companies[company_id] = entry
+        return entry
+
+    def match(self, company_id: int, vector, handbook_ids=None, threshold: float = None):
+        threshold = threshold if threshold is not None else settings.FAQ_MATCH_THRESHOLD
+        entry = self._load(company_id)
+        scores = np.empty(0)
+        if entry['answers']:
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            scores = entry['matrix'] @ (query / norm if norm else query)
+            if handbook_ids:
+                # Only the FAQ of the handbooks that were asked
+                allowed = np.isin(entry['handbook_ids'], [int(handbook_id) for handbook_id in handbook_ids])
+                scores = np.where(allowed, scores, -1.0)
+
+        best = int(np.argmax(scores)) if len(scores) else None
+        with self._lock:
+            if best is not None and scores[best] >= threshold:
+                self.hits += 1
+                return entry['answers'][best]
+            self.misses += 1
+            return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'companies': len(self._companies),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+faq_index = FAQIndex()
+
+
+def match_faq(company_id: int, vector, handbook_ids=None):
+    # Stored answer of the closest FAQ above FAQ_MATCH_THRESHOLD (or None --> live pipeline)
+    return faq_index.match(company_id, vector, handbook_ids)
+
+
+def handbooks_without_faq(queryset=None):
+    queryset = queryset if queryset is not None else Handbook.objects.all()
+    return queryset.filter(faqs__isnull=True).select_related('company').order_by('id')
+
+
+def handbooks_to_process(limit: int) -> list:
+    """
+        Next (id, updated) pairs past our watermark, oldest first 
+            - Ordered by (updated, id) so handbooks sharing a timestamp are never skipped 
+            - FAQ_WATERMARK_LAG keeps us behind transactions that may still be committing 
+            - Only handbooks whose LATEST ingestion job succeeded: one still ingesting has no vectors yet and one that failed
+              would get FAQ answered from an empty context (ingestion bumps `updated` when it succeeds so they come back later)
+            - An older job stuck in RUNNING doesn't matter once a newer one succeeded
+            - Handbooks without any job were ingested inside the request before we had IngestionJob
+    """
+    watermark, _ = Watermark.objects.get_or_create(name=FAQ_WATERMARK)
+    latest_job = IngestionJob.objects.filter(handbook=OuterRef('pk')).order_by('-created', '-id')
+    handbooks = Handbook.objects.filter(updated__lte=timezone.now() - timedelta(seconds=settings.FAQ_WATERMARK_LAG))
+    if watermark.last_updated:
+        handbooks = handbooks.filter(
+            Q(updated__gt=watermark.last_updated) | Q(updated=watermark.last_updated, id__gt=watermark.last_id)
+        )
+    handbooks = handbooks.annotate(latest_status=Subquery(latest_job.values('status')[:1])).filter(
+        Q(latest_status=IngestionJob.SUCCEEDED) | Q(latest_status__isnull=True)
+    )
+    return list(handbooks.order_by('updated', 'id').values_list('id', 'updated')[:limit])
+
+
+def advance_watermark(handbook_id: int, updated):
+    Watermark.objects.update_or_create(name=FAQ_WATERMARK, defaults={'last_updated': updated, 'last_id': handbook_id})
+
+
+def faq_claim_key(handbook_id: int) -> str:
+    return f'faq:claim:{handbook_id}'
+
+
+def claim_handbooks(handbook_ids, run_id: str) -> list:
+    """
+        One lease per handbook (locks.py, in our DB so every worker process sees it) 
+            - A handbook still being worked on by an earlier beat run stays claimed so we don't queue it twice 
+            - Claims expire after FAQ_CLAIM_TTL in case a worker died without releasing it
+    """
+    from handbook_app.services.locks import acquire_lock
+
+    return [
+        handbook_id for handbook_id in handbook_ids
+        if acquire_lock(faq_claim_key(handbook_id), settings.FAQ_CLAIM_TTL, token=run_id)
+    ]
+
+
+def release_claim(handbook_id: int):
+    # Released by whichever worker ran the handbook's task (it doesn't know the run's token)
+    Lease.objects.filter(name=faq_claim_key(handbook_id)).delete()
+
+
+def generate_handbook_faqs(handbook_id: int, bucket=None) -> dict:
+    """
+        Generates + saves the FAQ of ONE handbook (what each Celery task runs) 
+            - Returns {'handbook', 'status', 'questions'} --> status: succeeded / skipped / missing
+            - Skips handbooks whose FAQ is newer than their last change so a retried or duplicated task never doubles them up 
+            - A changed handbook gets its old FAQ replaced
+    """
+    from handbook_app.services.clients import get_openai_client
+
+    handbook = Handbook.objects.select_related('company').filter(id=handbook_id).first()
+    if handbook is None:
+        # Deleted since we queued it
+        return {'handbook': handbook_id, 'status': 'missing', 'questions': 0}
+    if handbook.faqs.filter(generated_on__gte=handbook.updated).exists():
+        return {'handbook': handbook_id, 'status': 'skipped', 'questions': 0}
+
+    faqs = build_handbook_faqs(get_openai_client(), handbook, bucket)
+    # Swap old for new in one transaction so readers never see a handbook without FAQ
+    with transaction.atomic():
+        handbook.faqs.all().delete()
+        created = FAQ.objects.bulk_create(faqs)
+    return {'handbook': handbook_id, 'status': 'succeeded', 'questions': len(created)}
+
+
+def summarize_results(results: list) -> dict:
+    # One summary for the whole run out of every per-handbook result
+    summary = {'handbooks': len(results), 'succeeded': 0, 'skipped': 0, 'missing': 0, 'failed': 0, 'questions': 0, 'errors': {}}
+    for result in results:
+        summary[result['status']] += 1
+        summary['questions'] += result['questions']
+        if result['status'] == 'failed':
+            summary['errors'][result['handbook']] = result.get('error', '')
+    return summary
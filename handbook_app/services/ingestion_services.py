@@ -0,0 +1,143 @@
+from django.db.models import F
+from django.utils import timezone
+from handbook_app.models import Handbook, IngestionJob
+
+"""
+    Background ingestion for our Handbook PDFs 
+        - ListCreateHandbook (new handbook) + RetrieveUpdateDestroyHandbook (new PDF) save the file + create an IngestionJob 
+          then hand the job id to Celery 
+        - Celery runs run_ingestion() which walks through: Parse --> Split --> Embed --> Upsert 
+        - A replaced PDF is diffed against what's stored (update_vector): unchanged chunks are skipped, vanished ones deleted 
+
+    Pages are streamed into the splitter and chunks are streamed into ingest() so the stages overlap batch by batch.
+    Every stage writes its counters onto the IngestionJob so our status endpoint could report progress
+"""
+# Saving the job after every single page is a lot of writes so we only save every N pages
+PAGE_PROGRESS_INTERVAL = 25
+
+
+class JobProgress:
+    """
+        Callable handed to pinecone_services.ingest(on_progress=) 
+            - ingest() reports ('split', n), ('embed', n), ('cache', hits) + ('upsert', n) per batch
+    """
+    def __init__(self, job: IngestionJob):
+        self.job = job
+
+    def __call__(self, stage: str, count: int):
+        job = self.job
+        if stage == 'split':
+            # Chunks arrive batch by batch so our total keeps growing until the last page is parsed
+            job.chunks_total += count
+            job.stage = IngestionJob.EMBED
+            job.save(update_fields=['chunks_total', 'stage', 'updated'])
+        elif stage == 'embed':
+            job.chunks_embedded += count
+            job.stage = IngestionJob.UPSERT
+            job.save(update_fields=['chunks_embedded', 'stage', 'updated'])
+        elif stage == 'cache':
+            job.chunks_cached += count
+            job.save(update_fields=['chunks_cached', 'updated'])
+        elif stage == 'upsert':
+            job.chunks_upserted += count
+            # More pages to go means we're heading back into parsing
+            job.stage = IngestionJob.PARSE if job.pages_parsed < job.pages_total else IngestionJob.UPSERT
+            job.save(update_fields=['chunks_upserted', 'stage', 'updated'])
+
+
+def track_pages(job: IngestionJob, pages):
+    # Passes our pages straight through while counting them onto the job
+    for page_text in pages:
+        job.pages_parsed += 1
+        if job.pages_parsed % PAGE_PROGRESS_INTERVAL == 0:
+            job.save(update_fields=['pages_parsed', 'updated'])
+        yield page_text
+    job.save(update_fields=['pages_parsed', 'updated'])
+
+
+def run_ingestion(job_id: int) -> str:
+    from handbook_app.services.pinecone_services import update_vector, get_splitter
+    from handbook_app.services.pdf_services import open_pdf, extract_pages, iter_page_chunks
+    from handbook_app.services.metrics import timed_iter
+
+    job = IngestionJob.objects.select_related('handbook__company').get(id=job_id)
+    job.status = IngestionJob.RUNNING
+    job.stage = IngestionJob.PARSE
+    job.save(update_fields=['status', 'stage', 'updated'])
+
+    try:
+        pdf_file = job.handbook.pdf_file
+        pdf = open_pdf(pdf_file)
+        job.pages_total = pdf.page_count
+        pdf.close()
+        job.save(update_fields=['pages_total', 'updated'])
+
+        # Generators all the way down: pages --> chunks --> batches
+        pages = track_pages(job, timed_iter('ingest.parse', extract_pages(pdf_file)))
+        chunks = iter_page_chunks(pages, get_splitter())
+        handbook = job.handbook
+        # A brand new handbook has nothing stored yet so this is a plain ingest()
+        update_vector(
+            chunks, 
+            handbook.get_pc_namespace(), 
+            prefix=handbook.get_vector_prefix(),
+            metadata=handbook.get_vector_metadata(),
+            # Every chunk lands in our HandbookChunk manifest (with its page range)
+            handbook_id=handbook.id,
+            on_progress=JobProgress(job)
+        )
+
+        mark_succeeded(job)
+    except Exception as e:
+        # We keep the stage as is so the status endpoint shows WHERE it failed
+        job.status = IngestionJob.FAILED
+        job.error = str(e)
+
+    return finish_job(job)
+
+
+def mark_succeeded(job: IngestionJob):
+    job.status = IngestionJob.SUCCEEDED
+    job.stage = IngestionJob.DONE
+    # The handbook is only searchable now so answers cached while we were ingesting are stale
+    # (updated moves too so our FAQ watermark picks it up, see faq_services)
+    Handbook.objects.filter(id=job.handbook_id).update(version=F('version') + 1, updated=timezone.now())
+
+
+def finish_job(job: IngestionJob) -> str:
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'stage', 'error', 'finished', 'updated'])
+    return job.status
+
+
+def ingest_extracted(job: IngestionJob, page_count: int, chunks: list, batch_size: int = 100) -> str:
+    """
+        Same as run_ingestion() for a PDF that was already parsed + split (bulk ingestion) 
+            - Chunks already in our HandbookChunk manifest are skipped (no embed, no upsert) 
+              so re-running an interrupted bulk import only finishes what's missing
+    """
+    from handbook_app.services.pinecone_services import ingest
+
+    handbook = job.handbook
+    job.status = IngestionJob.RUNNING
+    job.stage = IngestionJob.EMBED
+    job.pages_total = job.pages_parsed = page_count
+    job.save(update_fields=['status', 'stage', 'pages_total', 'pages_parsed', 'updated'])
+
+    try:
+        ingest(
+            chunks,
+            handbook.get_pc_namespace(),
+            batch_size=batch_size,
+            on_progress=JobProgress(job),
+            existing_ids=set(handbook.chunks.values_list('vector_id', flat=True)),
+            prefix=handbook.get_vector_prefix(),
+            metadata=handbook.get_vector_metadata(),
+            handbook_id=handbook.id
+        )
+        mark_succeeded(job)
+    except Exception as e:
+        job.status = IngestionJob.FAILED
+        job.error = str(e)
+
+    return finish_job(job)
@@ -0,0 +1,40 @@
+from datetime import timedelta
+from uuid import uuid4
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from handbook_app.models import Lease
+
+"""
+    Lock shared by every process on top of our database (Lease rows) 
+        - Not our cache: LocMemCache (the default) lives inside one process, so a lock taken by one prefork child 
+          would be invisible to the others and could never be released by the child that runs our summary 
+        - The unique Lease.name means exactly one insert wins, everybody else gets None 
+        - A lease expires after ttl seconds in case its owner died without releasing it 
+        - release_lock() only deletes the row if we still own it (our token) so we never free someone else's lock
+"""
+
+
+def acquire_lock(name: str, ttl: int, token: str = None):
+    # Returns our token (keep it to release the lock) or None if someone else holds it
+    token = token or uuid4().hex
+    now = timezone.now()
+    # An expired lease is up for grabs (if two processes race for it, the insert below still lets only one win)
+    Lease.objects.filter(name=name, expires__lte=now).delete()
+    try:
+        with transaction.atomic():
+            Lease.objects.create(name=name, token=token, expires=now + timedelta(seconds=ttl))
+    except IntegrityError:
+        return None
+    return token
+
+
+def release_lock(name: str, token: str) -> bool:
+    # One DELETE ... WHERE token --> atomic, an expired + re-taken lock has another token and is left alone
+    if not token:
+        return False
+    deleted, _ = Lease.objects.filter(name=name, token=token).delete()
+    return bool(deleted)
+
+
+def is_locked(name: str) -> bool:
+    return Lease.objects.filter(name=name, expires__gt=timezone.now()).exists()
@@ -0,0 +1,165 @@
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from threading import Lock
+from django.conf import settings
+
+"""
+    Lightweight stage timing for our question + ingestion pipelines 
+        - `with timed('question.embed'):` records how long that stage took (and whether it raised) 
+        - Per request: every stage is also collected for our Server-Timing header (middleware.ServerTimingMiddleware) 
+        - Per process: count, errors, sum + the last METRICS_WINDOW samples per stage for p50/p95/p99 
+          rendered as Prometheus text by views.Metrics 
+
+    METRICS_ENABLED = False turns timed() into a shared no-op context manager (no clock reads, no locks)
+"""
+QUANTILES = (0.5, 0.95, 0.99)
+_NOOP = nullcontext()
+
+# Stage timings of the request we're serving --> {stage: seconds} (None outside of a request)
+request_timings = ContextVar('request_timings', default=None)
+
+
+class StageStats:
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def quantiles(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    def __init__(self, window: int):
+        self.window = window
+        # (metric, label value) --> StageStats
+        self._stats = {}
+        self._lock = Lock()
+
+    def record(self, metric: str, label: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._stats.get((metric, label))
+            if stats is None:
+                stats = self._stats[(metric, label)] = StageStats(self.window)
+            stats.count += 1
+            stats.total += seconds
+            stats.samples.append(seconds)
+            if error:
+                stats.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                key: {'count': s.count, 'errors': s.errors, 'sum': s.total, 'quantiles': s.quantiles()}
+                for key, s in self._stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+registry = MetricsRegistry(settings.METRICS_WINDOW)
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        registry.record('stage', self.stage, seconds, error=exc_type is not None)
+        timings = request_timings.get()
+        if timings is not None:
+            # A stage could run many times in one request (pages, batches) --> we add them up
+            timings[self.stage] = timings.get(self.stage, 0.0) + seconds
+        return False
+
+
+def timed(stage: str):
+    return _Timer(stage) if settings.METRICS_ENABLED else _NOOP
+
+
+def timed_iter(stage: str, iterable):
+    # Times every next() of a generator (e.g. decoding one PDF page) without changing what it yields
+    if not settings.METRICS_ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with timed(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def server_timing_header(timings: dict) -> str:
+    # Server-Timing: question.embed;dur=12.3, question.llm;dur=840.1 (milliseconds)
+    return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items())
+
+
+def _format_labels(labels: dict) -> str:
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_prometheus(gauges: dict = None) -> str:
+    """
+        Prometheus text format (0.0.4) 
+            - handbook_stage_seconds / handbook_request_seconds: summaries (p50/p95/p99 + _sum + _count) 
+            - *_errors_total: counters 
+            - gauges: {'name': {'label=value' or '': number}} for our cache stats
+    """
+    lines = []
+    snapshot = registry.snapshot()
+    for metric, label_name in (('stage', 'stage'), ('request', 'view')):
+        name = f'handbook_{metric}_seconds'
+        rows = sorted((label, stats) for (kind, label), stats in snapshot.items() if kind == metric)
+        lines.append(f'# HELP {name} Latency per {label_name}')
+        lines.append(f'# TYPE {name} summary')
+        for label, stats in rows:
+            for q, value in stats['quantiles'].items():
+                lines.append(f'{name}{{{_format_labels({label_name: label, "quantile": q})}}} {value:.6f}')
+            lines.append(f'{name}_sum{{{_format_labels({label_name: label})}}} {stats["sum"]:.6f}')
+            lines.append(f'{name}_count{{{_format_labels({label_name: label})}}} {stats["count"]}')
+        lines.append(f'# TYPE handbook_{metric}_errors_total counter')
+        for label, stats in rows:
+            lines.append(f'handbook_{metric}_errors_total{{{_format_labels({label_name: label})}}} {stats["errors"]}')
+
+    for name, values in (gauges or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in values.items():
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect_gauges() -> dict:
+    # Our in-process caches report their counters next to the latencies
+    from handbook_app.services.answer_cache import answer_cache
+    from handbook_app.services.query_embedding_cache import query_embedding_cache
+    from handbook_app.services.faq_services import faq_index
+    from handbook_app.services.single_flight import question_flight
+
+    gauges = {}
+    for prefix, stats in (
+        ('answer_cache', answer_cache.stats()),
+        ('query_embedding_cache', query_embedding_cache.stats()),
+        ('faq_index', faq_index.stats()),
+        ('question_flight', question_flight.stats()),
+    ):
+        for key, value in stats.items():
+            gauges[f'handbook_{prefix}_{key}'] = {'': value}
+    return gauges
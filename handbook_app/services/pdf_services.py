@@ -0,0 +1,232 @@
+import os
+import tempfile
+import multiprocessing
+from collections import deque
+from bisect import bisect_right
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, NamedTuple
+from django.conf import settings
+from handbook_app.services.metrics import timed
+
+"""
+    Streaming PDF text extraction 
+        - iter_pages() yields one page of text at a time instead of building one giant string 
+        - extract_pages() does the same but splits page ranges across a process pool for large PDFs 
+        - iter_chunks() feeds those pages into our splitter incrementally 
+        - iter_page_chunks() does the same but also tells us which pages each chunk came from 
+
+    Peak memory stays around (one page + one chunk) no matter how large the handbook is 
+    and we could start embedding before the last page is even decoded
+"""
+# How much text we collect before running the splitter over our buffer
+#
+# Larger means fewer splitter passes, smaller means a tighter memory ceiling 
+FLUSH_CHARS = 8000
+
+
+def open_pdf(source):
+    """
+        Opens our PDF with fitz from whatever we were handed 
+            - str path 
+            - Django UploadedFile / FieldFile (prefer the on-disk path so fitz doesn't need the whole file in memory)
+            - raw bytes
+    """
+    # Local import for lazy init 
+    import fitz
+
+    if isinstance(source, str):
+        return fitz.open(source)
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype='pdf')
+    # Large uploads are written to a temp file by Django 
+    if hasattr(source, 'temporary_file_path'):
+        return fitz.open(source.temporary_file_path())
+    # FieldFile on local storage 
+    try:
+        return fitz.open(source.path)
+    except (AttributeError, NotImplementedError, ValueError):
+        pass
+    source.seek(0)
+    return fitz.open(stream=source.read(), filetype='pdf')
+
+
+def iter_pages(source) -> Iterator[str]:
+    # Yields the text of every page in order (one page in memory at a time)
+    pdf = open_pdf(source)
+    try:
+        for page in pdf:
+            yield page.get_text()
+    finally:
+        pdf.close()
+
+
+def _extract_range(path: str, start: int, stop: int) -> list:
+    # Runs inside our worker process: every worker opens its own copy of the document from disk
+    import fitz
+
+    with fitz.open(path) as pdf:
+        return [pdf[n].get_text() for n in range(start, stop)]
+
+
+def _pdf_path(source):
+    """
+        Workers need a file they could open on their own 
+            - Returns (path, is_temp) where is_temp means we wrote the file and must clean it up 
+    """
+    if isinstance(source, str):
+        return source, False
+    if hasattr(source, 'temporary_file_path'):
+        return source.temporary_file_path(), False
+    if not isinstance(source, (bytes, bytearray)):
+        try:
+            return source.path, False
+        except (AttributeError, NotImplementedError, ValueError):
+            source.seek(0)
+            source = source.read()
+
+    tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    with tmp:
+        tmp.write(source)
+    return tmp.name, True
+
+
+def extract_pages(source, workers: int = None, min_pages: int = None) -> Iterator[str]:
+    """
+        Extraction engine for large PDFs 
+            - Small files (< min_pages) or a single worker --> serial iter_pages() 
+            - Otherwise split the pages into ranges and hand them to a process pool 
+
+        Pages are still yielded IN ORDER and we only keep a small window of ranges in flight 
+        so a slow consumer (embedding) doesn't make us hold the whole document in memory
+    """
+    workers = workers or settings.PDF_EXTRACT_WORKERS
+    min_pages = min_pages if min_pages is not None else settings.PDF_PARALLEL_MIN_PAGES
+
+    pdf = open_pdf(source)
+    page_count = pdf.page_count
+    pdf.close()
+
+    if workers <= 1 or page_count < min_pages:
+        yield from iter_pages(source)
+        return
+    if multiprocessing.current_process().daemon:
+        # Daemon processes (Celery prefork children) are not allowed to start their own pool
+        print(f'Extracting {page_count} pages serially: running in a daemon process, route ingestion to a --pool=solo worker (CELERY_TASK_ROUTES)')
+        yield from iter_pages(source)
+        return
+
+    # Roughly 4 ranges per worker so a slow range doesn't leave the other workers idle
+    range_size = max(settings.PDF_MIN_PAGES_PER_RANGE, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+
+    path, is_temp = _pdf_path(source)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = iter(ranges)
+            in_flight = deque(pool.submit(_extract_range, path, *r) for r in islice(pending, workers * 2))
+            while in_flight:
+                # Waiting on the OLDEST range keeps our pages in order
+                yield from in_flight.popleft().result()
+                for r in islice(pending, 1):
+                    in_flight.append(pool.submit(_extract_range, path, *r))
+    finally:
+        if is_temp:
+            os.remove(path)
+
+
+class Chunk(NamedTuple):
+    text: str
+    # 1-based pages this chunk was cut from (a chunk could run across a page break)
+    page_start: int
+    page_end: int
+
+
+def iter_page_chunks(pages: Iterable[str], splitter, flush_chars: int = FLUSH_CHARS) -> Iterator[Chunk]:
+    """
+        Incremental chunker 
+            - Collect page text into a buffer until we have at least flush_chars 
+            - Split the buffer and yield every chunk EXCEPT the last one 
+            - The last chunk might continue onto the next page so we carry it over 
+
+        We carry the raw buffer text (not the stripped chunk) so the whitespace between pages survives. 
+        The output is NEAR-identical to splitting the fully concatenated text, not exact: the recursive splitter merges 
+        paragraphs greedily from where its input starts, so around a flush a few chunk boundaries (~10% of chunks at worst 
+        on paragraph heavy text) can land elsewhere. Every chunk still fits chunk_size, comes out in order and together 
+        they cover all of the text (see tests.IterPageChunksTests)
+
+        Page ranges: we remember where every page starts inside our buffer and look up where each chunk sits 
+        (chunks come out in order so we only search forward from the previous one)
+    """
+    buffer = ''
+    # Offsets (inside buffer) where each page starts + the page number of the first one
+    page_offsets = []
+    first_page = 1
+    page_number = 0
+
+    def located(chunks):
+        cursor = 0
+        for chunk in chunks:
+            position = buffer.find(chunk, cursor)
+            if position == -1:
+                position = cursor
+            cursor = position + 1
+            start = bisect_right(page_offsets, position) - 1
+            end = bisect_right(page_offsets, position + max(len(chunk) - 1, 0)) - 1
+            yield Chunk(chunk, first_page + max(start, 0), first_page + max(end, 0)), position
+
+    for page_text in pages:
+        page_number += 1
+        page_offsets.append(len(buffer))
+        buffer += page_text
+        if len(buffer) < flush_chars:
+            continue
+
+        with timed('ingest.split'):
+            chunks = splitter.split_text(buffer)
+        if len(chunks) < 2:
+            continue
+        for chunk, _ in located(chunks[:-1]):
+            yield chunk
+
+        carry_start = buffer.rfind(chunks[-1])
+        if carry_start == -1:
+            buffer, page_offsets, first_page = chunks[-1], [0], page_number
+            continue
+        # Drop the pages that are entirely before our carried over text
+        kept = bisect_right(page_offsets, carry_start) - 1
+        first_page += kept
+        page_offsets = [0] + [offset - carry_start for offset in page_offsets[kept + 1:]]
+        buffer = buffer[carry_start:]
+
+    if buffer:
+        with timed('ingest.split'):
+            chunks = splitter.split_text(buffer)
+        for chunk, _ in located(chunks):
+            yield chunk
+
+
+def iter_chunks(pages: Iterable[str], splitter, flush_chars: int = FLUSH_CHARS) -> Iterator[str]:
+    # Same as iter_page_chunks() for callers that only want the text
+    for chunk in iter_page_chunks(pages, splitter, flush_chars):
+        yield chunk.text
+
+
+def extract_chunks(path: str) -> tuple:
+    """
+        Whole PDF --> (page_count, [Chunk]) in one call 
+            - Runs inside a bulk ingestion worker process (one PDF per worker, see bulk_ingestion.py) 
+            - Every chunk is returned at once so only use this when many PDFs are spread over a pool
+    """
+    from handbook_app.services.pinecone_services import get_splitter
+
+    page_count = 0
+
+    def counted(pages):
+        nonlocal page_count
+        for page_text in pages:
+            page_count += 1
+            yield page_text
+
+    chunks = list(iter_page_chunks(counted(iter_pages(path)), get_splitter()))
+    return page_count, chunks
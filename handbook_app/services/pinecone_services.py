@@ -1,70 +1,274 @@
-from pinecone import Pinecone
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_pinecone import PineconeVectorStore
+import hashlib
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
 from django.conf import settings
+from handbook_app.services.fanout import query_namespaces
+from handbook_app.services.metrics import timed
 
-pc = Pinecone(api_key=settings.PINECONE_API_KEY, environment='us-east-1')
-_index = pc.Index(settings.PINECONE_INDEX)
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=settings.OPENAI_API_KEY)
-_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+# Our ingestion runs inside Celery workers --> logging (not print) so it shows up in the worker's log
+logger = logging.getLogger(__name__)
 
-# Create a function to return our index and/or pinecone client 
-def get_index():
-    return _index 
+"""
+    Our service singletons are built on first use, NOT at import 
+        - Importing this module (manage.py, Celery boot, views) never loads LangChain/Pinecone/numpy 
+          or needs API keys; only the first ingest/question pays for it 
+        - Double checked locking so two threads asking at once still share ONE client 
+        - Celery builds them up front per worker process (warm_up(), see handbook/celery.py)
+"""
+EMBEDDING_MODEL = "text-embedding-3-small"
+_lock = Lock()
+_backend = None
+_embeddings = None
+_splitter = None
+
+# Create a function to return our vector backend (see vector_backends.VectorBackend)
+#
+# Pinecone in production, local memory-mapped index when VECTOR_BACKEND = 'local'
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                # Local import for lazy init 
+                from handbook_app.services.vector_backends import build_backend
+                _backend = build_backend()
+    return _backend 
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                _embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+    return _embeddings
 
 def get_splitter():
+    global _splitter
+    if _splitter is None:
+        with _lock:
+            if _splitter is None:
+                from langchain_text_splitters import RecursiveCharacterTextSplitter
+                _splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
     return _splitter
 
-def get_pinecone():
-    return pc 
-
-def ingest(text: str, ns: str):
-    pdf_splitter = get_splitter().create_documents([text])
-    vectorstore = PineconeVectorStore.from_documents(
-        documents=pdf_splitter,
-        embedding=embeddings,
-        # Make sure its index_name= not just index=
-        index_name=settings.PINECONE_INDEX,
-        # Namespace to label our files based on different companies
-        namespace=ns)
-    return vectorstore
-
-def question(q: str, ns: list, top_k: int = 3, temp: int = 0):
-    # Local import for lazy init 
-    from openai import OpenAI
+def warm_up():
+    # Builds every singleton now instead of on the first request (our token encoder + pooled OpenAI client too)
+    from handbook_app.services.clients import get_openai_client
+    from handbook_app.services.context_builder import get_encoder
 
-    # We only need the Client in this function so let's avoid building this object when its unnecessary
-    ai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    get_backend()
+    get_embeddings()
+    get_splitter()
+    get_openai_client()
+    get_encoder()
 
-    # Embed  our qestion and build context for our LLM
-    # 
-    # This is exactly the same as using your: client.embeddings.create(model='model', input="Question here") 
-    question_embedded = embeddings.embed_query(q)
+def split_text(text: str) -> list:
+    # Splitting our PDF text into chunks that are small enough to embed 
+    return get_splitter().split_text(text)
 
-    # Using our index to query taking top K results.
+def batched(iterable, size: int):
+    # Groups any iterable (lists or generators) into lists of `size` without loading everything at once
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def chunk_ids(chunks: list, seen: Counter, prefix: str = '') -> list:
+    """
+        Deterministic vector IDs --> sha256(text) + occurrence 
+            - The same chunk always gets the same ID so re-ingesting a revised PDF could diff against what's already stored 
+            - occurrence (how many times we've seen that exact text so far) keeps repeated boilerplate chunks unique
+        - prefix (Handbook.get_vector_prefix) scopes the IDs to one handbook inside a shared company namespace
+
+        We don't use the raw chunk position because one inserted paragraph would shift every ID after it
+    """
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:32]
+        ids.append(f'{prefix}{digest}-{seen[digest]}')
+        seen[digest] += 1
+    return ids
+
+def list_ids(ns: str, prefix: str = '') -> set:
+    # list() pages through every vector id in our namespace (no dummy vector query needed)
     #
-    # We've included metadata to grab the messages
-    # 
-    # We're using namespace to query the specific company's information ONLY 
-    mass_results = []
-    for namespace in ns:
-        res = get_index().query(
-            vector=question_embedded,
-            top_k=top_k,
-            include_metadata=True,
-            namespace=namespace
-        )
-        # res is an object with matches array so we extend this into our current mass_results array
-        mass_results.extend(res['matches'])
+    # With a prefix we only get ONE handbook's vectors out of a shared company namespace
+    ids = set()
+    for page in get_backend().list(ns, prefix):
+        ids.update(page)
+    return ids
+
+def retry_call(label: str, fn, *args, retries: int = None, delay: float = None):
+    """
+        Calls fn(*args), retrying failures with exponential backoff (delay, 2x delay, 4x delay ...) 
+            - Used per embed/upsert batch so one flaky request doesn't fail the whole handbook 
+            - Both are safe to repeat (same ids --> Pinecone overwrites, embeddings are deterministic)
+    """
+    retries = settings.INGEST_MAX_RETRIES if retries is None else retries
+    delay = settings.INGEST_RETRY_DELAY if delay is None else delay
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.warning('%s failed (%s), retry %d/%d in %.1fs', label, e, attempt + 1, retries, delay * 2 ** attempt)
+            time.sleep(delay * 2 ** attempt)
 
-    # Because we concat all of our matches we need to sort by score 
-    mass_results.sort(key= lambda m : m['score'], reverse=True)
-    # Based off of our k value we take the best 3 results 
-    top_mass_results = mass_results[:top_k]
+def _embed_batch(texts: list) -> list:
+    # Runs on an embed thread: ONLY the OpenAI request (our embedding cache's DB work stays on the ingest thread)
+    with timed('ingest.embed'):
+        return retry_call('Embedding batch', get_embeddings().embed_documents, texts)
+
+def _upsert_batch(vectors: list, ns: str):
+    with timed('ingest.upsert'):
+        retry_call('Upsert batch', get_backend().upsert, vectors, ns)
+
+def ingest(chunks, ns: str, batch_size: int = None, on_progress=None, existing_ids: set = None, prefix: str = '', metadata: dict = None, handbook_id: int = None,
+           upsert_batch_size: int = None, embed_concurrency: int = None, upsert_concurrency: int = None):
+    """
+        Embed + Ingest our chunks 
+            - chunks could be a list OR a generator (pdf_services.iter_chunks) so we embed while the PDF is still being read
+            - We embed + upsert in batches instead of PineconeVectorStore.from_documents so we could report progress 
+            - on_progress(stage, count) is called after each step per batch (used by our IngestionJob)
+            - Embeddings go through our cache so unchanged chunks never hit OpenAI again 
+            - existing_ids: IDs already in the namespace, those chunks are skipped entirely (no embed, no upsert)
+            - prefix + metadata: scope our vectors to one handbook in a shared company namespace (see Handbook.get_vector_prefix)
+            - handbook_id: record every chunk in our HandbookChunk manifest (chunks could be pdf_services.Chunk to keep their pages)
+
+        Pipeline: split (this thread) --> embed (embed_concurrency batches of batch_size at once) 
+                  --> upsert (upsert_concurrency requests of upsert_batch_size at once) 
+            - At most INGEST_QUEUE_SIZE embedded upsert batches wait between the two stages (backpressure) 
+            - Every embed/upsert batch is retried on its own (INGEST_MAX_RETRIES) 
+            - Our manifest + progress are written in PDF order, only once ALL of a batch's upserts landed 
+              so the manifest never lists a vector that isn't stored (bulk ingestion resumes from it)
+
+        Metadata keeps the same 'text' key LangChain used so question() could still read ['metadata']['text']
+        Returns {'chunks': N, 'upserted': N, 'cache_hits': N, 'cache_lookups': N, 'hit_ratio': 0-1, 'ids': set of every chunk id} 
+            - hit_ratio = cache_hits / cache_lookups (the chunks we looked up in our embedding cache)
+    """
+    batch_size = batch_size or settings.INGEST_EMBED_BATCH
+    upsert_batch_size = upsert_batch_size or settings.INGEST_UPSERT_BATCH
+    embed_concurrency = max(1, embed_concurrency or settings.INGEST_EMBED_CONCURRENCY)
+    upsert_concurrency = max(1, upsert_concurrency or settings.INGEST_UPSERT_CONCURRENCY)
+    from handbook_app.services.embedding_cache import lookup_cached, store_cached
+
+    existing_ids = existing_ids or set()
+    metadata = metadata or {}
+    seen = Counter()
+    all_ids = set()
+    totals = {'chunks': 0, 'upserted': 0, 'cache_hits': 0, 'cache_lookups': 0}
+
+    # Embedded upsert batches allowed in flight / waiting on a free upsert thread
+    queue_slots = BoundedSemaphore(max(upsert_concurrency, settings.INGEST_QUEUE_SIZE))
+    # (batch, ids, start_index, new_chunks, cache lookup or None, embed future or None) oldest first
+    embedding = deque()
+    # (batch, ids, start_index, upserted count, upsert futures) oldest first
+    upserting = deque()
+
+    def queue_upserts(upsert_pool):
+        batch, ids, start_index, new_chunks, lookup, future = embedding.popleft()
+        futures = []
+        if new_chunks:
+            new_vectors = future.result() if future is not None else []
+            if lookup is not None:
+                batch_vectors, hits = store_cached(EMBEDDING_MODEL, *lookup, new_vectors)
+            else:
+                batch_vectors, hits = new_vectors, 0
+            totals['cache_hits'] += hits
+            if on_progress:
+                on_progress('embed', len(new_chunks))
+                on_progress('cache', hits)
+            vectors = [
+                {'id': vector_id, 'values': values, 'metadata': {'text': chunk, **metadata}}
+                for (vector_id, chunk), values in zip(new_chunks, batch_vectors)
+            ]
+            for part in batched(vectors, upsert_batch_size):
+                # Blocks while our queue is full --> we stop embedding until the upserts catch up
+                queue_slots.acquire()
+                upsert = upsert_pool.submit(_upsert_batch, part, ns)
+                upsert.add_done_callback(lambda _: queue_slots.release())
+                futures.append(upsert)
+        upserting.append((batch, ids, start_index, len(new_chunks), futures))
+
+    def record_finished(wait: bool):
+        while upserting and (wait or all(f.done() for f in upserting[0][4])):
+            batch, ids, start_index, count, futures = upserting.popleft()
+            for upsert in futures:
+                # Raises the batch's error once it ran out of retries
+                upsert.result()
+            totals['upserted'] += count
+            if count and on_progress:
+                on_progress('upsert', count)
+            # Unchanged chunks are recorded too, their position in the PDF may have moved
+            if handbook_id is not None:
+                from handbook_app.services.chunk_manifest import build_rows, record_chunks
+                with timed('ingest.manifest'):
+                    record_chunks(build_rows(handbook_id, ids, batch, start_index))
+
+    with ThreadPoolExecutor(max_workers=embed_concurrency) as embed_pool, ThreadPoolExecutor(max_workers=upsert_concurrency) as upsert_pool:
+        try:
+            for batch in batched(chunks, batch_size):
+                start_index = totals['chunks']
+                totals['chunks'] += len(batch)
+                if on_progress:
+                    on_progress('split', len(batch))
+
+                texts = [getattr(chunk, 'text', chunk) for chunk in batch]
+                ids = chunk_ids(texts, seen, prefix)
+                all_ids.update(ids)
+                # Only the chunks that aren't already stored need to be embedded + upserted
+                new_chunks = [(vector_id, chunk) for vector_id, chunk in zip(ids, texts) if vector_id not in existing_ids]
+                lookup = future = None
+                if new_chunks:
+                    to_embed = [chunk for _, chunk in new_chunks]
+                    if settings.EMBEDDING_CACHE_ENABLED:
+                        # Cached chunks never leave this thread, only the misses go to OpenAI
+                        lookup = lookup_cached(to_embed, EMBEDDING_MODEL)
+                        totals['cache_lookups'] += len(to_embed)
+                        to_embed = list(lookup[2].values())
+                    future = embed_pool.submit(_embed_batch, to_embed) if to_embed else None
+                embedding.append((batch, ids, start_index, new_chunks, lookup, future))
+
+                # Oldest embed first so everything downstream stays in PDF order
+                while len(embedding) > embed_concurrency or (embedding and embedding[0][5] is None):
+                    queue_upserts(upsert_pool)
+                record_finished(wait=False)
+
+            while embedding:
+                queue_upserts(upsert_pool)
+            record_finished(wait=True)
+        except BaseException:
+            # Don't start batches nobody is waiting for anymore
+            embed_pool.shutdown(cancel_futures=True)
+            upsert_pool.shutdown(cancel_futures=True)
+            raise
+
+    if settings.EMBEDDING_CACHE_ENABLED:
+        from handbook_app.services.embedding_cache import evict
+        evict()
+
+    total, upserted, cache_hits, lookups = totals['chunks'], totals['upserted'], totals['cache_hits'], totals['cache_lookups']
+    hit_ratio = cache_hits / lookups if lookups else 0.0
+    logger.info(
+        'Ingested %d chunks into %s: %d upserted, %d unchanged (embedding cache hit ratio: %.0f%% of %d lookups)',
+        total, ns, upserted, total - upserted, hit_ratio * 100, lookups
+    )
+    return {'chunks': total, 'upserted': upserted, 'cache_hits': cache_hits, 'cache_lookups': lookups, 'hit_ratio': hit_ratio, 'ids': all_ids}
 
-    # Building the context for our LLM 
-    context = "\n\n".join(m['metadata']['text'] for m in top_mass_results)
+def build_prompt(q: str, matches: list) -> str:
+    # Building the context for our LLM (overlaps removed + capped at CONTEXT_TOKEN_BUDGET)
+    from handbook_app.services.context_builder import build_context
+
+    context = build_context(matches)
 
     prompt = f"""
     You are an assistant with access to the following context from a document:
@@ -74,58 +278,149 @@ def question(q: str, ns: list, top_k: int = 3, temp: int = 0):
     Answer the question based only on the above context.
     Question: {q}
     """
+    return prompt
+
+def embed_question(q: str) -> list:
+    # Same as embeddings.embed_query(q) but through our pooled client (one connection pool per process)
+    #
+    # Repeated questions come out of our query embedding cache instead of OpenAI
+    from handbook_app.services.clients import get_openai_client
+
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        from handbook_app.services.query_embedding_cache import query_embedding_cache
+        cached = query_embedding_cache.get(EMBEDDING_MODEL, q)
+        if cached is not None:
+            return cached
+
+    res = get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=q)
+    vector = res.data[0].embedding
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        query_embedding_cache.set(EMBEDDING_MODEL, q, vector)
+    return vector
+
+def prepare_question(q: str, ns: list, top_k: int = 3, metadata_filter: dict = None, cache_scope: str = None,
+                     company_id: int = None, handbook_ids: list = None, question_embedded: list = None):
+    """
+        Everything BEFORE the LLM call: Embed --> (Answer cache) --> (FAQ answers) --> Query namespaces 
+            - Returns (question_embedded, matches, cached_answer)
+            - cached_answer is not None when our semantic answer cache or a precomputed FAQ answer of company_id 
+              (optionally only these handbook_ids) already knows the answer (matches is empty then)
+            - question_embedded: skip embedding when the caller already has it (FAQ generation embeds in batches)
+
+        Shared by question() and our streaming endpoint (streaming_services)
+    """
+    # Embed  our qestion and build context for our LLM
+    if question_embedded is None:
+        with timed('question.embed'):
+            question_embedded = embed_question(q)
+
+    if cache_scope and settings.ANSWER_CACHE_ENABLED:
+        from handbook_app.services.answer_cache import answer_cache
+        with timed('question.answer_cache'):
+            cached_answer = answer_cache.get(cache_scope, question_embedded)
+        if cached_answer is not None:
+            return question_embedded, [], cached_answer
+
+    if company_id and settings.FAQ_ANSWERS_ENABLED:
+        from handbook_app.services.faq_services import match_faq
+        with timed('question.faq_match'):
+            faq_answer = match_faq(company_id, question_embedded, handbook_ids)
+        if faq_answer is not None:
+            return question_embedded, [], faq_answer
+
+    # Using our index to query taking top K results.
+    #
+    # We've included metadata to grab the messages
+    # 
+    # We're using namespace to query the specific company's information ONLY 
+    # Every namespace is queried concurrently then merged with a heap --> our best top_k across ALL handbooks
+    #
+    # With the 'company' layout ns is a single namespace and metadata_filter narrows it down to a subset of handbooks
+    with timed('question.vector_query'):
+        top_mass_results = query_namespaces(get_backend(), question_embedded, ns, top_k, include_metadata=True, filter=metadata_filter)
+    return question_embedded, top_mass_results, None
+
+def remember_answer(cache_scope: str, question_embedded: list, answer: str):
+    if cache_scope and settings.ANSWER_CACHE_ENABLED:
+        from handbook_app.services.answer_cache import answer_cache
+        answer_cache.set(cache_scope, question_embedded, answer)
+
+def question(q: str, ns: list, top_k: int = 3, temp: int = 0, metadata_filter: dict = None, cache_scope: str = None,
+             company_id: int = None, handbook_ids: list = None, question_embedded: list = None):
+    """
+        Embed --> (Answer cache) --> (FAQ answers) --> Query namespaces --> Prompt --> LLM 
+            - cache_scope (answer_cache.build_scope) turns on our semantic answer cache: 
+              a close enough question asked before for the same handbook versions skips retrieval + the LLM
+            - company_id turns on our precomputed FAQ answers (see prepare_question)
+    """
+    # Local import for lazy init 
+    from handbook_app.services.clients import get_openai_client
 
-    ai_response = ai_client.chat.completions.create(
-        model='gpt-4o',
-        messages=[{'role':'user', 'content': prompt}],
-        # We want 0 because its more direct and a 1-to-1 answer no fluff
-        temperature=temp
+    question_embedded, matches, cached_answer = prepare_question(
+        q, ns, top_k, metadata_filter, cache_scope, company_id, handbook_ids, question_embedded
     )
+    if cached_answer is not None:
+        return cached_answer
 
-    return ai_response.choices[0].message.content
+    with timed('question.prompt'):
+        prompt = build_prompt(q, matches)
+
+    # Pooled client: built once per process instead of a new connection pool (+ TLS handshake) per question
+    with timed('question.llm'):
+        ai_response = get_openai_client().chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role':'user', 'content': prompt}],
+            # We want 0 because its more direct and a 1-to-1 answer no fluff
+            temperature=temp
+        )
+
+    answer = ai_response.choices[0].message.content
+    remember_answer(cache_scope, question_embedded, answer)
+    return answer
 
 # Update & Delete: Helper Functions 
 def delete_vector(namespace: str):
     # In order to Update we'll need to remove the original 
-    #
-    # Instead of using pinecone.delete_index(name=) --> Actually deleted the entire index
-    # We use index.delete(namespace=)
-    get_index().delete(delete_all=True, namespace=namespace)
+    get_backend().delete_namespace(namespace)
 
 
-def update_vector(text: str, ns: str, new_ns: str = None):
-    # For us to "Update", we actually have to Delete the old vectors and reingest 
+def delete_ids(ids, ns: str, batch_size: int = 1000):
+    # Pinecone caps deletes at 1000 IDs per request
+    for batch in batched(ids, batch_size):
+        get_backend().delete(batch, ns)
+
+def delete_vectors(ns: str, prefix: str = ''):
+    # No prefix --> the namespace belongs to one handbook so we drop all of it
     #
-    # We could loop through all vectors and replace them but the question is "What if our users upload a whole different file...?"
-    delete_vector(ns)
+    # Prefix --> shared company namespace, ONLY remove this handbook's vectors
+    if not prefix:
+        delete_vector(ns)
+        return
+    delete_ids(list_ids(ns, prefix), ns)
+
+def update_vector(chunks, ns: str, new_ns: str = None, prefix: str = '', metadata: dict = None, handbook_id: int = None, on_progress=None):
+    """
+        Diff based update --> our namespace stays queryable the whole time 
+            - Same namespace: upsert ONLY the chunks we don't have yet, then delete ONLY the IDs that disappeared 
+            - New namespace: fill the new namespace first, then drop the old one 
 
-    # # Reingest new content depending on the namespace 
+        Because our IDs are deterministic (see chunk_ids) an unchanged chunk keeps its ID across uploads 
+        so the work is proportional to how much of the PDF actually changed
+    """
     targeted_namespace = new_ns if new_ns else ns 
-    ingest(text, targeted_namespace)
 
-def update_namespace(old_ns: str, new_ns: str):
-    # Copies the vectors into new namespace 
-    #
-    # Fetch Current Vector --> Upsert into new namespace 
-    current_vectors = get_index().query(
-        # Placeholder but 1536 is our dimension
-        vector=[0.0] * 1536,
-        # Fetching All Values 
-        top_k=10000,    # Enough to grab all values in our Vectors 
-        include_values=True,
-        include_metadata=True,
-        namespace=old_ns
+    previous_ids = list_ids(targeted_namespace, prefix)
+    stats = ingest(
+        chunks, targeted_namespace, on_progress=on_progress, existing_ids=previous_ids, prefix=prefix, metadata=metadata, handbook_id=handbook_id
     )
+    # Anything that was there before but isn't part of the new PDF gets removed (old uuid IDs included)
+    removed_ids = previous_ids - stats['ids']
+    delete_ids(removed_ids, targeted_namespace)
+    if handbook_id is not None:
+        from handbook_app.services.chunk_manifest import forget_chunks
+        forget_chunks(handbook_id, removed_ids)
 
-    # Copy over the ID, values and metadata (where the texts are )
-    # 
-    # Be sure you're iterating over the matches NOT the query object itself
-    transformed_vectors = [
-        {"id": v["id"], "values": v["values"], "metadata": v['metadata']}
-        for v in current_vectors['matches']
-    ]
-
-    # Removing the old namespace vector 
-    delete_vector(namespace=old_ns)
-    # Update Insert (Creates one if not exists) --> It's going to 
-    get_index().upsert(vectors=transformed_vectors, namespace=new_ns)
+    # Only drop the old namespace once the new one is fully populated
+    if targeted_namespace != ns:
+        delete_vectors(ns, prefix)
+    logger.info('Updated %s: %d chunks added, %d removed', targeted_namespace, stats['upserted'], len(removed_ids))
@@ -0,0 +1,133 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+from handbook_app.services.embedding_cache import to_bytes, from_bytes
+
+"""
+    Query embedding cache for our question endpoints 
+        - The same question ("how many pto days do i get?") used to be embedded by OpenAI on every request 
+        - Key = sha256(model + normalized question) so case / extra whitespace don't count as a new question 
+        - Values are float32 bytes (6KB for 1536 dims instead of ~40KB of python floats) 
+
+    Two layers: 
+        1) In-process LRU + TTL (QUERY_EMBEDDING_CACHE_MAX_ENTRIES / QUERY_EMBEDDING_CACHE_TTL) 
+        2) Optional shared Django cache (QUERY_EMBEDDING_CACHE_SHARED) so every worker benefits from one embedding 
+"""
+SHARED_KEY_PREFIX = 'qemb:'
+
+
+def normalize_question(q: str) -> str:
+    return ' '.join(q.casefold().split())
+
+
+def question_key(model: str, q: str) -> str:
+    return hashlib.sha256(f'{model}\n{normalize_question(q)}'.encode('utf-8')).hexdigest()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int, ttl: float, shared: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        # key --> (float32 bytes, created) (order = least --> most recently used)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, created = entry
+            if time.monotonic() - created > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            self.local_hits += 1
+            return data
+
+    def _set_local(self, key: str, data: bytes):
+        with self._lock:
+            self._entries[key] = (data, time.monotonic())
+            self._entries.move_to_end(key)
+            # LRU: drop the least recently used entries over our limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _count_shared(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, model: str, q: str):
+        # Returns the cached embedding (list of floats) or None
+        key = question_key(model, q)
+        data = self._get_local(key)
+        if data is None and self.shared:
+            data = cache.get(SHARED_KEY_PREFIX + key)
+            self._count_shared(data is not None)
+            if data is not None:
+                self._set_local(key, data)
+        elif data is None:
+            self._count_shared(False)
+        return from_bytes(data) if data is not None else None
+
+    def set(self, model: str, q: str, vector):
+        key = question_key(model, q)
+        data = to_bytes(vector)
+        self._set_local(key, data)
+        if self.shared:
+            cache.set(SHARED_KEY_PREFIX + key, data, timeout=self.ttl)
+
+    async def aget(self, model: str, q: str):
+        # Same as get() but the shared layer is awaited (Django's async cache API)
+        key = question_key(model, q)
+        data = self._get_local(key)
+        if data is None and self.shared:
+            data = await cache.aget(SHARED_KEY_PREFIX + key)
+            self._count_shared(data is not None)
+            if data is not None:
+                self._set_local(key, data)
+        elif data is None:
+            self._count_shared(False)
+        return from_bytes(data) if data is not None else None
+
+    async def aset(self, model: str, q: str, vector):
+        key = question_key(model, q)
+        data = to_bytes(vector)
+        self._set_local(key, data)
+        if self.shared:
+            await cache.aset(SHARED_KEY_PREFIX + key, data, timeout=self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+    shared=settings.QUERY_EMBEDDING_CACHE_SHARED,
+)
@@ -0,0 +1,37 @@
+import time
+from threading import Lock
+
+"""
+    Token bucket so our threads don't hammer the OpenAI API all at once 
+        - The bucket refills at `rate` tokens per second up to `capacity` (how big a burst we allow) 
+        - acquire() takes a token, waiting for the next refill when the bucket is empty 
+
+    One bucket is shared by every thread of a process
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        # acquire() waits (missing tokens / rate) seconds so a bucket that never refills would divide by zero
+        if rate <= 0:
+            raise ValueError(f'rate must be > 0 tokens per second (got {rate})')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1):
+        # Blocks until we're allowed to make our call (we sleep OUTSIDE the lock so other threads can check in)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
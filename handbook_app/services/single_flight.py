@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import time
+import weakref
+from threading import Event, Lock
+from django.conf import settings
+from django.core.cache import cache
+from handbook_app.services.locks import acquire_lock, release_lock, is_locked
+
+"""
+    Single-flight for our question endpoints 
+        - An HR announcement goes out and hundreds of employees ask the same thing within seconds 
+        - Identical (company scope, normalized question) requests that arrive while one is already being answered 
+          wait for THAT answer instead of each running embed + vector queries + gpt-4o 
+
+    Threads: the first request (leader) runs the work, the others (followers) wait on an Event for its result/error. 
+    Processes (QUESTION_COALESCE_SHARED): the leader also holds a lock (locks.py) and publishes its answer to our Django cache 
+    for QUESTION_COALESCE_RESULT_TTL seconds, leaders of other processes wait for it instead of running the work again. 
+    Async (ado): same idea with one asyncio Task per key on the running event loop, in-process only 
+    (QUESTION_COALESCE_SHARED is sync-only: its lock + cache polling would block the event loop). 
+
+    Followers never wait longer than wait_timeout (QUESTION_COALESCE_WAIT), after that they answer it themselves.
+"""
+_MISSING = object()
+RESULT_KEY_PREFIX = 'flight:result:'
+
+
+def flight_key(cache_scope: str, q: str) -> str:
+    # Scope = company + handbook versions + requested subset (answer_cache.build_scope), so only truly identical asks are merged
+    from handbook_app.services.query_embedding_cache import normalize_question
+    return hashlib.sha256(f'{cache_scope}\n{normalize_question(q)}'.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, shared: bool = False, wait_timeout: float = 30, result_ttl: int = 5, poll_interval: float = 0.05):
+        self.shared = shared
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = Lock()
+        # Every loop gets its own {key: Future}
+        self._async_calls = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.followers = 0
+        self.shared_followers = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def do(self, key: str, fn):
+        # Runs fn() once for every thread asking for the same key at the same time
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.followers += 1
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                # The leader is stuck --> we answer it ourselves
+                self._count('leaders')
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run(self, key: str, fn):
+        if not self.shared:
+            self._count('leaders')
+            return fn()
+
+        result_key = RESULT_KEY_PREFIX + key
+        # Another process may have JUST answered it
+        result = cache.get(result_key, _MISSING)
+        if result is not _MISSING:
+            self._count('shared_followers')
+            return result
+
+        token = acquire_lock(f'flight:{key}', int(self.wait_timeout) + 1)
+        if token is None:
+            # Another process is answering it --> wait for its answer
+            result = self._wait_shared(key)
+            if result is not _MISSING:
+                self._count('shared_followers')
+                return result
+            # It failed or took too long, we answer it ourselves
+            self._count('leaders')
+            return fn()
+
+        try:
+            self._count('leaders')
+            result = fn()
+            cache.set(result_key, result, timeout=self.result_ttl)
+            return result
+        finally:
+            release_lock(f'flight:{key}', token)
+
+    def _wait_shared(self, key: str):
+        result_key = RESULT_KEY_PREFIX + key
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            result = cache.get(result_key, _MISSING)
+            if result is not _MISSING:
+                return result
+            if not is_locked(f'flight:{key}'):
+                # The leader is gone: one last look in case it published right before releasing
+                return cache.get(result_key, _MISSING)
+            time.sleep(self.poll_interval)
+        return _MISSING
+
+    async def ado(self, key: str, fn):
+        """
+            Async twin of do(): fn is an async function, coalesced per event loop 
+                - The work runs in its own Task and everybody awaits it through asyncio.shield(), so a leader whose 
+                  client disconnects (cancelled) doesn't cancel the answer its followers are waiting for 
+                - Followers give up after wait_timeout and answer it themselves
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            self._count('leaders')
+            task = calls[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: self._async_done(calls, key, done))
+            return await asyncio.shield(task)
+
+        self._count('followers')
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._count('leaders')
+            return await fn()
+
+    @staticmethod
+    def _async_done(calls: dict, key: str, task):
+        if calls.get(key) is task:
+            del calls[key]
+        if not task.cancelled():
+            # Mark it retrieved so asyncio doesn't warn when every waiter was cancelled
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'shared_followers': self.shared_followers,
+        }
+
+
+question_flight = SingleFlight(
+    shared=settings.QUESTION_COALESCE_SHARED,
+    wait_timeout=settings.QUESTION_COALESCE_WAIT,
+    result_ttl=settings.QUESTION_COALESCE_RESULT_TTL,
+)
@@ -0,0 +1,73 @@
+import json
+import time
+from django.conf import settings
+from handbook_app.services.metrics import registry
+
+"""
+    Server-Sent Events for our question endpoint 
+        - Retrieval (embedding + vector queries) still happens in the view 
+        - The LLM answer is streamed token by token from an ASYNC generator 
+
+    Under ASGI (handbook/asgi.py) Django iterates an async generator on the event loop, so a slow 
+    5-10s generation doesn't hold onto a sync worker thread for the whole stream 
+
+    Events (in order):
+        event: sources --> {"namespaces": [...], "handbook_ids": [...]} 
+        event: token   --> {"text": "..."} (many)
+        event: done    --> {"answer": "...", "cached": bool} 
+        event: error   --> {"msg": "...", "err": "..."} (only if something fails mid-stream)
+"""
+
+def sse_event(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def sources_payload(matches: list) -> dict:
+    # Unique + in score order (best source first)
+    namespaces = list(dict.fromkeys(m.get('namespace') for m in matches if m.get('namespace')))
+    handbook_ids = list(dict.fromkeys(m['metadata']['handbook_id'] for m in matches if 'handbook_id' in m['metadata']))
+    return {'namespaces': namespaces, 'handbook_ids': handbook_ids}
+
+
+async def stream_answer(q: str, question_embedded: list, matches: list, cached_answer: str = None, cache_scope: str = None, temp: int = 0):
+    # Local import for lazy init 
+    from handbook_app.services.clients import get_async_openai_client
+    from handbook_app.services.pinecone_services import build_prompt, remember_answer
+
+    yield sse_event('sources', sources_payload(matches))
+
+    # Our answer cache already knew this one --> one token + done
+    if cached_answer is not None:
+        yield sse_event('token', {'text': cached_answer})
+        yield sse_event('done', {'answer': cached_answer, 'cached': True})
+        return
+
+    # Our response headers are long gone once we stream, so the LLM time only goes to our metrics endpoint
+    start = time.perf_counter()
+    try:
+        stream = await get_async_openai_client().chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role': 'user', 'content': build_prompt(q, matches)}],
+            temperature=temp,
+            stream=True
+        )
+
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+    except Exception as e:
+        if settings.METRICS_ENABLED:
+            registry.record('stage', 'question.llm', time.perf_counter() - start, error=True)
+        yield sse_event('error', {'msg': "LLM Model failed to answer question", 'err': str(e)})
+        return
+    if settings.METRICS_ENABLED:
+        registry.record('stage', 'question.llm', time.perf_counter() - start)
+
+    answer = ''.join(parts)
+    remember_answer(cache_scope, question_embedded, answer)
+    yield sse_event('done', {'answer': answer, 'cached': False})
@@ -0,0 +1,402 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+import numpy as np
+from django.conf import settings
+
+"""
+    Vector store backends
+        - VectorBackend is the interface the rest of our service layer talks to
+        - PineconeBackend wraps our Pinecone index (production)
+        - LocalBackend keeps float32 vectors per namespace in memory-mapped files (air-gapped testing + benchmarks)
+
+    Pick one with settings.VECTOR_BACKEND = 'pinecone' | 'local'
+
+    Matches are always plain dicts: {'id', 'score', 'metadata', 'values' (optional)}
+"""
+
+
+class VectorBackend:
+    """
+        Everything our services need from a vector store
+            - upsert(vectors, namespace) where vectors = [{'id', 'values', 'metadata'}]
+            - query(vector, top_k, namespace, ...) --> {'matches': [...]} best score first
+            - delete(ids, namespace) / delete_namespace(namespace)
+            - list(namespace, prefix) --> yields pages (lists) of vector ids
+            - fetch(ids, namespace) --> {id: {'id', 'values', 'metadata'}}
+            - aquery(...) --> async query() for our async question path (defaults to running query() in a thread)
+    """
+    def upsert(self, vectors: list, namespace: str):
+        raise NotImplementedError
+
+    def query(self, vector: list, top_k: int, namespace: str, filter: dict = None, include_values: bool = False, include_metadata: bool = True) -> dict:
+        raise NotImplementedError
+
+    async def aquery(self, vector: list, top_k: int, namespace: str, filter: dict = None, include_values: bool = False, include_metadata: bool = True) -> dict:
+        return await asyncio.to_thread(self.query, vector, top_k, namespace, filter, include_values, include_metadata)
+
+    def delete(self, ids: list, namespace: str):
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str):
+        raise NotImplementedError
+
+    def list(self, namespace: str, prefix: str = ''):
+        raise NotImplementedError
+
+    def fetch(self, ids: list, namespace: str) -> dict:
+        raise NotImplementedError
+
+
+class PineconeBackend(VectorBackend):
+    def __init__(self, api_key: str, index_name: str):
+        from pinecone import Pinecone
+
+        self.pc = Pinecone(api_key=api_key, environment='us-east-1')
+        self.index = self.pc.Index(index_name)
+        self.index_name = index_name
+        self._host = None
+        # One IndexAsyncio per event loop (its aiohttp session belongs to the loop that created it)
+        self._async_indexes = weakref.WeakKeyDictionary()
+
+    def _async_index(self):
+        loop = asyncio.get_running_loop()
+        index = self._async_indexes.get(loop)
+        if index is None:
+            if self._host is None:
+                self._host = self.pc.describe_index(self.index_name).host
+            index = self.pc.IndexAsyncio(host=self._host)
+            self._async_indexes[loop] = index
+        return index
+
+    @staticmethod
+    def _to_matches(res):
+        return {'matches': [
+            {'id': m.id, 'score': m.score, 'metadata': m.metadata or {}, 'values': list(m.values or [])}
+            for m in res.matches
+        ]}
+
+    def upsert(self, vectors, namespace):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        query_kwargs = {'filter': filter} if filter else {}
+        # Time limit on the HTTP request itself --> a slow namespace gives its fan-out thread back instead of hanging on to it
+        res = self.index.query(
+            _request_timeout=settings.PINECONE_QUERY_TIMEOUT,
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            **query_kwargs
+        )
+        return self._to_matches(res)
+
+    async def aquery(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        # Native async query through Pinecone's aiohttp client, no thread needed
+        query_kwargs = {'filter': filter} if filter else {}
+        res = await self._async_index().query(
+            _request_timeout=settings.PINECONE_QUERY_TIMEOUT,
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            **query_kwargs
+        )
+        return self._to_matches(res)
+
+    def delete(self, ids, namespace):
+        self.index.delete(ids=ids, namespace=namespace)
+
+    def delete_namespace(self, namespace):
+        # Instead of using pinecone.delete_index(name=) --> Actually deleted the entire index
+        # We use index.delete(namespace=)
+        self.index.delete(delete_all=True, namespace=namespace)
+
+    def list(self, namespace, prefix=''):
+        list_kwargs = {'prefix': prefix} if prefix else {}
+        yield from self.index.list(namespace=namespace, **list_kwargs)
+
+    def fetch(self, ids, namespace):
+        fetched = self.index.fetch(ids=ids, namespace=namespace)
+        return {
+            vector_id: {'id': vector_id, 'values': list(vector.values), 'metadata': vector.metadata or {}}
+            for vector_id, vector in fetched.vectors.items()
+        }
+
+
+def matches_filter(metadata: dict, metadata_filter: dict) -> bool:
+    # The subset of Pinecone's metadata filter language we use: {'field': value} / $eq / $ne / $in / $nin
+    for field, condition in metadata_filter.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for op, expected in condition.items():
+            if op == '$eq' and value != expected:
+                return False
+            if op == '$ne' and value == expected:
+                return False
+            if op == '$in' and value not in expected:
+                return False
+            if op == '$nin' and value in expected:
+                return False
+    return True
+
+
+class LocalBackend(VectorBackend):
+    """
+        Flat (brute force) index on local disk, one folder per namespace
+            - vectors.f32: N x D float32 rows (read through np.memmap so we never load the whole file)
+            - norms.f32: the L2 norm of every row so cosine is one matrix-vector product
+            - meta.jsonl: {"dim"} then one {"id", "metadata"} line per upserted vector, append only 
+              (row i <--> the i-th distinct id, an id showing up again overwrites its row)
+
+        ids + metadata are kept in memory per namespace and only read back when meta.jsonl changed under us (inode/mtime/size), 
+        so a query is one stat() + one matrix-vector product and an upsert only writes its own rows (no full rewrite)
+        delete() compacts into temp files + os.replace so an open memmap never sees a truncated file
+
+        Cosine top-k = (vectors @ q) / (norms * |q|) then np.argpartition --> vectorized, no python loops over rows
+        Reads + writes share one lock, this is meant for ONE process (tests, benchmarks, air-gapped dev)
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, root):
+        self.root = str(root)
+        self._lock = threading.Lock()
+        # namespace --> {'stamp', 'dim', 'ids', 'metadata', 'rows' (id --> row), 'vectors', 'norms' (open memmaps)}
+        self._namespaces = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- Files ---
+    def _dir(self, namespace):
+        return os.path.join(self.root, namespace)
+
+    def _path(self, namespace, name):
+        return os.path.join(self._dir(namespace), name)
+
+    def _stamp(self, namespace):
+        try:
+            stat = os.stat(self._path(namespace, 'meta.jsonl'))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _apply(state, vector_id, metadata):
+        row = state['rows'].get(vector_id)
+        if row is None:
+            state['rows'][vector_id] = len(state['ids'])
+            state['ids'].append(vector_id)
+            state['metadata'].append(metadata)
+        else:
+            state['metadata'][row] = metadata
+
+    def _read_meta(self, namespace):
+        state = {'dim': None, 'ids': [], 'metadata': [], 'rows': {}, 'vectors': None, 'norms': None}
+        path = self._path(namespace, 'meta.jsonl')
+        if not os.path.exists(path) and os.path.exists(self._path(namespace, 'meta.json')):
+            # Namespace written before meta.jsonl --> converted once
+            with open(self._path(namespace, 'meta.json')) as f:
+                old = json.load(f)
+            records = [{'dim': old['dim']}] + [{'id': i, 'metadata': m} for i, m in zip(old['ids'], old['metadata'])]
+            self._replace(namespace, 'meta.jsonl', ''.join(json.dumps(record) + '\n' for record in records).encode())
+            os.remove(self._path(namespace, 'meta.json'))
+        try:
+            with open(path) as f:
+                for line in f:
+                    # A line without its newline was cut off mid write (crash) --> nothing after it made it either
+                    if not line.endswith('\n'):
+                        break
+                    record = json.loads(line)
+                    if 'dim' in record:
+                        state['dim'] = record['dim']
+                    else:
+                        self._apply(state, record['id'], record['metadata'])
+        except FileNotFoundError:
+            pass
+        return state
+
+    def _state(self, namespace):
+        # Caller holds our lock
+        stamp = self._stamp(namespace)
+        state = self._namespaces.get(namespace)
+        if state is None or state['stamp'] != stamp:
+            state = self._read_meta(namespace)
+            state['stamp'] = stamp
+            self._namespaces[namespace] = state
+        return state
+
+    def _replace(self, namespace, name, data: bytes):
+        # Write + rename so a reader never sees half a file
+        tmp_path = self._path(namespace, f'{name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(namespace, name))
+
+    def _append(self, namespace, name, data: bytes, offset: int):
+        # truncate() first so rows left behind by a write that crashed before its meta line never shift our new rows
+        with open(self._path(namespace, name), 'ab') as f:
+            f.truncate(offset)
+            f.write(data)
+
+    def _vectors(self, namespace, state, mode='r'):
+        if not state['ids']:
+            return np.empty((0, state['dim'] or 0), dtype=np.float32)
+        if mode != 'r':
+            return np.memmap(self._path(namespace, 'vectors.f32'), dtype=np.float32, mode=mode, shape=(len(state['ids']), state['dim']))
+        if state['vectors'] is None:
+            state['vectors'] = np.memmap(self._path(namespace, 'vectors.f32'), dtype=np.float32, mode='r', shape=(len(state['ids']), state['dim']))
+        return state['vectors']
+
+    def _norms(self, namespace, state, mode='r'):
+        if not state['ids']:
+            return np.empty((0,), dtype=np.float32)
+        if mode != 'r':
+            return np.memmap(self._path(namespace, 'norms.f32'), dtype=np.float32, mode=mode, shape=(len(state['ids']),))
+        if state['norms'] is None:
+            state['norms'] = np.memmap(self._path(namespace, 'norms.f32'), dtype=np.float32, mode='r', shape=(len(state['ids']),))
+        return state['norms']
+
+    # --- Interface ---
+    def upsert(self, vectors, namespace):
+        if not vectors:
+            return
+        with self._lock:
+            os.makedirs(self._dir(namespace), exist_ok=True)
+            state = self._state(namespace)
+            values = np.asarray([v['values'] for v in vectors], dtype=np.float32)
+            records = []
+            if state['dim'] is None:
+                state['dim'] = values.shape[1]
+                records.append({'dim': state['dim']})
+            if values.shape[1] != state['dim']:
+                raise ValueError(f'Vector dimension {values.shape[1]} does not match namespace dimension {state["dim"]}')
+            norms = np.linalg.norm(values, axis=1).astype(np.float32)
+
+            # The same ID twice in one upsert --> last one wins (like Pinecone)
+            latest = {v['id']: i for i, v in enumerate(vectors)}
+            existing = [(i, state['rows'][vector_id]) for vector_id, i in latest.items() if vector_id in state['rows']]
+            new = [i for vector_id, i in latest.items() if vector_id not in state['rows']]
+
+            # Existing IDs are overwritten in place
+            if existing:
+                stored_vectors = self._vectors(namespace, state, mode='r+')
+                stored_norms = self._norms(namespace, state, mode='r+')
+                for i, row in existing:
+                    stored_vectors[row] = values[i]
+                    stored_norms[row] = norms[i]
+                stored_vectors.flush()
+                stored_norms.flush()
+                del stored_vectors, stored_norms
+
+            # New IDs are appended to the end of our files
+            if new:
+                count = len(state['ids'])
+                self._append(namespace, 'vectors.f32', values[new].tobytes(), count * state['dim'] * 4)
+                self._append(namespace, 'norms.f32', norms[new].tobytes(), count * 4)
+                # Our open memmaps are one shape short now
+                state['vectors'] = state['norms'] = None
+
+            # Vectors first, meta last --> a meta line always has its row on disk
+            for vector_id, i in latest.items():
+                metadata = vectors[i].get('metadata') or {}
+                self._apply(state, vector_id, metadata)
+                records.append({'id': vector_id, 'metadata': metadata})
+            with open(self._path(namespace, 'meta.jsonl'), 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in records))
+            state['stamp'] = self._stamp(namespace)
+
+    def query(self, vector, top_k, namespace, filter=None, include_values=False, include_metadata=True):
+        with self._lock:
+            state = self._state(namespace)
+            if not state['ids']:
+                return {'matches': []}
+            stored_vectors = self._vectors(namespace, state)
+            stored_norms = self._norms(namespace, state)
+
+            q = np.asarray(vector, dtype=np.float32)
+            q_norm = np.linalg.norm(q)
+            denominator = stored_norms * q_norm
+            # A zero vector (or zero query) has no direction, score it 0 instead of dividing by zero
+            scores = np.divide(stored_vectors @ q, denominator, out=np.zeros(len(state['ids']), dtype=np.float32), where=denominator > 0)
+
+            if filter:
+                mask = np.fromiter((matches_filter(m, filter) for m in state['metadata']), dtype=bool, count=len(state['ids']))
+                scores = np.where(mask, scores, -np.inf)
+                top_k = min(top_k, int(mask.sum()))
+            top_k = min(top_k, len(scores))
+            if top_k <= 0:
+                return {'matches': []}
+
+            # argpartition is O(N) then we only sort our k winners
+            top_rows = np.argpartition(-scores, top_k - 1)[:top_k]
+            top_rows = top_rows[np.argsort(-scores[top_rows])]
+            return {'matches': [
+                {
+                    'id': state['ids'][row],
+                    'score': float(scores[row]),
+                    # Copies, our in-memory metadata must not change under us
+                    'metadata': dict(state['metadata'][row]) if include_metadata else {},
+                    'values': stored_vectors[row].tolist() if include_values else []
+                }
+                for row in top_rows
+            ]}
+
+    def delete(self, ids, namespace):
+        ids = set(ids)
+        with self._lock:
+            state = self._state(namespace)
+            keep = [row for row, vector_id in enumerate(state['ids']) if vector_id not in ids]
+            if len(keep) == len(state['ids']):
+                return
+            # Compacting: new files with only the rows we keep, swapped in with os.replace 
+            # (a reader's memmap keeps the old file, truncating it in place would pull the rows out from under it)
+            kept_vectors = np.array(self._vectors(namespace, state)[keep])
+            kept_norms = np.array(self._norms(namespace, state)[keep])
+            self._replace(namespace, 'vectors.f32', kept_vectors.tobytes())
+            self._replace(namespace, 'norms.f32', kept_norms.tobytes())
+            records = [{'dim': state['dim']}] + [{'id': state['ids'][row], 'metadata': state['metadata'][row]} for row in keep]
+            self._replace(namespace, 'meta.jsonl', ''.join(json.dumps(record) + '\n' for record in records).encode())
+            # Read back on next use
+            self._namespaces.pop(namespace, None)
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            for name in ('vectors.f32', 'norms.f32', 'meta.jsonl', 'meta.json'):
+                try:
+                    os.remove(self._path(namespace, name))
+                except FileNotFoundError:
+                    pass
+            self._namespaces.pop(namespace, None)
+
+    def list(self, namespace, prefix=''):
+        with self._lock:
+            ids = [vector_id for vector_id in self._state(namespace)['ids'] if vector_id.startswith(prefix)]
+        for start in range(0, len(ids), self.PAGE_SIZE):
+            yield ids[start:start + self.PAGE_SIZE]
+
+    def fetch(self, ids, namespace):
+        with self._lock:
+            state = self._state(namespace)
+            stored_vectors = self._vectors(namespace, state)
+            return {
+                vector_id: {
+                    'id': vector_id, 
+                    'values': stored_vectors[state['rows'][vector_id]].tolist(), 
+                    'metadata': dict(state['metadata'][state['rows'][vector_id]])
+                }
+                for vector_id in ids if vector_id in state['rows']
+            }
+
+
+def build_backend(name: str = None) -> VectorBackend:
+    name = name or settings.VECTOR_BACKEND
+    if name == 'pinecone':
+        return PineconeBackend(settings.PINECONE_API_KEY, settings.PINECONE_INDEX)
+    if name == 'local':
+        return LocalBackend(settings.LOCAL_VECTOR_ROOT)
+    raise ValueError(f'Unknown VECTOR_BACKEND: {name}')
@@ -1,13 +1,102 @@
 from __future__ import absolute_import, unicode_literals
-from celery import shared_task
-from django.core.management import call_command
+from uuid import uuid4
+from celery import shared_task, chord
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
 
 """
-    We're going to create a custom Django Command for our task to call 
-        - We use call_command to run something like: py manage.py django_custom_command 
-
     Shared tasks decorator is used with auto task discovery 
+
+    FAQ generation fans out across our workers: 
+        - gen_faq (beat) takes our dispatch lock, picks the handbooks past our Watermark (new or changed), 
+          claims them and queues ONE generate_handbook_faq task per handbook (chord)
+        - Every generate_handbook_faq retries with exponential backoff + is rate limited per worker (FAQ_TASK_RATE_LIMIT)
+        - summarize_faq_run runs once every handbook finished, reports the whole run and releases our lock
+
+    The lock means beat runs never overlap (the next tick just skips), the watermark means a run only costs as much as the new work.
+    The generate_faq management command is still around for running it by hand (thread pool, no Celery)
 """
 @shared_task
 def gen_faq():
-    call_command('generate_faq')
\ No newline at end of file
+    # Local import so our workers don't pull in the service layer until they need it
+    from handbook_app.services.faq_services import handbooks_to_process, advance_watermark, claim_handbooks, release_claim, FAQ_LOCK
+    from handbook_app.services.locks import acquire_lock, release_lock
+
+    run_id = uuid4().hex
+    lock_token = acquire_lock(FAQ_LOCK, settings.FAQ_LOCK_TTL)
+    if lock_token is None:
+        # The previous run is still going
+        return {'run': run_id, 'queued': 0, 'locked': True}
+
+    handbook_ids = []
+    dispatched = False
+    try:
+        handbooks = handbooks_to_process(settings.FAQ_DISPATCH_BATCH)
+        # Handbooks still claimed by a task from an earlier run are left alone
+        handbook_ids = claim_handbooks([handbook_id for handbook_id, _ in handbooks], run_id)
+        if handbook_ids:
+            # The lock is released by our summary once every handbook is done
+            chord(generate_handbook_faq.s(handbook_id) for handbook_id in handbook_ids)(summarize_faq_run.s(run_id, lock_token))
+            dispatched = True
+        if handbooks:
+            advance_watermark(*handbooks[-1])
+    except Exception:
+        release_lock(FAQ_LOCK, lock_token)
+        raise
+    finally:
+        # Nothing was queued for our claims --> give them back now instead of blocking these handbooks for FAQ_CLAIM_TTL
+        # (once queued, every generate_handbook_faq releases its own claim)
+        if not dispatched:
+            for handbook_id in handbook_ids:
+                release_claim(handbook_id)
+
+    if not handbook_ids:
+        release_lock(FAQ_LOCK, lock_token)
+        return {'run': run_id, 'queued': 0}
+    print(f'FAQ run {run_id}: queued {len(handbook_ids)} handbooks')
+    return {'run': run_id, 'queued': len(handbook_ids)}
+
+@shared_task(bind=True, rate_limit=settings.FAQ_TASK_RATE_LIMIT, max_retries=settings.FAQ_TASK_MAX_RETRIES)
+def generate_handbook_faq(self, handbook_id: int):
+    from handbook_app.services.faq_services import generate_handbook_faqs, release_claim
+
+    try:
+        result = generate_handbook_faqs(handbook_id)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            # 2s, 4s, 8s ... (capped at 10 minutes, with jitter so retries don't line up)
+            countdown = get_exponential_backoff_interval(factor=2, retries=self.request.retries, maximum=600, full_jitter=True)
+            raise self.retry(exc=e, countdown=countdown)
+        # Out of retries --> we return a result instead of raising so the chord still reaches our summary
+        result = {'handbook': handbook_id, 'status': 'failed', 'questions': 0, 'error': str(e)}
+
+    # Done either way, the next run may pick it up again if it still has no FAQ
+    release_claim(handbook_id)
+    return result
+
+@shared_task
+def summarize_faq_run(results: list, run_id: str, lock_token: str = None):
+    from handbook_app.services.faq_services import summarize_results, FAQ_LOCK
+    from handbook_app.services.locks import release_lock
+
+    summary = summarize_results(results)
+    release_lock(FAQ_LOCK, lock_token)
+    print(f'FAQ run {run_id}: {summary["succeeded"]}/{summary["handbooks"]} handbooks, {summary["questions"]} FAQ, {summary["failed"]} failed')
+    return {'run': run_id, **summary}
+
+@shared_task
+def ingest_handbook(job_id: int):
+    # Parse, Split, Embed, Upsert OUTSIDE of our HTTP request 
+    #
+    # Local import so our workers don't pull in the service layer until they need it
+    from handbook_app.services.ingestion_services import run_ingestion
+    return run_ingestion(job_id)
+
+@shared_task
+def bulk_ingest_handbooks(company_id: int, source: str, concurrency: int = None, batch_size: int = None):
+    # Queued by our admin-only BulkIngestHandbooks API (the bulk_ingest command runs the same thing by hand)
+    from companies.models import CompanyUser
+    from handbook_app.services.bulk_ingestion import discover_pdfs, bulk_ingest
+
+    company = CompanyUser.objects.get(id=company_id)
+    return bulk_ingest(company, discover_pdfs(source, settings.BULK_INGEST_ROOT), concurrency=concurrency, batch_size=batch_size)
@@ -1,3 +1,1057 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import Mock, patch
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.reverse import reverse
+from companies.models import CompanyUser
+from handbook_app.management.commands.benchmark_extraction import build_synthetic_pdf
+from handbook_app.management.commands.benchmark_suite import FakeEmbeddings
+from handbook_app.models import FAQ, Handbook, IngestionJob
 
 # Create your tests here.
+
+
+def create_company(name: str = 'Acme') -> CompanyUser:
+    return CompanyUser.objects.create(username=name.lower(), company_name=name)
+
+
+class FAQIndexTests(TestCase):
+    def setUp(self):
+        from handbook_app.services.embedding_cache import to_bytes
+        from handbook_app.services.faq_services import FAQIndex
+
+        self.index = FAQIndex()
+        self.company = create_company()
+        self.handbook = Handbook.objects.create(company=self.company, namespace='Benefits', pdf_file='handbook_files/benefits.pdf')
+        self.vector = [1.0, 0.0, 0.0]
+        FAQ.objects.create(handbook=self.handbook, question='How many PTO days?', answer='15 days', embedding=to_bytes(self.vector))
+
+    def test_match_serves_fresh_answer(self):
+        self.assertEqual(self.index.match(self.company.id, self.vector, threshold=0.9), '15 days')
+
+    def test_answers_older_than_handbook_are_ignored(self):
+        self.index.match(self.company.id, self.vector, threshold=0.9)
+        # New PDF --> `updated` moves past the FAQ's generated_on
+        Handbook.objects.filter(pk=self.handbook.pk).update(updated=timezone.now(), version=2)
+        self.assertIsNone(self.index.match(self.company.id, self.vector, threshold=0.9))
+
+
+@override_settings(FAQ_WATERMARK_LAG=0)
+class HandbooksToProcessTests(TestCase):
+    def setUp(self):
+        self.company = create_company()
+
+    def create_handbook(self, name: str, *statuses) -> Handbook:
+        handbook = Handbook.objects.create(company=self.company, namespace=name, pdf_file=f'handbook_files/{name}.pdf')
+        for status in statuses:
+            IngestionJob.objects.create(handbook=handbook, status=status)
+        return handbook
+
+    def test_only_handbooks_whose_latest_job_succeeded(self):
+        from handbook_app.services.faq_services import handbooks_to_process
+
+        recovered = self.create_handbook('recovered', IngestionJob.RUNNING, IngestionJob.SUCCEEDED)
+        self.create_handbook('failed', IngestionJob.SUCCEEDED, IngestionJob.FAILED)
+        self.create_handbook('running', IngestionJob.SUCCEEDED, IngestionJob.RUNNING)
+        legacy = self.create_handbook('legacy')
+
+        ids = [handbook_id for handbook_id, _ in handbooks_to_process(10)]
+        self.assertEqual(sorted(ids), sorted([recovered.id, legacy.id]))
+
+
+@override_settings(FAQ_WATERMARK_LAG=0)
+class GenFAQTests(TestCase):
+    def test_failed_dispatch_releases_claims_and_lock(self):
+        from handbook_app import tasks
+        from handbook_app.services.faq_services import faq_claim_key, FAQ_LOCK
+        from handbook_app.services.locks import is_locked
+
+        handbook = Handbook.objects.create(company=create_company(), namespace='Benefits', pdf_file='handbook_files/benefits.pdf')
+        # Broker down while queueing the chord
+        with patch.object(tasks, 'chord', side_effect=ConnectionError('broker unreachable')):
+            with self.assertRaises(ConnectionError):
+                tasks.gen_faq()
+
+        self.assertFalse(is_locked(faq_claim_key(handbook.id)))
+        self.assertFalse(is_locked(FAQ_LOCK))
+
+    def test_lock_is_held_until_the_summary_releases_it(self):
+        from handbook_app import tasks
+        from handbook_app.models import Lease
+        from handbook_app.services.faq_services import FAQ_LOCK
+        from handbook_app.services.locks import acquire_lock, release_lock
+
+        Handbook.objects.create(company=create_company(), namespace='Benefits', pdf_file='handbook_files/benefits.pdf')
+        with patch.object(tasks, 'chord') as queued:
+            self.assertEqual(tasks.gen_faq()['queued'], 1)
+            # The next beat tick skips while the run is going
+            self.assertTrue(tasks.gen_faq()['locked'])
+        lock_token = queued.return_value.call_args.args[0].args[1]
+
+        self.assertIsNone(acquire_lock(FAQ_LOCK, 60))
+        self.assertFalse(release_lock(FAQ_LOCK, 'someone-else'))
+        tasks.summarize_faq_run([], 'run', lock_token)
+        self.assertFalse(Lease.objects.filter(name=FAQ_LOCK).exists())
+
+        # An owner that died leaves its lease behind until it expires
+        dead = acquire_lock(FAQ_LOCK, 60)
+        Lease.objects.filter(name=FAQ_LOCK).update(expires=timezone.now())
+        token = acquire_lock(FAQ_LOCK, 60)
+        self.assertNotIn(token, (None, dead))
+        self.assertFalse(release_lock(FAQ_LOCK, dead))
+        self.assertTrue(release_lock(FAQ_LOCK, token))
+
+
+# Runs in its own interpreter against a database file we share between processes (like two prefork children)
+CLAIM_SCRIPT = """
+import json, sys
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+import django
+django.setup()
+from django.core.management import call_command
+from handbook_app.services.faq_services import claim_handbooks, release_claim, FAQ_LOCK
+from handbook_app.services.locks import acquire_lock, release_lock
+step = sys.argv[2]
+if step == 'first':
+    call_command('migrate', verbosity=0)
+    print(json.dumps({'claimed': claim_handbooks([1, 2], 'run-a'), 'lock': acquire_lock(FAQ_LOCK, 60)}))
+elif step == 'second':
+    claimed = claim_handbooks([1, 2, 3], 'run-b')
+    release_claim(1)
+    print(json.dumps({'claimed': claimed, 'lock': acquire_lock(FAQ_LOCK, 60)}))
+else:
+    print(json.dumps({'claimed': claim_handbooks([1, 2], 'run-c'), 'released': release_lock(FAQ_LOCK, sys.argv[3])}))
+"""
+
+
+class ClaimAcrossProcessesTests(SimpleTestCase):
+    def run_step(self, database: str, *args) -> dict:
+        result = subprocess.run(
+            [sys.executable, '-c', CLAIM_SCRIPT, database, *args],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'handbook.settings'},
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_claims_and_lock_are_seen_by_other_processes(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        database = os.path.join(tmp, 'db.sqlite3')
+
+        first = self.run_step(database, 'first')
+        self.assertEqual(first['claimed'], [1, 2])
+        second = self.run_step(database, 'second')
+        # Handbooks claimed by the first process are left alone, the dispatch lock is still held
+        self.assertEqual(second, {'claimed': [3], 'lock': None})
+        # A claim or lock released by another process is really gone
+        self.assertEqual(self.run_step(database, 'third', first['lock']), {'claimed': [1], 'released': True})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_cancelled_async_leader_does_not_fail_its_followers(self):
+        import asyncio
+        from handbook_app.services.single_flight import SingleFlight
+
+        flight = SingleFlight(wait_timeout=5)
+        calls = []
+
+        async def answer():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return '15 days'
+
+        async def scenario():
+            leader = asyncio.ensure_future(flight.ado('pto', answer))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.ado('pto', answer))
+            await asyncio.sleep(0)
+            # The leader's client disconnects
+            leader.cancel()
+            return leader, await follower
+
+        leader, result = asyncio.run(scenario())
+        self.assertTrue(leader.cancelled())
+        self.assertEqual((result, len(calls)), ('15 days', 1))
+
+    def test_async_followers_stop_waiting_after_wait_timeout(self):
+        import asyncio
+        from handbook_app.services.single_flight import SingleFlight
+
+        flight = SingleFlight(wait_timeout=0.05)
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def slow():
+                await release.wait()
+                return 'leader'
+
+            async def fast():
+                return 'follower'
+
+            leader = asyncio.ensure_future(flight.ado('pto', slow))
+            await asyncio.sleep(0)
+            result = await flight.ado('pto', fast)
+            release.set()
+            return result, await leader
+
+        self.assertEqual(asyncio.run(scenario()), ('follower', 'leader'))
+
+    def test_sync_followers_stop_waiting_after_wait_timeout(self):
+        from handbook_app.services.single_flight import SingleFlight
+
+        flight = SingleFlight(wait_timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'leader'
+
+        leader = threading.Thread(target=flight.do, args=('pto', slow))
+        leader.start()
+        started.wait(5)
+        self.assertEqual(flight.do('pto', lambda: 'follower'), 'follower')
+        release.set()
+        leader.join()
+
+
+class SlowNamespaceIndex:
+    # Namespaces named slow-* take `delay` seconds to answer (a query that already started can't be cancelled)
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.release = threading.Event()
+
+    def query(self, vector, top_k, namespace, **kwargs):
+        if namespace.startswith('slow'):
+            self.release.wait(self.delay)
+        return {'matches': [{'id': namespace, 'score': 1.0, 'metadata': {}}]}
+
+
+@override_settings(PINECONE_QUERY_CONCURRENCY=2)
+class FanoutTests(SimpleTestCase):
+    def test_timed_out_namespaces_do_not_block_the_next_fanout(self):
+        from handbook_app.services.fanout import query_namespaces
+
+        index = SlowNamespaceIndex(delay=5)
+        self.addCleanup(index.release.set)
+        # Enough slow namespaces to fill every query thread
+        first = query_namespaces(index, [0.0], ['slow-1', 'slow-2', 'fast-1'], top_k=3, timeout=0.1)
+        self.assertNotIn('slow-1', [match['id'] for match in first])
+
+        start = time.perf_counter()
+        second = query_namespaces(index, [0.0], ['fast-2', 'fast-3'], top_k=3, timeout=1)
+        self.assertEqual(sorted(match['id'] for match in second), ['fast-2', 'fast-3'])
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+
+class BulkIngestPathTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.root = self.tmp / 'bulk_uploads'
+        (self.root / 'acme').mkdir(parents=True)
+        (self.tmp / 'private').mkdir()
+        for path in (self.root / 'acme' / 'benefits.pdf', self.tmp / 'private' / 'secret.pdf', self.root / 'acme' / 'notes.txt'):
+            path.write_bytes(b'%PDF-1.4')
+        self.media = self.tmp / 'media'
+        media_root = override_settings(MEDIA_ROOT=str(self.media))
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def write_manifest(self, rows: list) -> str:
+        manifest = self.root / 'acme' / 'manifest.json'
+        manifest.write_text(json.dumps(rows))
+        return str(manifest)
+
+    def test_manifest_paths_outside_root_are_rejected(self):
+        from handbook_app.services.bulk_ingestion import discover_pdfs, prepare_handbooks
+
+        manifest = self.write_manifest([
+            'benefits.pdf',
+            {'path': '../../private/secret.pdf', 'name': 'escape'},
+            {'path': str(self.tmp / 'private' / 'secret.pdf'), 'name': 'absolute'},
+            'notes.txt',
+        ])
+        entries = discover_pdfs(manifest, str(self.root))
+        self.assertEqual([entry.name for entry in entries if not entry.error], ['benefits'])
+
+        prepared = prepare_handbooks(create_company(), entries)
+        self.assertEqual(sorted(prepared['errors']), ['absolute', 'escape', 'notes'])
+        self.assertEqual([entry.name for entry, _ in prepared['todo']], ['benefits'])
+        # Nothing from outside our root was copied into our storage
+        self.assertEqual([path.name for path in (self.media / 'handbook_files').iterdir()], ['benefits.pdf'])
+
+    def test_symlinks_out_of_the_folder_are_rejected(self):
+        from handbook_app.services.bulk_ingestion import discover_pdfs
+
+        (self.root / 'acme' / 'linked.pdf').symlink_to(self.tmp / 'private' / 'secret.pdf')
+        entries = {entry.name: entry.error for entry in discover_pdfs(str(self.root / 'acme'), str(self.root))}
+        self.assertEqual(entries['benefits'], '')
+        self.assertTrue(entries['linked'].startswith('Outside of'))
+
+    def test_model_validators_run_before_copying(self):
+        from handbook_app.services.bulk_ingestion import BulkEntry, prepare_handbooks
+
+        entries = [BulkEntry(str(self.root / 'acme' / 'benefits.pdf'), 'x' * 200)]
+        prepared = prepare_handbooks(create_company(), entries)
+        self.assertIn('x' * 200, prepared['errors'])
+        self.assertFalse(Handbook.objects.exists())
+        self.assertFalse((self.media / 'handbook_files').exists())
+
+
+class LocalBackendTests(SimpleTestCase):
+    def setUp(self):
+        from handbook_app.services.vector_backends import LocalBackend
+
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.backend = LocalBackend(self.root)
+        self.backend.upsert([
+            {'id': 'a', 'values': [1.0, 0.0], 'metadata': {'text': 'A', 'handbook_id': 1}},
+            {'id': 'b', 'values': [0.0, 1.0], 'metadata': {'text': 'B', 'handbook_id': 2}},
+        ], 'ns')
+
+    def ids(self, backend, vector, top_k=2, **kwargs):
+        return [match['id'] for match in backend.query(vector, top_k, 'ns', **kwargs)['matches']]
+
+    def test_upsert_overwrite_delete_round_trip(self):
+        from handbook_app.services.vector_backends import LocalBackend
+
+        self.assertEqual(self.ids(self.backend, [1.0, 0.1]), ['a', 'b'])
+        self.backend.upsert([{'id': 'a', 'values': [0.0, -1.0], 'metadata': {'text': 'A2'}}, {'id': 'c', 'values': [1.0, 0.0]}], 'ns')
+        self.assertEqual(self.ids(self.backend, [1.0, 0.1]), ['c', 'b'])
+        self.backend.delete(['b'], 'ns')
+        self.assertEqual(self.ids(self.backend, [0.0, -1.0], top_k=5), ['a', 'c'])
+        self.assertEqual(self.ids(self.backend, [1.0, 0.0], filter={'handbook_id': 1}), [])
+
+        # A second instance (another process) reads the same state back from disk
+        reopened = LocalBackend(self.root)
+        self.assertEqual(reopened.fetch(['a', 'b'], 'ns'), {'a': {'id': 'a', 'values': [0.0, -1.0], 'metadata': {'text': 'A2'}}})
+        self.assertEqual([page for page in reopened.list('ns')], [['a', 'c']])
+
+    def test_metadata_is_only_read_when_the_file_changes(self):
+        from handbook_app.services.vector_backends import LocalBackend
+
+        with patch.object(self.backend, '_read_meta', wraps=self.backend._read_meta) as read_meta:
+            for _ in range(3):
+                self.ids(self.backend, [1.0, 0.0])
+            self.backend.upsert([{'id': 'c', 'values': [1.0, 1.0]}], 'ns')
+            self.ids(self.backend, [1.0, 0.0])
+            self.assertEqual(read_meta.call_count, 0)
+
+            # Someone else wrote to our namespace
+            LocalBackend(self.root).upsert([{'id': 'd', 'values': [-1.0, 0.0]}], 'ns')
+            self.assertEqual(self.ids(self.backend, [-1.0, 0.0], top_k=1), ['d'])
+            self.assertEqual(read_meta.call_count, 1)
+
+    def test_rows_of_an_interrupted_upsert_are_overwritten(self):
+        from handbook_app.services.vector_backends import LocalBackend
+
+        # Vector rows written but the process died before their meta line
+        with open(os.path.join(self.root, 'ns', 'vectors.f32'), 'ab') as f:
+            f.write(b'\0' * 8)
+        backend = LocalBackend(self.root)
+        backend.upsert([{'id': 'c', 'values': [-1.0, 0.0]}], 'ns')
+        self.assertEqual(backend.fetch(['c'], 'ns')['c']['values'], [-1.0, 0.0])
+
+
+def handbook_text(words: int = 1200, seed: int = 0) -> str:
+    # Random (but repeatable) prose --> two chunks only overlap where our splitter made them overlap
+    vocabulary = 'employee leave policy manager payroll benefit remote office holiday overtime review travel expense training'.split()
+    rng = random.Random(seed)
+    return ' '.join(f'{rng.choice(vocabulary)}{rng.randint(0, 99)}' for _ in range(words))
+
+
+def as_matches(texts: list, handbook_id: int = 1, namespace: str = 'ns') -> list:
+    # Best score first, like a vector store returns them
+    return [
+        {'id': f'{handbook_id}-{i}', 'score': 1.0 - i / 100, 'namespace': namespace, 'metadata': {'text': text, 'handbook_id': handbook_id}}
+        for i, text in enumerate(texts)
+    ]
+
+
+class BuildContextTests(SimpleTestCase):
+    def setUp(self):
+        from handbook_app.services.pinecone_services import get_splitter
+
+        # Real chunks out of our splitter (800 characters, 100 overlap)
+        self.chunks = get_splitter().split_text(handbook_text())
+
+    def test_neighbouring_chunks_are_merged_into_a_smaller_prompt(self):
+        from handbook_app.services.context_builder import build_context, count_tokens, SEPARATOR
+
+        chunks = self.chunks[:4]
+        context = build_context(as_matches(chunks), token_budget=10000)
+        raw = SEPARATOR.join(chunks)
+
+        self.assertLess(len(context), len(raw))
+        self.assertLess(count_tokens(context), count_tokens(raw))
+        # One block, nothing lost
+        self.assertNotIn(SEPARATOR, context)
+        for chunk in chunks:
+            self.assertIn(chunk, context)
+
+    def test_chunk_inside_another_is_dropped(self):
+        from handbook_app.services.context_builder import build_context
+
+        chunk = self.chunks[0]
+        context = build_context(as_matches([chunk, chunk[100:400]]), token_budget=10000)
+        self.assertEqual(context, chunk)
+
+    def test_other_sources_are_never_merged(self):
+        from handbook_app.services.context_builder import build_context, SEPARATOR
+
+        first, second = self.chunks[:2]
+        matches = as_matches([first], handbook_id=1) + as_matches([second], handbook_id=2)
+        self.assertEqual(build_context(matches, token_budget=10000), SEPARATOR.join([first, second]))
+
+    def test_context_stays_inside_the_token_budget(self):
+        from handbook_app.services.context_builder import build_context, count_tokens
+
+        # Every other chunk --> no overlap to merge, only our budget limits the prompt
+        chunks = self.chunks[::2][:4]
+        budget = count_tokens(chunks[0]) + count_tokens(chunks[1]) // 2
+        context = build_context(as_matches(chunks), token_budget=budget)
+
+        self.assertLessEqual(count_tokens(context), budget)
+        # Best block whole, the next one truncated to what was left, nothing after it
+        first, rest = context.split('\n\n', 1)
+        self.assertEqual(first, chunks[0])
+        self.assertTrue(chunks[1].startswith(rest))
+        self.assertLess(len(rest), len(chunks[1]))
+
+
+# Heavy libraries our services import lazily, none of them should load just to boot Django / a worker
+HEAVY_MODULES = ['numpy', 'langchain', 'langchain_core', 'langchain_openai', 'langchain_text_splitters', 'pinecone', 'fitz', 'openai', 'tiktoken']
+
+IMPORT_CHECK = f"""
+import json, sys
+import django
+django.setup()
+from django.core.management import call_command
+call_command('check')
+import handbook.urls, handbook.celery, handbook_app.tasks
+print(json.dumps(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)))
+"""
+
+
+# What our own modules (+ whatever they pull in) may cost a worker/web process at startup (~0.35s here)
+IMPORT_BUDGET_SECONDS = 1.5
+OUR_PACKAGES = ('handbook', 'handbook_app', 'companies')
+
+
+def own_import_seconds(importtime: str) -> float:
+    """
+        Cumulative time of our outermost modules out of python -X importtime (stderr) 
+            - Lines come children first, nesting = indentation --> walking them backwards puts every parent before its children 
+            - A module of ours imported by another module of ours is already inside its parent's cumulative time
+    """
+    total = 0
+    stack = []
+    for line in reversed(importtime.splitlines()):
+        if not line.startswith('import time:') or '|' not in line or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        inside_ours = any(ours for _, ours in stack)
+        ours = name.split('.')[0] in OUR_PACKAGES
+        if ours and not inside_ours:
+            total += int(cumulative)
+        stack.append((depth, ours or inside_ours))
+    return total / 1e6
+
+
+class ImportTimeTests(SimpleTestCase):
+    def run_check(self, *flags) -> subprocess.CompletedProcess:
+        # Fresh interpreter --> our own test run has already imported most of these
+        result = subprocess.run(
+            [sys.executable, *flags, '-c', IMPORT_CHECK],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'handbook.settings'},
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result
+
+    def test_check_urls_and_tasks_import_no_heavy_libraries(self):
+        result = self.run_check()
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
+
+    def test_startup_imports_stay_inside_our_budget(self):
+        seconds = own_import_seconds(self.run_check('-X', 'importtime').stderr)
+        self.assertGreater(seconds, 0)
+        self.assertLess(seconds, IMPORT_BUDGET_SECONDS)
+
+
+class CeleryRoutingTests(SimpleTestCase):
+    def test_ingestion_tasks_go_to_the_ingestion_queue(self):
+        from handbook.celery import celery_app
+
+        router = celery_app.amqp.router
+        for task in ('handbook_app.tasks.ingest_handbook', 'handbook_app.tasks.bulk_ingest_handbooks'):
+            self.assertEqual(router.route({}, task)['queue'].name, settings.CELERY_INGESTION_QUEUE)
+        # Everything else stays on the default queue our prefork worker consumes
+        self.assertNotEqual(router.route({}, 'handbook_app.tasks.gen_faq')['queue'].name, settings.CELERY_INGESTION_QUEUE)
+
+
+@override_settings(VECTOR_BACKEND='local', EMBEDDING_CACHE_ENABLED=False, PDF_EXTRACT_WORKERS=1)
+class ReplacePDFTests(TestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+
+        media_root = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT)
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+
+        self.company = create_company()
+        self.handbook = Handbook(company=self.company, namespace='Benefits')
+        self.handbook.pdf_file.save('benefits.pdf', ContentFile(build_synthetic_pdf(6)), save=False)
+        self.handbook.save()
+
+    def stored_ids(self) -> set:
+        from handbook_app.services.pinecone_services import list_ids
+        return set(list_ids(self.handbook.get_pc_namespace(), self.handbook.get_vector_prefix()))
+
+    def test_put_with_pdf_queues_ingestion(self):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.company)
+        upload = SimpleUploadedFile('benefits-v2.pdf', build_synthetic_pdf(3), content_type='application/pdf')
+        with patch('handbook_app.tasks.ingest_handbook.delay') as delay, patch('handbook_app.services.pinecone_services.ingest') as ingest:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.put(reverse('handbook:retrieve_update_destroy_handbook', kwargs={'id': self.handbook.id}), {'pdf_file': upload})
+
+        self.assertEqual(response.status_code, 202)
+        job = IngestionJob.objects.get(id=response.data['ingestion_job'])
+        self.assertEqual((job.handbook_id, job.status), (self.handbook.id, IngestionJob.QUEUED))
+        delay.assert_called_once_with(job.id)
+        # Nothing was parsed or embedded inside the request
+        ingest.assert_not_called()
+
+    def test_rename_keeps_version_answers_and_faq(self):
+        from rest_framework.test import APIClient
+
+        FAQ.objects.create(handbook=self.handbook, question='How many PTO days?', answer='15 days')
+        before = Handbook.objects.get(pk=self.handbook.pk)
+        client = APIClient()
+        client.force_authenticate(self.company)
+        with patch('handbook_app.views.invalidate_answers') as invalidate, patch('handbook_app.tasks.ingest_handbook.delay') as delay:
+            response = client.put(reverse('handbook:retrieve_update_destroy_handbook', kwargs={'id': self.handbook.id}), {'namespace': 'Perks'})
+
+        self.assertEqual(response.status_code, 200)
+        after = Handbook.objects.get(pk=self.handbook.pk)
+        self.assertEqual(after.namespace, 'Perks')
+        # Same content --> nothing cached goes stale and the FAQ watermark doesn't pick it up again
+        self.assertEqual((after.version, after.updated), (before.version, before.updated))
+        self.assertTrue(after.faqs.filter(generated_on__gte=after.updated).exists())
+        invalidate.assert_not_called()
+        delay.assert_not_called()
+
+    def test_replaced_pdf_drops_vectors_that_disappeared(self):
+        from handbook_app.services.chunk_manifest import handbook_vector_ids
+        from handbook_app.services.ingestion_services import run_ingestion
+
+        self.assertEqual(run_ingestion(IngestionJob.objects.create(handbook=self.handbook).id), IngestionJob.SUCCEEDED)
+        before = self.stored_ids()
+
+        self.handbook.pdf_file.save('benefits-v2.pdf', ContentFile(build_synthetic_pdf(3)))
+        job = IngestionJob.objects.create(handbook=self.handbook)
+        self.assertEqual(run_ingestion(job.id), IngestionJob.SUCCEEDED)
+        after = self.stored_ids()
+
+        job.refresh_from_db()
+        # Only the new PDF's chunks are left, in the index + our manifest
+        self.assertEqual(len(after), job.chunks_total)
+        self.assertEqual(set(handbook_vector_ids(self.handbook)), after)
+        self.assertTrue(before - after)
+        # Pages that didn't change kept their vectors, only the rest was embedded again
+        self.assertEqual(job.chunks_embedded, len(after - before))
+        self.assertLess(job.chunks_embedded, job.chunks_total)
+
+
+class AsyncFakeOpenAI:
+    # Async face of our benchmark FakeOpenAI (what clients.get_async_openai_client hands out), counts LLM calls
+    def __init__(self, llm_latency: float = 0):
+        from types import SimpleNamespace
+        from handbook_app.management.commands.benchmark_suite import FakeOpenAI
+
+        self.client = FakeOpenAI(0, 0)
+        self.llm_latency = llm_latency
+        self.chat_calls = 0
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+
+    async def _embed(self, **kwargs):
+        return self.client._embed(**kwargs)
+
+    async def _chat(self, stream: bool = False, **kwargs):
+        import asyncio
+
+        self.chat_calls += 1
+        await asyncio.sleep(self.llm_latency)
+        response = self.client._chat(**kwargs)
+        return self._stream(response.choices[0].message.content) if stream else response
+
+    @staticmethod
+    async def _stream(answer: str):
+        from types import SimpleNamespace
+
+        # One chunk per word like OpenAI's deltas, plus the empty usage chunk at the end
+        for word in answer.split(' '):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + ' '))])
+        yield SimpleNamespace(choices=[])
+
+
+@override_settings(ANSWER_CACHE_ENABLED=False, FAQ_ANSWERS_ENABLED=False, QUERY_EMBEDDING_CACHE_ENABLED=False)
+class AskQuestionAsyncTests(TestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+        self.openai = AsyncFakeOpenAI(llm_latency=0.05)
+        client = patch('handbook_app.services.async_services.get_async_openai_client', return_value=self.openai)
+        client.start()
+        self.addCleanup(client.stop)
+        self.company = create_company()
+        self.url = reverse('handbook:answer_question_async', kwargs={'company': self.company.company_slug})
+
+    async def test_answers_json_and_form_bodies(self):
+        from django.test import AsyncClient
+
+        # Open like AskQuestion + csrf_exempt --> no session, no token needed
+        client = AsyncClient(enforce_csrf_checks=True)
+        response = await client.post(self.url, json.dumps({'question': 'How many PTO days do I get?'}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'answer': 'Employees receive 15 PTO days per year.'})
+        response = await client.post(self.url, {'question': 'How many PTO days do I get?'})
+        self.assertEqual(response.json(), {'answer': 'Employees receive 15 PTO days per year.'})
+
+    async def test_identical_questions_in_flight_share_one_llm_call(self):
+        import asyncio
+
+        body = json.dumps({'question': 'How many PTO days do I get?'})
+        responses = await asyncio.gather(*(self.async_client.post(self.url, body, content_type='application/json') for _ in range(3)))
+        self.assertEqual({response.json()['answer'] for response in responses}, {'Employees receive 15 PTO days per year.'})
+        self.assertEqual(self.openai.chat_calls, 1)
+
+    async def test_unknown_company_reports_an_error(self):
+        url = reverse('handbook:answer_question_async', kwargs={'company': 'nobody'})
+        response = await self.async_client.post(url, json.dumps({'question': 'Hi'}), content_type='application/json')
+        self.assertEqual(response.json()['msg'], 'LLM Model failed to answer question')
+
+
+def read_events(response) -> list:
+    # Consumes our async streaming_content the way an ASGI server does --> [(event, data)]
+    from asgiref.sync import async_to_sync
+
+    async def consume():
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    events = []
+    for block in async_to_sync(consume)().strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+@override_settings(VECTOR_BACKEND='local', FAQ_ANSWERS_ENABLED=False, QUERY_EMBEDDING_CACHE_ENABLED=False, QUESTION_COALESCE_ENABLED=False)
+class StreamingAnswerTests(TestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+        from handbook_app.services.answer_cache import answer_cache
+        from handbook_app.services.ingestion_services import run_ingestion
+
+        media_root = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT)
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+        self.openai = AsyncFakeOpenAI()
+        client = patch('handbook_app.services.clients.get_async_openai_client', return_value=self.openai)
+        client.start()
+        self.addCleanup(client.stop)
+        answer_cache.clear()
+        self.addCleanup(answer_cache.clear)
+
+        self.company = create_company()
+        self.handbook = Handbook(company=self.company, namespace='Benefits')
+        self.handbook.pdf_file.save('benefits.pdf', ContentFile(build_synthetic_pdf(2)), save=False)
+        self.handbook.save()
+        run_ingestion(IngestionJob.objects.create(handbook=self.handbook).id)
+        self.url = reverse('handbook:answer_question', kwargs={'company': self.company.company_slug})
+
+    def ask(self, **kwargs):
+        return self.client.post(self.url, {'question': 'How many PTO days do I get?'}, **kwargs)
+
+    @override_settings(ANSWER_CACHE_ENABLED=False)
+    def test_sources_then_tokens_then_done(self):
+        response = self.ask(HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.is_async)
+        events = read_events(response)
+
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'sources')
+        self.assertEqual(names[-1], 'done')
+        self.assertEqual(set(names[1:-1]), {'token'})
+        self.assertGreater(len(names), 3)
+        self.assertEqual(events[0][1]['namespaces'], [self.handbook.get_pc_namespace()])
+        # Our tokens add up to the final answer
+        done = events[-1][1]
+        self.assertEqual(''.join(data['text'] for event, data in events[1:-1]), done['answer'])
+        self.assertEqual((done['answer'].strip(), done['cached']), ('Employees receive 15 PTO days per year.', False))
+
+    @override_settings(ANSWER_CACHE_ENABLED=True)
+    def test_cached_answer_streams_as_one_token(self):
+        # A regular (JSON) answer fills our answer cache
+        answer = self.ask().data['answer']
+        response = self.client.post(f'{self.url}?stream=1', {'question': 'How many PTO days do I get?'})
+        events = read_events(response)
+
+        self.assertEqual(events, [
+            ('sources', {'namespaces': [], 'handbook_ids': []}),
+            ('token', {'text': answer}),
+            ('done', {'answer': answer, 'cached': True}),
+        ])
+        self.assertEqual(self.openai.chat_calls, 0)
+
+
+@override_settings(
+    METRICS_ENABLED=True, METRICS_TOKEN='', VECTOR_BACKEND='local', ANSWER_CACHE_ENABLED=False, FAQ_ANSWERS_ENABLED=False,
+    QUERY_EMBEDDING_CACHE_ENABLED=False, QUESTION_COALESCE_ENABLED=False,
+)
+class MetricsTests(TestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+        from handbook_app.services.metrics import registry
+
+        registry.clear()
+        self.addCleanup(registry.clear)
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+        self.company = create_company()
+
+    def ask(self):
+        url = reverse('handbook:answer_question', kwargs={'company': self.company.company_slug})
+        return self.client.post(url, {'question': 'How many PTO days do I get?'})
+
+    def test_server_timing_header_lists_every_stage(self):
+        from handbook_app.services.metrics import server_timing_header
+
+        self.assertEqual(server_timing_header({'question.embed': 0.0123, 'total': 1.5}), 'question.embed;dur=12.3, total;dur=1500.0')
+
+        response = self.ask()
+        self.assertEqual(response.status_code, 200)
+        stages = dict(part.split(';dur=') for part in response['Server-Timing'].split(', '))
+        for stage in ('question.embed', 'question.vector_query', 'question.prompt', 'question.llm', 'total'):
+            self.assertGreaterEqual(float(stages[stage]), 0.0)
+
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.ask()
+        self.ask()
+        response = self.client.get(reverse('handbook:metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE handbook_stage_seconds summary', lines)
+        self.assertIn('handbook_request_seconds_count{view="answer_question"} 2', lines)
+        self.assertIn('handbook_stage_errors_total{stage="question.llm"} 0', lines)
+        self.assertTrue(any(line.startswith('handbook_stage_seconds{stage="question.llm",quantile="0.95"} ') for line in lines))
+        self.assertIn('# TYPE handbook_answer_cache_hits gauge', lines)
+        # Every sample line is "name{labels} value"
+        for line in lines:
+            if not line.startswith('#'):
+                float(line.rsplit(' ', 1)[1])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_is_required_when_set(self):
+        url = reverse('handbook:metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+@override_settings(VECTOR_BACKEND='local', EMBEDDING_CACHE_ENABLED=False, PDF_EXTRACT_WORKERS=1)
+class BulkIngestResumeTests(TransactionTestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        media_root = override_settings(MEDIA_ROOT=str(self.tmp / 'media'))
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+
+        self.source = self.tmp / 'acme'
+        self.source.mkdir()
+        for name, pages in (('benefits', 3), ('conduct', 2), ('travel', 2)):
+            (self.source / f'{name}.pdf').write_bytes(build_synthetic_pdf(pages))
+        # Not a PDF inside --> fails to parse
+        (self.source / 'travel.pdf').write_bytes(b'not a pdf')
+        self.company = create_company()
+
+    def run_bulk(self) -> dict:
+        from handbook_app.services.bulk_ingestion import discover_pdfs, bulk_ingest
+        return bulk_ingest(self.company, discover_pdfs(str(self.source)), workers=1, concurrency=1, batch_size=10, log=lambda message: None)
+
+    def test_rerun_only_redoes_what_did_not_finish(self):
+        first = self.run_bulk()
+        self.assertEqual((first['succeeded'], first['failed'], first['skipped']), (2, 1, 0))
+        self.assertIn('travel', first['errors'])
+
+        # The broken upload gets fixed + an import that died after conduct's upserts, before its job was marked done
+        (self.source / 'travel.pdf').write_bytes(build_synthetic_pdf(2))
+        conduct = Handbook.objects.get(namespace='conduct')
+        conduct.ingestion_jobs.update(status=IngestionJob.RUNNING)
+        interrupted = conduct.ingestion_jobs.get()
+
+        second = self.run_bulk()
+        self.assertEqual((second['succeeded'], second['failed'], second['skipped']), (2, 0, 1))
+        # No new handbook rows, one new job per handbook that wasn't done
+        self.assertEqual(Handbook.objects.filter(company=self.company).count(), 3)
+        self.assertEqual(IngestionJob.objects.filter(handbook__namespace='benefits').count(), 1)
+        latest = {
+            name: IngestionJob.objects.filter(handbook__namespace=name).latest('created')
+            for name in ('conduct', 'travel')
+        }
+        self.assertEqual({name: job.status for name, job in latest.items()}, {'conduct': IngestionJob.SUCCEEDED, 'travel': IngestionJob.SUCCEEDED})
+        # conduct's chunks were all in our manifest already --> nothing embedded twice
+        self.assertEqual(latest['conduct'].chunks_embedded, 0)
+        self.assertEqual(latest['travel'].chunks_embedded, latest['travel'].chunks_total)
+        # The interrupted run's job is closed instead of staying RUNNING forever
+        interrupted.refresh_from_db()
+        self.assertEqual(interrupted.status, IngestionJob.FAILED)
+        self.assertIsNotNone(interrupted.finished)
+
+    def test_older_success_does_not_skip_a_handbook_with_a_newer_job(self):
+        self.run_bulk()
+        # benefits got a new PDF after its bulk import succeeded, that ingestion never finished
+        benefits = Handbook.objects.get(namespace='benefits')
+        replaced = IngestionJob.objects.create(handbook=benefits, status=IngestionJob.QUEUED)
+
+        second = self.run_bulk()
+        self.assertNotIn('benefits', second['errors'])
+        self.assertEqual(second['skipped'], 1)
+        replaced.refresh_from_db()
+        self.assertEqual(replaced.status, IngestionJob.FAILED)
+        self.assertEqual(benefits.ingestion_jobs.latest('created').status, IngestionJob.SUCCEEDED)
+
+
+class FailingUpserts:
+    # Our (fake) vector backend with its first `failures` upserts raising
+    def __init__(self, backend, failures: int):
+        self.backend = backend
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        if fail:
+            raise ConnectionError('Simulated upsert failure')
+        return self.backend.upsert(vectors, namespace)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+class JitteryEmbeddings(FakeEmbeddings):
+    # Every batch takes a random time --> later batches regularly finish before earlier ones
+    def __init__(self):
+        super().__init__(0, 0)
+        self.rng = random.Random(0)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            delay = self.rng.uniform(0, 0.02)
+        time.sleep(delay)
+        return super().embed_documents(texts)
+
+
+@override_settings(VECTOR_BACKEND='local', EMBEDDING_CACHE_ENABLED=False, INGEST_RETRY_DELAY=0, INGEST_MAX_RETRIES=2)
+class PipelinedIngestTests(TestCase):
+    def setUp(self):
+        from handbook_app.management.commands.benchmark_suite import fake_services
+        from handbook_app.services import pinecone_services
+
+        services = fake_services(0, 0, 0, 0)
+        services.__enter__()
+        self.addCleanup(services.__exit__, None, None, None)
+        pinecone_services._embeddings = JitteryEmbeddings()
+        self.backend = pinecone_services._backend
+
+        self.handbook = Handbook.objects.create(company=create_company(), namespace='Benefits', pdf_file='handbook_files/benefits.pdf')
+        self.chunks = [f'chunk {n} {handbook_text(40, seed=n)}' for n in range(95)]
+
+    def ingest(self, **kwargs):
+        from handbook_app.services.pinecone_services import ingest
+
+        progress = []
+        stats = ingest(
+            self.chunks, 'ns', batch_size=10, upsert_batch_size=4, embed_concurrency=4, upsert_concurrency=4,
+            handbook_id=self.handbook.id, on_progress=lambda stage, count: progress.append((stage, count)), **kwargs
+        )
+        return stats, progress
+
+    def manifest(self) -> list:
+        return list(self.handbook.chunks.order_by('id').values_list('chunk_index', 'text_hash'))
+
+    def test_batches_land_in_pdf_order_despite_jitter(self):
+        from handbook_app.services import pinecone_services
+        from handbook_app.services.pinecone_services import list_ids
+
+        stats, progress = self.ingest()
+        self.assertEqual((stats['chunks'], stats['upserted']), (95, 95))
+        self.assertEqual(set(list_ids('ns')), stats['ids'])
+        # Manifest rows were written oldest batch first, one row per chunk in PDF order
+        manifest = self.manifest()
+        self.assertEqual([index for index, _ in manifest], list(range(95)))
+        self.assertEqual([text_hash for _, text_hash in manifest], [hashlib.sha256(chunk.encode()).hexdigest() for chunk in self.chunks])
+        self.assertEqual(sum(count for stage, count in progress if stage == 'upsert'), 95)
+
+        # Same chunks again --> every id is already stored, nothing embedded or upserted
+        pinecone_services._embeddings = Mock(wraps=pinecone_services._embeddings)
+        stats, _ = self.ingest(existing_ids=stats['ids'])
+        self.assertEqual(stats['upserted'], 0)
+        pinecone_services._embeddings.embed_documents.assert_not_called()
+
+    def test_failed_upserts_are_retried_per_batch(self):
+        from handbook_app.services import pinecone_services
+        from handbook_app.services.pinecone_services import list_ids
+
+        pinecone_services._backend = FailingUpserts(self.backend, failures=2)
+        # Retries go to our logger (Celery's worker log), not stdout
+        with self.assertLogs('handbook_app.services.pinecone_services', 'WARNING') as logs:
+            stats, _ = self.ingest()
+        self.assertEqual(len([line for line in logs.output if 'Upsert batch failed' in line]), 2)
+        self.assertEqual(stats['upserted'], 95)
+        self.assertEqual(len(list(list_ids('ns'))), 95)
+        # 9 embed batches of 10 --> 3 upserts each, the last 5 chunks --> 2, plus our 2 failed attempts
+        self.assertEqual(pinecone_services._backend.calls, 9 * 3 + 2 + 2)
+        self.assertEqual(len(self.manifest()), 95)
+
+    @override_settings(EMBEDDING_CACHE_ENABLED=True)
+    def test_cache_hit_ratio_counts_only_the_chunks_looked_up(self):
+        stats, _ = self.ingest()
+        self.assertEqual((stats['cache_lookups'], stats['cache_hits'], stats['hit_ratio']), (95, 0, 0.0))
+        # Another namespace already holding the first 50 chunks: those are skipped, the other 45 come out of our cache
+        from collections import Counter
+        from handbook_app.services.pinecone_services import chunk_ids, ingest
+
+        existing = set(chunk_ids(self.chunks[:50], Counter(), ''))
+        with self.assertLogs('handbook_app.services.pinecone_services', 'INFO') as logs:
+            stats = ingest(self.chunks, 'ns-2', batch_size=10, existing_ids=existing)
+        self.assertEqual((stats['upserted'], stats['cache_lookups'], stats['cache_hits'], stats['hit_ratio']), (45, 45, 45, 1.0))
+        self.assertIn('50 unchanged (embedding cache hit ratio: 100% of 45 lookups)', logs.output[-1])
+
+    def test_out_of_retries_fails_without_recording_unstored_chunks(self):
+        from handbook_app.services import pinecone_services
+
+        pinecone_services._backend = FailingUpserts(self.backend, failures=10 ** 6)
+        with self.assertRaises(ConnectionError), self.assertLogs('handbook_app.services.pinecone_services', 'WARNING'):
+            self.ingest()
+        # Our manifest never lists a vector that isn't stored
+        self.assertEqual(self.manifest(), [])
+
+
+class IterPageChunksTests(SimpleTestCase):
+    VOCABULARY = 'a an the employee leave policy manager payroll benefit remote office holiday overtime review travel expense training'.split()
+
+    def random_pages(self, seed: int) -> list:
+        # Paragraph heavy pages (the case where streaming + full text splitting can disagree)
+        rng = random.Random(seed)
+
+        def paragraph():
+            return ' '.join(rng.choice(self.VOCABULARY) for _ in range(rng.randint(5, 150)))
+        return [
+            '\n\n'.join(paragraph() for _ in range(rng.randint(1, 8))) + rng.choice(['\n', '\n\n', ' ', ''])
+            for _ in range(rng.randint(3, 12))
+        ]
+
+    def test_streamed_chunks_are_near_identical_to_full_text_splitting(self):
+        from handbook_app.services.pdf_services import iter_page_chunks
+        from handbook_app.services.pinecone_services import get_splitter
+
+        splitter = get_splitter()
+        same = total = 0
+        for seed in range(30):
+            pages = self.random_pages(seed)
+            text = ''.join(pages)
+            page_starts = [sum(len(page) for page in pages[:n]) for n in range(len(pages) + 1)]
+            chunks = list(iter_page_chunks(iter(pages), splitter))
+
+            covered = [False] * len(text)
+            position = 0
+            for chunk in chunks:
+                self.assertLessEqual(len(chunk.text), splitter._chunk_size)
+                # In order, straight out of the text, inside the pages it says it came from
+                position = text.find(chunk.text, position)
+                self.assertNotEqual(position, -1)
+                self.assertLessEqual(page_starts[chunk.page_start - 1], position)
+                self.assertLessEqual(position + len(chunk.text), page_starts[chunk.page_end])
+                covered[position:position + len(chunk.text)] = [True] * len(chunk.text)
+                position += 1
+            # Nothing but whitespace is left out
+            self.assertEqual([i for i, c in enumerate(covered) if not c and not text[i].isspace()], [])
+
+            expected = splitter.split_text(text)
+            same += len(set(chunk.text for chunk in chunks) & set(expected))
+            total += len(expected)
+        self.assertGreaterEqual(same / total, 0.9)
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_bucket_rejects_a_rate_that_never_refills(self):
+        from handbook_app.services.rate_limit import TokenBucket
+
+        for rate in (0, -1):
+            with self.assertRaises(ValueError):
+                TokenBucket(rate=rate)
+
+    def test_generate_faq_rejects_a_zero_rate(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_faq', '--rate', '0')
+        with override_settings(FAQ_LLM_RATE=0), patch('handbook_app.management.commands.generate_faq.handbooks_without_faq', return_value=[]):
+            with self.assertRaises(CommandError):
+                call_command('generate_faq')
@@ -6,7 +6,12 @@ app_name='handbook'
 urlpatterns = [
     # Handbook API
     path('handbooks/', views.ListCreateHandbook.as_view(), name='list_create_handbook'),
+    path('handbooks/bulk/', views.BulkIngestHandbooks.as_view(), name='bulk_ingest_handbooks'),
     path('handbooks/<int:id>/', views.RetrieveUpdateDestroyHandbook.as_view(), name='retrieve_update_destroy_handbook'),
+    path('handbooks/<int:id>/ingestion/', views.HandbookIngestionStatus.as_view(), name='handbook_ingestion'),
     # Question API
-    path('questions/<slug:company>/', views.AskQuestion.as_view(), name='answer_question')
+    path('questions/<slug:company>/', views.AskQuestion.as_view(), name='answer_question'),
+    path('questions/<slug:company>/async/', views.AskQuestionAsync.as_view(), name='answer_question_async'),
+    # Prometheus scrape endpoint
+    path('metrics/', views.Metrics.as_view(), name='metrics')
 ]
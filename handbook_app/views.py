@@ -1,16 +1,31 @@
+import json
 from django.shortcuts import render
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response 
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
 from rest_framework.reverse import reverse
-from .models import Handbook
-from .serializers import GETHandbookSerializer, POSTHandbookSerializer, ListHandbookSerializer
+from rest_framework.settings import api_settings
+from django.http import StreamingHttpResponse, JsonResponse, HttpResponse
+from django.views import View
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.conf import settings
+from .models import Handbook, IngestionJob
+from .serializers import GETHandbookSerializer, POSTHandbookSerializer, ListHandbookSerializer, IngestionJobSerializer
 from .permissions import IsOwnerOrAdminHandbook
-import fitz
+from .renderers import EventStreamRenderer
 from companies.models import CompanyUser
 
 
+def invalidate_answers(company_id):
+    # Local import for lazy init (numpy + our cache only load when we need them)
+    from handbook_app.services.answer_cache import invalidate
+    invalidate(company_id)
+
+
 # Links to all the necessaary API 
 class HomePage(APIView):
     def get(self, request, *args, **kwargs):
@@ -50,34 +65,29 @@ class ListCreateHandbook(ListSerializerMixin, generics.ListCreateAPIView):
         return Response(serializer.data)
     
     # When we create a handbook we want to upload that file to Pinecone
+    #
+    # Parsing + Embedding a large PDF takes too long for one request so we hand it off to Celery and return 202 right away
     def create(self, request): 
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            # Since the file is okay and our service accepted it:
-            # Be sure to change file --> pdf_file because pdf_file is the field / key in the POST body 
-            file = request.FILES['pdf_file']
-            pdf = fitz.open(stream=file.read(), filetype='pdf')
-
-            # Building text 
-            text = ""
-            for page in pdf:
-                text += page.get_text()
-
             # Local Import for a quick Lazy Initialization 
             #
             # Be aware of top-level imports... we must use an absolute 
-            from handbook_app.services.pinecone_services import ingest 
-
-            try:
-                # Returned Vectorstore
-                new_handbook = serializer.save()
-                vs = ingest(text, new_handbook.get_pc_namespace())
-                
-            except Exception as e:
-                
-                return Response({'msg': "Error with Pinecone Ingestion. File was not uploaded...", 'err': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            from handbook_app.tasks import ingest_handbook
+
+            # Saving first so our worker could read the PDF from storage
+            new_handbook = serializer.save()
+            # A new handbook changes what our company's questions should be answered with
+            invalidate_answers(new_handbook.company_id)
+            job = IngestionJob.objects.create(handbook=new_handbook)
+            # Only queue once our rows are committed or else the worker might not find the job
+            transaction.on_commit(lambda: ingest_handbook.delay(job.id))
+
+            return Response({
+                **serializer.data,
+                'ingestion_job': job.id,
+                'ingestion_url': reverse('handbook:handbook_ingestion', kwargs={'id': new_handbook.id}, request=request)
+            }, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 class RetrieveUpdateDestroyHandbook(SpecificSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
@@ -99,53 +109,48 @@ class RetrieveUpdateDestroyHandbook(SpecificSerializerMixin, generics.RetrieveUp
         handbook = self.get_object()
         serializer = self.get_serializer(handbook, data=request.data, partial=True)
         if serializer.is_valid():
-            from handbook_app.services.pinecone_services import update_vector, update_namespace
-            # PDF_file + Namespace we Delete the current vector and create new ones 
+            # Our vectors live in handbook.vector_namespace which never changes 
             #
-            # Just Namespace, copy over the vectors and upsert
-            if 'pdf_file' in request.FILES:
-                # User is sending new pdf file to replace the current 
-                file = request.FILES['pdf_file']
-                pdf = fitz.open(stream=file.read(), filetype='pdf')
-                text = ''
-                for page in pdf:
-                    text += page.get_text()
-
-                # Now that we have the new text from the new pdf:
-                #
-                # This will grab our namespace and DELETE the current vector while creating new vectors with that namespace
-                # Runs through the classic: Splitter, Embed, Ingest 
-                #
-                # Double check if the namespace from our request is the same 
-                new_namespace = serializer.validated_data.get('namespace', None)
-                if new_namespace and new_namespace != handbook.namespace:
-                    new_namespace = Handbook.generate_pc_namespace(
-                        handbook.company.company_name, 
-                        serializer.validated_data.get('namespace')
-                    )
-                elif new_namespace == handbook.namespace:
-                    # Edge Case: User submitted a form with the SAME namespace 
-                    new_namespace = None
-                update_vector(text, handbook.get_pc_namespace(), new_namespace)
-            elif 'namespace' in request.data:
-                new_namespace = request.data.get('namespace')
-                format_new_namespace = Handbook.generate_pc_namespace(handbook.company.company_name, new_namespace)
-                update_namespace(handbook.get_pc_namespace(), format_new_namespace)
-                print('Updating namespace ONLY')
-            
-            # Be sure to keep serializer.save() AFTER all the updates or else it consumes the file 
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # PDF_file --> same as create: save it, then Celery diffs the new chunks against what's stored (202 + job)
+            # Just Namespace --> it's only a label, nothing to do on Pinecone
+            replacing_pdf = 'pdf_file' in request.FILES
+            if not replacing_pdf:
+                # Renaming is just a DB update: our vectors are tied to vector_namespace / handbook_id, not the name 
+                # update_fields keeps `updated` + `version` where they were --> cached answers and FAQ stay valid 
+                # and our FAQ watermark doesn't pick the handbook up again for a new label
+                for field, value in serializer.validated_data.items():
+                    setattr(handbook, field, value)
+                handbook.save(update_fields=list(serializer.validated_data))
+                return Response(serializer.data, status=status.HTTP_200_OK)
+
+            # New version so any cached answer built from the old file is treated as stale
+            handbook = serializer.save(version=handbook.version + 1)
+            invalidate_answers(handbook.company_id)
+
+            from handbook_app.tasks import ingest_handbook
+            job = IngestionJob.objects.create(handbook=handbook)
+            # Only queue once our rows are committed or else the worker might not find the job
+            transaction.on_commit(lambda: ingest_handbook.delay(job.id))
+            return Response({
+                **serializer.data,
+                'ingestion_job': job.id,
+                'ingestion_url': reverse('handbook:handbook_ingestion', kwargs={'id': handbook.id}, request=request)
+            }, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self,request, *args, **kwargs):
         try:
             handbook = self.get_object() 
+            # Grab these BEFORE delete() because our prefix depends on the id (which becomes None)
+            namespace, prefix = handbook.get_pc_namespace(), handbook.get_vector_prefix()
             handbook.delete()
+            invalidate_answers(handbook.company_id)
 
             # When we Remove a handbook in our database we also want to remove it on Pinecone
-            from handbook_app.services.pinecone_services import delete_vector
-            delete_vector(handbook.get_pc_namespace())
+            #
+            # In a shared company namespace we only remove THIS handbook's vectors
+            from handbook_app.services.pinecone_services import delete_vectors
+            delete_vectors(namespace, prefix)
             return Response({
                 "msg": "Handbook was removed successfully."
             }, status=status.HTTP_200_OK)
@@ -154,6 +159,94 @@ class RetrieveUpdateDestroyHandbook(SpecificSerializerMixin, generics.RetrieveUp
                 "msg": "Error removing handbook from server and/or Pinecone",
                 "err": str(e)
             })
+
+class HandbookIngestionStatus(generics.RetrieveAPIView):
+    """
+        Reports the latest ingestion job for a handbook 
+            - Status: queued, running, succeeded, failed 
+            - Stage + per-stage progress (pages parsed, chunks embedded, chunks upserted)
+    """
+    queryset = Handbook.objects.all()
+    lookup_field = 'id'
+    permission_classes = [IsOwnerOrAdminHandbook]
+
+    def get(self, request, *args, **kwargs):
+        handbook = self.get_object()
+        job = handbook.ingestion_jobs.order_by('-created').first()
+        if not job:
+            return Response({
+                'msg': "No ingestion job found for this handbook."
+            }, status=status.HTTP_404_NOT_FOUND)
+        serializer = IngestionJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class BulkIngestHandbooks(APIView):
+    """
+        Admin only: onboard a company with a whole folder of handbook PDFs 
+            - POST {"company": "<company_slug>", "source": "<folder or manifest inside BULK_INGEST_ROOT>"} 
+              --> queues ONE Celery task for all of them (see services/bulk_ingestion.py) 
+            - Optional "concurrency" + "batch_size" override our BULK_INGEST_* settings 
+            - GET ?task=<id> --> state of that task (+ its summary once it's done) 
+
+        Every handbook also gets its own IngestionJob so handbook_ingestion reports per handbook progress. 
+        POSTing the same source again resumes an interrupted import
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def resolve_source(self, source: str):
+        # Only folders inside BULK_INGEST_ROOT (no ../ or absolute paths out of it)
+        import os
+        root = os.path.realpath(settings.BULK_INGEST_ROOT)
+        path = os.path.realpath(os.path.join(root, source))
+        if os.path.commonpath([root, path]) != root or not os.path.exists(path):
+            return None
+        return path
+
+    def get(self, request, *args, **kwargs):
+        task_id = request.query_params.get('task')
+        if not task_id:
+            return Response({
+                'details': "Send POST request with the keys: company, source (GET ?task=<id> for its status)"
+            })
+        from celery.result import AsyncResult
+        result = AsyncResult(task_id)
+        return Response({
+            'task': task_id,
+            'state': result.state,
+            'result': result.result if result.successful() else None,
+            'error': str(result.result) if result.failed() else None
+        })
+
+    def post(self, request, *args, **kwargs):
+        from handbook_app.tasks import bulk_ingest_handbooks
+
+        try:
+            company = CompanyUser.objects.get(company_slug=request.data.get('company'))
+        except CompanyUser.DoesNotExist:
+            return Response({
+                'msg': "Company does not exist"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        source = self.resolve_source(request.data.get('source') or '')
+        if source is None:
+            return Response({
+                'msg': "source must be a folder or manifest inside BULK_INGEST_ROOT"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            concurrency = int(request.data['concurrency']) if request.data.get('concurrency') else None
+            batch_size = int(request.data['batch_size']) if request.data.get('batch_size') else None
+        except (TypeError, ValueError):
+            return Response({
+                'msg': "concurrency and batch_size must be integers"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        task = bulk_ingest_handbooks.delay(company.id, source, concurrency, batch_size)
+        return Response({
+            'task': task.id,
+            'status_url': f"{reverse('handbook:bulk_ingest_handbooks', request=request)}?task={task.id}"
+        }, status=status.HTTP_202_ACCEPTED)
+
 # Questioning 
 class AskQuestion(APIView):
     """
@@ -161,8 +254,14 @@ class AskQuestion(APIView):
             Updated: Company Specific --> Asking questions based on the Companies PDF 
 
         The idea is to ask a specific company questions based on their PDF 
+
+        Streaming: `?stream=1` or `Accept: text/event-stream` streams the answer as Server-Sent Events 
     """
     permission_classes = [IsOwnerOrAdminHandbook]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+
+    def wants_stream(self, request):
+        return request.query_params.get('stream') in ('1', 'true') or request.accepted_renderer.format == 'sse'
 
     def get(self, request, *args, **kwargs):
         # Endpoint to let our API users know what to add in their content body
@@ -171,7 +270,9 @@ class AskQuestion(APIView):
         })
 
     def post(self, request, *args, **kwargs):
-        from handbook_app.services.pinecone_services import question
+        from handbook_app.services.pinecone_services import question, prepare_question
+        from handbook_app.services.answer_cache import build_scope
+        from handbook_app.services.streaming_services import stream_answer
         # We need to use request.data.get not request.POST because it's only to handle forms 
         q = request.data.get('question')
         try:
@@ -185,8 +286,45 @@ class AskQuestion(APIView):
             however, for our application we want one company to have multiple BASE PDF. Our CRON job later will delete the duplicates or old variants. For now,
             let's allow mutliple submissions/files for one company.
             """
-            company_handbooks_ns = [handbook.get_pc_namespace() for handbook in company.handbooks.all()]
-            llm_answer = question(q, company_handbooks_ns)
+            # Optional subset of handbooks to ask: {"question": "...", "handbooks": [1, 2]}
+            handbook_ids = request.data.getlist('handbooks') if hasattr(request.data, 'getlist') else request.data.get('handbooks')
+            company_handbooks_ns, metadata_filter = Handbook.get_query_targets(company, handbook_ids)
+            cache_scope = build_scope(company, handbook_ids)
+
+            if self.wants_stream(request):
+                # Retrieval happens here, the LLM tokens are streamed from an async generator afterwards 
+                # (only streams under ASGI --> uvicorn handbook.asgi:application, WSGI/runserver buffers the whole response)
+                question_embedded, matches, cached_answer = prepare_question(
+                    q, company_handbooks_ns, metadata_filter=metadata_filter, cache_scope=cache_scope,
+                    company_id=company.id, handbook_ids=handbook_ids
+                )
+                response = StreamingHttpResponse(
+                    stream_answer(q, question_embedded, matches, cached_answer, cache_scope),
+                    content_type='text/event-stream'
+                )
+                # Don't let proxies buffer our stream
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
+            def ask():
+                return question(
+                    q, 
+                    company_handbooks_ns, 
+                    metadata_filter=metadata_filter, 
+                    # Cached answers are only reused for this company + these exact handbook versions
+                    cache_scope=cache_scope,
+                    # Questions matching one of our generated FAQ get its precomputed answer (no retrieval, no LLM)
+                    company_id=company.id,
+                    handbook_ids=handbook_ids
+                )
+
+            if settings.QUESTION_COALESCE_ENABLED:
+                # The same question asked by many employees at once is answered ONCE and shared
+                from handbook_app.services.single_flight import question_flight, flight_key
+                llm_answer = question_flight.do(flight_key(cache_scope, q), ask)
+            else:
+                llm_answer = ask()
             return Response({
                 'answer': llm_answer
             })
@@ -194,4 +332,78 @@ class AskQuestion(APIView):
             return Response({
                 'msg': "LLM Model failed to answer question",
                 'err': str(e)
-            })
\ No newline at end of file
+            })
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AskQuestionAsync(View):
+    """
+        Async twin of AskQuestion for ASGI (handbook/asgi.py) 
+            - Embedding, vector queries and the LLM call are all awaited on the event loop 
+            - Pooled clients (services/clients.py) so concurrent questions share connections 
+
+        DRF's APIView can't be async so this is a plain Django View taking the same body: {"question": "...", "handbooks": [1, 2]} 
+        Serve it with an ASGI server (uvicorn handbook.asgi:application), under runserver/WSGI every request gets its own event loop
+
+        Access: open on purpose, same as AskQuestion (its IsOwnerOrAdminHandbook only checks objects and a question has none) 
+        so employees ask through the company's URL without an account. csrf_exempt doesn't widen that: we read no session 
+        or cookie, there's nothing a forged cross-site POST could act as. Lock AskQuestion down --> add the same check here
+    """
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            'details': "Send POST request with the key: question"
+        })
+
+    async def post(self, request, *args, **kwargs):
+        from handbook_app.services.async_services import aquestion
+        from handbook_app.services.answer_cache import build_scope
+        try:
+            if request.content_type == 'application/json':
+                body = json.loads(request.body or b'{}')
+                handbook_ids = body.get('handbooks')
+            else:
+                body = request.POST
+                handbook_ids = body.getlist('handbooks')
+            q = body.get('question')
+
+            company = await CompanyUser.objects.aget(company_slug=kwargs.get('company'))
+            # Our ORM helpers are sync so they run in a thread
+            company_handbooks_ns, metadata_filter = await sync_to_async(Handbook.get_query_targets)(company, handbook_ids)
+            cache_scope = await sync_to_async(build_scope)(company, handbook_ids)
+
+            async def ask():
+                return await aquestion(
+                    q, company_handbooks_ns, metadata_filter=metadata_filter, cache_scope=cache_scope,
+                    company_id=company.id, handbook_ids=handbook_ids
+                )
+
+            if settings.QUESTION_COALESCE_ENABLED:
+                # Identical questions in flight on this event loop share one answer
+                from handbook_app.services.single_flight import question_flight, flight_key
+                llm_answer = await question_flight.ado(flight_key(cache_scope, q), ask)
+            else:
+                llm_answer = await ask()
+            return JsonResponse({
+                'answer': llm_answer
+            })
+        except Exception as e:
+            return JsonResponse({
+                'msg': "LLM Model failed to answer question",
+                'err': str(e)
+            })
+
+
+class Metrics(View):
+    """
+        Prometheus scrape endpoint (text format) 
+            - Stage + request latencies (p50/p95/p99, sum, count, errors) from services/metrics.py 
+            - Hit/miss counters of our answer cache, query embedding cache, FAQ index + question coalescing 
+
+        Per process, so scrape every worker (or run one worker per scrape target)
+    """
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_ENABLED:
+            return HttpResponse(status=404)
+        if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+            return HttpResponse(status=401)
+        from handbook_app.services.metrics import render_prometheus, collect_gauges
+        return HttpResponse(render_prometheus(collect_gauges()), content_type='text/plain; version=0.0.4')